@@ -1,18 +1,29 @@
+import os
 from abc import abstractmethod
 
 import pandas as pd
-import scipy.sparse
-from anndata import AnnData
 from anndata._core.sparse_dataset import sparse_dataset
 
 from cirrocumulus.abstract_dataset import AbstractDataset
 from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY, ADATA_MODULE_UNS_KEY
+from cirrocumulus.csc_reader import get_indptr, is_csc_group, read_csc_columns, read_ranges
+from cirrocumulus.envir import CIRRO_GROUP_POOL_SIZE
+from cirrocumulus.feature_cache import get_cache_key, get_columns
+from cirrocumulus.lite_adata import LiteAnnData
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.obs_cache import get_obs_columns
+from cirrocumulus.obsm_mmap import load_obsm_npy
+from cirrocumulus.var_index import get_var_positions
 
 
 # string_dtype = h5py.check_string_dtype(dataset.dtype)
 # if (string_dtype is not None) and (string_dtype.encoding == "utf-8"):
 #     dataset = dataset.asstr()
 
+# process-wide pool of open root groups, path -> group. Groups removed from the pool are not closed
+# as other requests may still be reading them, they are closed when the last reference is dropped.
+group_pool = LRUCache(max_size=int(os.environ.get(CIRRO_GROUP_POOL_SIZE, "32")))
+
 
 class AbstractBackedDataset(AbstractDataset):
     def __init__(self):
@@ -30,8 +41,25 @@ class AbstractBackedDataset(AbstractDataset):
     def slice_dense_array(self, X, indices):
         pass
 
+    def close_group(self, group):
+        """Closes a group returned by open_group that is not used elsewhere."""
+        pass
+
+    def get_group(self, filesystem, path):
+        """Returns the root group for path, reusing an open group from the pool when possible."""
+        pooled_group = group_pool.get(path)
+        if pooled_group is None:
+            group = self.open_group(filesystem, path)
+            pooled_group = group_pool.setdefault(path, group)
+            if pooled_group is not group:  # opened concurrently by another thread, never shared
+                self.close_group(group)
+        return pooled_group
+
+    def invalidate(self, path):
+        group_pool.pop(path)
+
     def get_result(self, filesystem, path, dataset, result_id):
-        g = self.open_group(filesystem, path)
+        g = self.get_group(filesystem, path)
         uns = g["uns"]
         if result_id in uns:
             return str(uns[result_id][...])
@@ -39,7 +67,7 @@ class AbstractBackedDataset(AbstractDataset):
 
     def get_dataset_info(self, filesystem, path):
         d = {}
-        root = self.open_group(filesystem, path)
+        root = self.get_group(filesystem, path)
         var_group = root["var"]
         var_group_index_field = var_group.attrs["_index"]
         var_ids = var_group[var_group_index_field][...]
@@ -47,7 +75,7 @@ class AbstractBackedDataset(AbstractDataset):
             var_ids = var_ids.astype(str)
         d["var"] = pd.Index(var_ids)
         X = root["X"]
-        d["shape"] = X.attrs["shape"] if self.is_group(X) else X.shape
+        d["shape"] = self.get_X_shape(X)
         if "layers" in root:
             d["layers"] = root["layers"].keys()
         if "uns" in root:
@@ -63,24 +91,72 @@ class AbstractBackedDataset(AbstractDataset):
                 d["timepoint_field"] = uns_group["timepoint_field"]
         return d
 
-    def get_X(self, var_ids, keys, node):
+    def get_X(self, var_ids, keys, node, cache_key=None):
         if len(keys) == 1 and isinstance(
             keys[0], slice
         ):  # special case if slice specified for performance
             get_item = keys[0]
             keys = var_ids[get_item]
+            X = self.read_X(node, get_item, cache_key)
+        elif cache_key is not None:
+            X = get_columns(
+                cache_key,
+                keys,
+                lambda missing: self.read_X(node, get_var_positions(var_ids, missing), cache_key),
+                self.get_X_shape(node)[0],
+            )
         else:
-            get_item = var_ids.get_indexer_for(keys)
-
-        if self.is_group(node):
-            ds = sparse_dataset(node)  # sparse
-            X = ds[:, get_item]
-        else:  # dense
-            X = self.slice_dense_array(node, get_item)
+            X = self.read_X(node, get_var_positions(var_ids, keys), cache_key)
         var = pd.DataFrame(index=keys)
         return X, var
 
-    def read_dataset(self, filesystem, path, keys=None, dataset=None):
+    def get_X_shape(self, node):
+        return tuple(node.attrs["shape"]) if self.is_group(node) else node.shape
+
+    def read_ranges(self, arrays, ranges):
+        return read_ranges(arrays, ranges)
+
+    def read_X(self, node, get_item, cache_key=None):
+        if self.is_group(node):  # sparse
+            if is_csc_group(node):
+                return read_csc_columns(
+                    node, get_item, get_indptr(node, cache_key), self.read_ranges
+                )
+            return sparse_dataset(node)[:, get_item]
+        return self.slice_dense_array(node, get_item)  # dense
+
+    def read_obs(self, group, key):
+        if key == "index":
+            index_field = group.attrs["_index"]
+            values = group[index_field][...]
+            if pd.api.types.is_object_dtype(values):
+                values = values.astype(str)
+            return values
+        dataset = group[key]
+        values = dataset[...]
+        if "categories" in dataset.attrs:
+            categories = dataset.attrs["categories"]
+            categories_dset = group[categories]
+            categories = categories_dset[...]
+            if pd.api.types.is_object_dtype(categories):
+                categories = categories.astype(str)
+            ordered = categories_dset.attrs.get("ordered", False)
+            values = pd.Categorical.from_codes(values, categories, ordered=ordered)
+        return values
+
+    def read_stats_table(self, filesystem, path, name):
+        root = self.get_group(filesystem, path)
+        key = "uns/cirro-stats/" + name
+        if key not in root:
+            return None
+        group = root[key]
+        return {column: group[column][...] for column in group.keys()}
+
+    def read_obsm(self, filesystem, path, group, key, dataset_info):
+        m = load_obsm_npy(filesystem, path, key, dataset_info)
+        return m if m is not None else group[key][...]
+
+    def read_dataset(self, filesystem, path, keys=None, dataset=None, dataset_info=None):
         keys = keys.copy()
         X_keys = keys.pop("X", [])
         obs_keys = keys.pop("obs", [])
@@ -92,55 +168,45 @@ class AbstractBackedDataset(AbstractDataset):
         var = None
         obsm = {}
         adata_modules = None
-        dataset_info = self.get_dataset_info(filesystem, path)
-        root = self.open_group(filesystem, path)
+        if dataset_info is None:
+            dataset_info = self.get_dataset_info(filesystem, path)
+        root = self.get_group(filesystem, path)
         layers = {}
         for layer_key in keys.keys():
             X_layer, var_layer = self.get_X(
-                dataset_info["var"], keys[layer_key], root["layers"][layer_key]
+                dataset_info["var"],
+                keys[layer_key],
+                root["layers"][layer_key],
+                get_cache_key(path, dataset_info, "layers/" + layer_key),
             )
-            adata_layer = AnnData(X=X_layer, var=var_layer)
-            layers[layer_key] = adata_layer
+            layers[layer_key] = LiteAnnData(X=X_layer, var=var_layer)
         if len(X_keys) > 0:
-            X, var = self.get_X(dataset_info["var"], X_keys, root["X"])
+            X, var = self.get_X(
+                dataset_info["var"], X_keys, root["X"], get_cache_key(path, dataset_info, "X")
+            )
         if len(obs_keys) > 0:
-            obs = pd.DataFrame(index=pd.RangeIndex(dataset_info["shape"][0]).astype(str))
-            group = root["obs"]
-            for key in obs_keys:
-                if key == "index":
-                    index_field = group.attrs["_index"]
-                    values = group[index_field][...]
-                    if pd.api.types.is_object_dtype(values):
-                        values = values.astype(str)
-                else:
-                    dataset = group[key]
-                    values = dataset[...]
-                    if "categories" in dataset.attrs:
-                        categories = dataset.attrs["categories"]
-                        categories_dset = group[categories]
-                        categories = categories_dset[...]
-                        if pd.api.types.is_object_dtype(categories):
-                            categories = categories.astype(str)
-                        ordered = categories_dset.attrs.get("ordered", False)
-                        values = pd.Categorical.from_codes(values, categories, ordered=ordered)
-                obs[key] = values
+            key_to_values = get_obs_columns(
+                path,
+                dataset_info,
+                obs_keys,
+                lambda keys: {key: self.read_obs(root["obs"], key) for key in keys},
+            )
+            obs = {key: key_to_values[key] for key in obs_keys}
         if len(module_keys) > 0:
             module_ids = dataset_info["module"]
             module_X_node = root["uns/module/X"]
-            module_X, module_var = self.get_X(module_ids, module_keys, module_X_node)
-            adata_modules = AnnData(X=module_X, var=module_var, obs=obs)  # obs is shared
+            module_X, module_var = self.get_X(
+                module_ids,
+                module_keys,
+                module_X_node,
+                get_cache_key(path, dataset_info, "uns/module/X"),
+            )
+            adata_modules = LiteAnnData(X=module_X, var=module_var)
         if len(basis_keys) > 0:
             group = root["obsm"]
             for key in basis_keys:
-                embedding_data = group[key][...]
-                obsm[key] = embedding_data
-                if X is None:
-                    X = scipy.sparse.coo_matrix(([], ([], [])), shape=(embedding_data.shape[0], 0))
-        if X is None and obs is None and len(obsm.keys()) == 0:
-            if dataset_info is None:
-                dataset_info = self.get_dataset_info(filesystem, path)
-            obs = pd.DataFrame(index=pd.RangeIndex(dataset_info["shape"][0]).astype(str))
-        adata = AnnData(X=X, obs=obs, var=var, obsm=obsm)
+                obsm[key] = self.read_obsm(filesystem, path, group, key, dataset_info)
+        adata = LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=dataset_info["shape"][0])
         if adata_modules is not None:
             adata.uns[ADATA_MODULE_UNS_KEY] = adata_modules
         adata.uns[ADATA_LAYERS_UNS_KEY] = layers
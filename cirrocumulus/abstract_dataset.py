@@ -5,6 +5,13 @@ from abc import ABC, abstractmethod
 import pandas as pd
 
 from cirrocumulus.api import get_file_path
+from cirrocumulus.precomputed_stats import (
+    get_binned_embedding,
+    get_grouped_stats,
+    get_stats_table,
+    get_summary,
+)
+from cirrocumulus.util import get_version
 
 
 class AbstractDataset(ABC):
@@ -12,16 +19,56 @@ class AbstractDataset(ABC):
         super().__init__()
 
     @abstractmethod
-    def read_dataset(self, filesystem, path, keys, dataset):
+    def read_dataset(self, filesystem, path, keys, dataset, dataset_info=None):
         pass
 
     @abstractmethod
     def get_suffixes(self):
         pass
 
+    def get_version(self, filesystem, path):
+        """Returns a token that changes when the dataset at path is modified."""
+        return get_version(filesystem, path)
+
+    def supports_row_subset(self):
+        """Whether read_dataset accepts rows, a sorted array of row positions to read."""
+        return False
+
+    def invalidate(self, path):
+        """Called when the dataset at path has been modified."""
+        pass
+
     def get_result(self, filesystem, path, dataset, result_id):
         return get_file_path(os.path.join("uns", result_id + ".json.gz"), path)
 
+    def read_stats_table(self, filesystem, path, name):
+        """Returns the precomputed statistics table name as a dict of arrays or None."""
+        return None
+
+    def read_precomputed_stats(self, filesystem, path, obs_keys, var_keys, dataset_info):
+        return get_summary(
+            lambda name: get_stats_table(self, filesystem, path, name, dataset_info),
+            dataset_info["var"],
+            obs_keys,
+            var_keys,
+        )
+
+    def read_precomputed_grouped_stats(self, filesystem, path, obs_keys, var_keys, dataset_info):
+        return get_grouped_stats(
+            lambda name: get_stats_table(self, filesystem, path, name, dataset_info),
+            dataset_info["var"],
+            var_keys,
+            obs_keys,
+        )
+
+    def read_precomputed_basis(self, filesystem, path, obs_keys, var_keys, basis, dataset_info):
+        return get_binned_embedding(
+            lambda name: get_stats_table(self, filesystem, path, name, dataset_info),
+            basis,
+            obs_keys,
+            var_keys,
+        )
+
     def get_dataset_info(self, filesystem, path):
         """Returns a dict with shape, var, modules."""
         s = self.get_schema(filesystem, path)
@@ -1,14 +1,18 @@
 import logging
 
+import numpy as np
 import pandas as pd
 import anndata
 import scipy.sparse
-from anndata import AnnData
 from pandas import CategoricalDtype
 
 from cirrocumulus.abstract_dataset import AbstractDataset
 from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY, ADATA_MODULE_UNS_KEY, dataset_schema
+from cirrocumulus.feature_cache import get_cache_key, get_columns
 from cirrocumulus.io_util import add_spatial, read_star_fusion_file
+from cirrocumulus.lite_adata import LiteAnnData
+from cirrocumulus.sparse_util import csc_gather
+from cirrocumulus.var_index import get_var_positions
 
 
 logger = logging.getLogger("cirro")
@@ -163,11 +167,33 @@ class AnndataDataset(AbstractDataset):
         adata = self.path_to_data.get(path)
         if adata is None:
             adata = self.read_adata(filesystem, path)
+            # store sparse matrices read here as CSC so that columns can be gathered directly. Data
+            # passed to add_data belongs to the caller and is not modified.
             if scipy.sparse.isspmatrix_csr(adata.X) and adata.X.shape[1] > 1:
                 adata.X = adata.X.tocsc()
+            for layer in adata.layers.keys():
+                X = adata.layers[layer]
+                if scipy.sparse.isspmatrix_csr(X) and X.shape[1] > 1:
+                    adata.layers[layer] = X.tocsc()
+            adata_modules = adata.uns.get(ADATA_MODULE_UNS_KEY)
+            if (
+                adata_modules is not None
+                and scipy.sparse.isspmatrix_csr(adata_modules.X)
+                and adata_modules.X.shape[1] > 1
+            ):
+                adata_modules.X = adata_modules.X.tocsc()
             self.add_data(path, adata)
         return adata
 
+    def get_dataset_info(self, filesystem, path):
+        adata = self.get_data(filesystem, path)
+        d = dict(var=adata.var.index, shape=adata.shape, layers=list(adata.layers.keys()))
+        if ADATA_MODULE_UNS_KEY in adata.uns:
+            d["module"] = adata.uns[ADATA_MODULE_UNS_KEY].var.index
+        if "timepoint_field" in adata.uns:
+            d["timepoint_field"] = adata.uns["timepoint_field"]
+        return d
+
     def get_schema(self, filesystem, path):
         adata = self.get_data(filesystem, path)
         schema = dataset_schema(adata)
@@ -182,9 +208,41 @@ class AnndataDataset(AbstractDataset):
         return schema
 
     @staticmethod
-    def get_X(adata, keys, layer=None):
+    def gather_X(adata, keys, layer=None):
+        """Gathers columns from an in-memory matrix without creating an AnnData view.
+
+        :return: Tuple of X and var or None if the matrix is not a CSC matrix or dense array
+        """
+        X = adata.X if layer is None else adata.layers[layer]
+        if not (scipy.sparse.isspmatrix_csc(X) or isinstance(X, np.ndarray)):
+            return None
+        var_index = adata.var.index
+        if len(keys) == 1 and isinstance(keys[0], slice):  # special case if slice specified
+            columns = np.arange(X.shape[1])[keys[0]]
+            keys = var_index[keys[0]]
+        else:
+            columns = get_var_positions(var_index, keys)  # uses the index's cached hash table
+            if (columns < 0).any():
+                raise KeyError(np.asarray(keys)[columns < 0].tolist())
+        X = csc_gather(X, columns) if scipy.sparse.issparse(X) else X[:, columns]
+        return X, pd.DataFrame(index=keys)
+
+    @staticmethod
+    def get_X(adata, keys, layer=None, cache_key=None):
+        if not adata.isbacked:
+            result = AnndataDataset.gather_X(adata, keys, layer)
+            if result is not None:
+                return result
         if len(keys) == 1 and isinstance(keys[0], slice):  # special case if slice specified
             keys = keys[0]
+        elif cache_key is not None and adata.isbacked:  # only cache features read from disk
+            X = get_columns(
+                cache_key,
+                keys,
+                lambda missing: AnndataDataset.get_X(adata, missing, layer)[0],
+                adata.shape[0],
+            )
+            return X, pd.DataFrame(index=keys)
         d = adata[:, keys]
         X = d.X if layer is None else d.layers[layer]
         if scipy.sparse.issparse(X) and not scipy.sparse.isspmatrix_csc(X):
@@ -193,7 +251,7 @@ class AnndataDataset(AbstractDataset):
         var = pd.DataFrame(index=d.var.index)
         return X, var
 
-    def read_dataset(self, filesystem, path, keys=None, dataset=None):
+    def read_dataset(self, filesystem, path, keys=None, dataset=None, dataset_info=None):
         adata = self.get_data(filesystem, path)
         if keys is None:
             keys = {}
@@ -209,20 +267,31 @@ class AnndataDataset(AbstractDataset):
         adata_modules = None
         layers = {}
         for layer_key in keys.keys():
-            X_layer, var_layer = AnndataDataset.get_X(adata, keys[layer_key], layer_key)
-            adata_layer = AnnData(X=X_layer, var=var_layer)
-            layers[layer_key] = adata_layer
+            X_layer, var_layer = AnndataDataset.get_X(
+                adata,
+                keys[layer_key],
+                layer_key,
+                get_cache_key(path, dataset_info, "layers/" + layer_key),
+            )
+            layers[layer_key] = LiteAnnData(X=X_layer, var=var_layer)
         if len(X_keys) > 0:
-            X, var = AnndataDataset.get_X(adata, X_keys)
+            X, var = AnndataDataset.get_X(
+                adata, X_keys, cache_key=get_cache_key(path, dataset_info, "X")
+            )
         if len(module_keys) > 0:
-            if len(module_keys) == 1 and isinstance(
-                module_keys[0], slice
-            ):  # special case if slice specified
-                module_keys = module_keys[0]
-            adata_modules = adata.uns[ADATA_MODULE_UNS_KEY][:, module_keys]
+            adata_modules = adata.uns[ADATA_MODULE_UNS_KEY]
+            result = AnndataDataset.gather_X(adata_modules, module_keys)
+            if result is None:
+                if len(module_keys) == 1 and isinstance(
+                    module_keys[0], slice
+                ):  # special case if slice specified
+                    module_keys = module_keys[0]
+                d = adata_modules[:, module_keys]
+                result = d.X, pd.DataFrame(index=d.var.index)
+            adata_modules = LiteAnnData(X=result[0], var=result[1])
 
         if len(obs_keys) > 0:
-            obs = pd.DataFrame()
+            obs = {}
             for key in obs_keys:
                 if key == "index":
                     values = adata.obs.index.values
@@ -233,12 +302,7 @@ class AnndataDataset(AbstractDataset):
             for key in basis_keys:
                 embedding_data = adata.obsm[key]
                 obsm[key] = embedding_data
-            if X is None:  # anndata requires empty X
-                X = scipy.sparse.coo_matrix(([], ([], [])), shape=(embedding_data.shape[0], 0))
-        if X is None and obs is None and len(obsm.keys()) == 0:
-            obs = pd.DataFrame(index=pd.RangeIndex(adata.shape[0]).astype(str))
-
-        adata = AnnData(X=X, obs=obs, var=var, obsm=obsm)
+        adata = LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=adata.shape[0])
         if adata_modules is not None:
             adata.uns[ADATA_MODULE_UNS_KEY] = adata_modules
         adata.uns[ADATA_LAYERS_UNS_KEY] = layers
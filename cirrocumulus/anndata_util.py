@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import anndata
+import scipy.sparse
 from pandas import CategoricalDtype
 
 
@@ -82,13 +83,21 @@ def obs_stats(adata, columns):
 
 def X_stats(adata):
     X = adata.X
+    if scipy.sparse.issparse(X):
+        X_min = X.min(axis=0).toarray().flatten()
+        X_max = X.max(axis=0).toarray().flatten()
+        num_expressed = X.getnnz(axis=0)
+    else:
+        X_min = X.min(axis=0)
+        X_max = X.max(axis=0)
+        num_expressed = (X != 0).sum(axis=0)
     return pd.DataFrame(
         data={
-            "min": X.min(axis=0).toarray().flatten(),
-            "max": X.max(axis=0).toarray().flatten(),
-            "sum": X.sum(axis=0).flatten(),
-            "numExpressed": X.getnnz(axis=0),
-            "mean": X.mean(axis=0),
+            "min": X_min,
+            "max": X_max,
+            "sum": np.asarray(X.sum(axis=0)).flatten(),
+            "numExpressed": num_expressed,
+            "mean": np.asarray(X.mean(axis=0)).flatten(),
         },
         index=adata.var.index,
     )
@@ -30,7 +30,15 @@ from .envir import (
 )
 from .invalid_usage import InvalidUsage
 from .job_api import delete_job, submit_job
-from .util import get_fs, get_scheme, json_response, open_file
+from .util import (
+    data_response,
+    get_fs,
+    get_scheme,
+    iter_columns_json,
+    json_response,
+    open_file,
+    streaming_json_response,
+)
 
 
 cirro_blueprint = Blueprint("cirro", __name__)
@@ -372,7 +380,37 @@ def handle_schema():
     schema = dataset  # dataset has title, etc. from database
     schema["markers"] = database_api.get_feature_sets(email=email, dataset_id=dataset_id)
     schema.update(dataset_api.get_schema(dataset))
-    return json_response(schema)
+    return streaming_json_response(schema, conditional=True)
+
+
+def get_non_negative_int(args, key, default):
+    value = args.get(key)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidUsage("Please provide a valid {}".format(key), 400)
+    if value < 0:
+        raise InvalidUsage("Please provide a valid {}".format(key), 400)
+    return value
+
+
+@cirro_blueprint.route("/var", methods=["GET"])
+def handle_var():
+    """Get a page of the dataset features, optionally only features matching q.
+
+    Responses requested with the current hash of the features never change and can be cached by the
+    browser without revalidation.
+    """
+    email, dataset = get_email_and_dataset(request.args)
+    offset = get_non_negative_int(request.args, "offset", 0)
+    limit = get_non_negative_int(request.args, "limit", None)
+    result = dataset_api.get_var(dataset, offset=offset, limit=limit, q=request.args.get("q"))
+    response = json_response(result, conditional=True)
+    if request.args.get("hash") == result["hash"]:
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
 
 
 @cirro_blueprint.route("/file", methods=["GET"])
@@ -405,19 +443,38 @@ def handle_user():
     return json_response(user)
 
 
+def get_data_kwargs(json_request):
+    return dict(
+        embedding_list=json_request.get("embedding"),
+        values=json_request.get("values"),
+        stats=json_request.get("stats"),
+        grouped_stats=json_request.get("groupedStats"),
+        selection=json_request.get("selection"),
+        quantize=json_request.get("quantize"),
+    )
+
+
 @cirro_blueprint.route("/data", methods=["POST"])
 def handle_data():
     json_request = request.get_json(cache=False)
     email, dataset = get_email_and_dataset(json_request)
-    return json_response(
+    return data_response(
         data_processing.handle_data(
+            dataset_api=dataset_api, dataset=dataset, **get_data_kwargs(json_request)
+        )
+    )
+
+
+@cirro_blueprint.route("/data/batch", methods=["POST"])
+def handle_data_batch():
+    # requests (list of /data requests) share one read, results are streamed as they are computed
+    json_request = request.get_json(cache=False)
+    email, dataset = get_email_and_dataset(json_request)
+    return data_response(
+        data_processing.handle_data_batch(
             dataset_api=dataset_api,
             dataset=dataset,
-            embedding_list=json_request.get("embedding"),
-            values=json_request.get("values"),
-            stats=json_request.get("stats"),
-            grouped_stats=json_request.get("groupedStats"),
-            selection=json_request.get("selection"),
+            data_requests=[get_data_kwargs(r) for r in json_request.get("requests", [])],
         )
     )
 
@@ -428,7 +485,7 @@ def handle_selection():
     content = request.get_json(cache=False)
     email, dataset = get_email_and_dataset(content)
     data_filter = content.get("filter")
-    return json_response(
+    return data_response(
         data_processing.handle_selection(
             dataset_api=dataset_api,
             dataset=dataset,
@@ -596,16 +653,14 @@ def handle_job():
                 )
             elif content_type == "application/parquet":
                 df = pd.read_parquet(url)
-
                 return Response(
-                    df.to_json(double_precision=6, orient="columns"),
-                    content_type="application/json",
+                    iter_columns_json(df, double_precision=6), content_type="application/json"
                 )
             else:
                 # URL to JSON or text
                 return send_file(url)
         elif isinstance(job, dict):
-            return json_response(job)
+            return streaming_json_response(job)
         elif isinstance(job, anndata.AnnData):
             return Response(
                 adata_to_df(job).to_json(double_precision=2, orient="records"),
@@ -0,0 +1,103 @@
+import numpy as np
+import scipy.sparse
+
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.sparse_util import range_indices
+
+
+# (dataset path, dataset version, matrix name) -> indptr
+indptr_cache = LRUCache(max_size=64)
+
+
+def is_csc_group(node):
+    encoding_type = node.attrs.get("encoding-type", node.attrs.get("h5sparse_format"))
+    return encoding_type in ("csc_matrix", "csc")
+
+
+def get_indptr(node, cache_key=None):
+    indptr = indptr_cache.get(cache_key) if cache_key is not None else None
+    if indptr is None:
+        indptr = node["indptr"][...]
+        if cache_key is not None:
+            indptr_cache.put(cache_key, indptr)
+    return indptr
+
+
+def plan_ranges(starts, ends, max_gap=0):
+    """Sorts [start, end) ranges and merges ranges that overlap or are separated by at most max_gap
+    elements.
+
+    :return: List of merged [start, end) ranges
+    """
+    ranges = []
+    for i in np.argsort(starts, kind="stable"):
+        start, end = int(starts[i]), int(ends[i])
+        if start == end:
+            continue
+        if len(ranges) > 0 and start - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def read_ranges(arrays, ranges):
+    """Reads ranges from each array sequentially.
+
+    :return: List with a tuple of blocks (one per array) for each range
+    """
+    return [tuple(array[start:end] for array in arrays) for start, end in ranges]
+
+
+def read_csc_columns(node, get_item, indptr=None, read_ranges=read_ranges):
+    """Reads columns from a CSC matrix stored in a zarr or h5py group with as few reads as possible.
+
+    The byte ranges of the requested columns are sorted and merged so that columns stored in the
+    same chunk are read once.
+
+    :param node: Group with data, indices, and indptr arrays
+    :param get_item: Column positions or slice
+    :param indptr: Column pointers or None to read from node
+    :param read_ranges: Function that takes a list of arrays and a list of ranges and returns the
+        blocks for each range
+    :return: CSC matrix with columns in the requested order
+    """
+    shape = tuple(node.attrs["shape"])
+    if indptr is None:
+        indptr = node["indptr"][...]
+    if isinstance(get_item, slice):
+        columns = np.arange(shape[1])[get_item]
+    else:
+        columns = np.asarray(get_item, dtype=np.int64)
+        columns = np.where(columns < 0, columns + shape[1], columns)
+    starts = indptr[columns].astype(np.int64)
+    lengths = indptr[columns + 1].astype(np.int64) - starts
+    data = node["data"]
+    indices = node["indices"]
+    chunks = getattr(data, "chunks", None)
+    ranges = plan_ranges(starts, starts + lengths, chunks[0] if chunks else 0)
+    blocks = read_ranges([data, indices], ranges)
+    if len(blocks) > 0:
+        data_buffer = np.concatenate([block[0] for block in blocks])
+        indices_buffer = np.concatenate([block[1] for block in blocks])
+    else:
+        data_buffer = np.zeros(0, dtype=data.dtype)
+        indices_buffer = np.zeros(0, dtype=indices.dtype)
+
+    # position of each column in the concatenated blocks
+    positions = np.zeros(len(columns), dtype=np.int64)
+    if len(ranges) > 0:
+        range_starts = np.array([r[0] for r in ranges], dtype=np.int64)
+        range_lengths = np.array([r[1] - r[0] for r in ranges], dtype=np.int64)
+        buffer_starts = np.zeros(len(ranges), dtype=np.int64)
+        np.cumsum(range_lengths[:-1], out=buffer_starts[1:])
+        block_index = np.maximum(np.searchsorted(range_starts, starts, side="right") - 1, 0)
+        positions = buffer_starts[block_index] + starts - range_starts[block_index]
+    take = range_indices(positions, lengths)
+    out_indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=out_indptr[1:])
+    if out_indptr[-1] <= np.iinfo(np.int32).max:
+        out_indptr = out_indptr.astype(np.int32)
+    return scipy.sparse.csc_matrix(
+        (data_buffer[take], indices_buffer[take], out_indptr), shape=(shape[0], len(columns))
+    )
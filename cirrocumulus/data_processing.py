@@ -1,33 +1,65 @@
+import numpy as np
 import pandas as pd
 import scipy.sparse
 from pandas import CategoricalDtype
 
 from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY, ADATA_MODULE_UNS_KEY
 from cirrocumulus.dotplot_aggregator import DotPlotAggregator
+from cirrocumulus.embedding_aggregator import EmbeddingAggregator
 from cirrocumulus.feature_aggregator import FeatureAggregator
+from cirrocumulus.filter_engine import compile_filter
 from cirrocumulus.ids_aggregator import IdsAggregator
+from cirrocumulus.mask_cache import cache_mask, get_cached_mask
+from cirrocumulus.quantize import quantize_results
 from cirrocumulus.unique_aggregator import UniqueAggregator
 
 
 def get_mask(dataset_api, dataset, dataset_info, data_filters):
+    """Returns a list of boolean masks (None for empty filters) and the data read to evaluate the
+    filters that were not cached (None if all masks were cached)."""
+    path = dataset["url"]
+    cache_dataset_info = (
+        dataset_info if dataset_info is not None else dataset_api.get_dataset_info(dataset)
+    )
+    result = [None] * len(data_filters)
+    pending = []
     measures = set()
     dimensions = set()
     basis = set()
-    for data_filter in data_filters:
+    for i, data_filter in enumerate(data_filters):
         _measures, _dimensions, _basis = data_filter_keys(data_filter, dataset_info)
+        # look up after data_filter_keys has resolved field names
+        cached = get_cached_mask(path, cache_dataset_info, data_filter)
+        if cached is not None:
+            result[i] = cached[0]
+            continue
+        pending.append(i)
         measures.update(_measures)
         dimensions.update(_dimensions)
         basis.update(_basis)
-    keys = get_type_to_measures(measures)
-    keys["obs"] = list(dimensions)
-    keys["basis"] = list(basis)
-    adata = dataset_api.read_dataset(keys=keys, dataset=dataset)
-    result = []
-    for data_filter in data_filters:
-        result.append(get_filter_expr(adata, data_filter))
+    adata = None
+    if len(pending) > 0:
+        keys = get_type_to_measures(measures)
+        keys["obs"] = list(dimensions)
+        keys["basis"] = list(basis)
+        adata = dataset_api.read_dataset(keys=keys, dataset=dataset)
+        for i in pending:
+            result[i] = compile_filter(data_filters[i]).evaluate(adata)
+            cache_mask(path, cache_dataset_info, data_filters[i], result[i])
     return result, adata
 
 
+def get_cached_filter_expr(dataset_api, dataset, adata, data_filter):
+    """Same as get_filter_expr, but reuses the mask from previous evaluations of data_filter."""
+    dataset_info = dataset_api.get_dataset_info(dataset)
+    cached = get_cached_mask(dataset["url"], dataset_info, data_filter)
+    if cached is not None:
+        return cached[0]
+    keep_expr = get_filter_expr(adata, data_filter)
+    cache_mask(dataset["url"], dataset_info, data_filter, keep_expr)
+    return keep_expr
+
+
 def apply_filter(adata, data_filter):
     keep_expr = get_filter_expr(adata, data_filter)
     return adata[keep_expr] if keep_expr is not None else adata
@@ -70,107 +102,9 @@ def get_filter_str(data_filter):
     return "".join(s).replace("/", "-").replace(" ", "-").replace("\\", "-")
 
 
-def _flatten_array(val):
-    if scipy.sparse.issparse(val):
-        val = val.toarray().flatten()
-    if hasattr(val, "sparse"):
-        val = val.sparse.to_dense()
-    if isinstance(val, pd.Series):
-        val = val.values
-    return val
-
-
 def get_filter_expr(adata, data_filter):
-    keep_expr = None
-    if data_filter is not None:
-        user_filters = data_filter.get("filters", [])
-        combine_filters = data_filter.get("combine", "and")
-        for filter_obj in user_filters:
-            field = filter_obj["field"]
-            op = filter_obj["operation"]
-            value = filter_obj["value"]
-            invert = filter_obj.get("invert", False)
-            if isinstance(field, dict):  # selection box
-                # selected_points_basis = get_basis(field['basis'], field.get('nbins'),
-                #                                   field.get('agg'), field.get('ndim', '2'),
-                #                                   field.get('precomputed', False))
-
-                if "points" in value:
-                    p = value["points"]
-                    # list of indices
-                    keep = pd.RangeIndex(adata.shape[0]).isin(p)
-
-                # else:
-                #     keep = None
-                #     for p in value['path']:
-                #         if 'z' in p:  # 3d
-                #             selection_keep = \
-                #                 (df[selected_points_basis['coordinate_columns'][0]] >= p['x']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][0]] <= p['x'] + p['width']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][1]] >= p['y']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][1]] <= p['y'] + p[
-                #                     'height']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][2]] >= p['z']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][2]] <= p['z'] + p['depth'])
-                #         else:
-                #             selection_keep = \
-                #                 (df[selected_points_basis['coordinate_columns'][0]] >= p['x']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][0]] <= p['x'] + p['width']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][1]] >= p['y']) & \
-                #                 (df[selected_points_basis['coordinate_columns'][1]] <= p['y'] + p['height'])
-
-                # keep = selection_keep | keep if keep is not None else selection_keep
-
-            elif field == "__index":
-                import numpy as np
-
-                keep = np.zeros(adata.shape[0], dtype=bool)
-                keep[value] = True
-            else:
-                series = (
-                    adata.obs[field]
-                    if field in adata.obs
-                    else adata[:, adata.var.index == field].X[:, 0]
-                )
-                if op == "in":
-                    keep = (series.isin(value)).values
-                else:  # array of operations e.g. >, <
-                    keep = None
-                    for i in range(len(op)):
-                        op_i = op[i]
-                        value_i = value[i]
-                        if op_i == ">":
-                            keep_i = series > value_i
-                        elif op_i == "=":
-                            keep_i = series == value_i
-                        elif op_i == "<":
-                            keep_i = series < value_i
-                        elif op_i == "!=":
-                            keep_i = series != value_i
-                        elif op_i == ">=":
-                            keep_i = series >= value_i
-                        elif op_i == "<=":
-                            keep_i = series <= value_i
-                        else:
-                            raise ValueError(
-                                "Unknown filter, field: {}, operation: {}, value: {}".format(
-                                    field, op, value
-                                )
-                            )
-                        keep_i = _flatten_array(keep_i)
-                        keep = keep_i & keep if keep is not None else keep_i
-            keep = _flatten_array(keep)
-            if invert:
-                keep = ~keep
-            if keep_expr is not None:
-                if combine_filters == "and":
-                    keep_expr = keep_expr & keep
-                else:
-                    keep_expr = keep_expr | keep
-            else:
-                keep_expr = keep
-
-    return keep_expr
+    """Returns a boolean mask for the rows of adata that pass data_filter or None."""
+    return compile_filter(data_filter).evaluate(adata)
 
 
 def precomputed_summary(dataset_api, dataset, obs_measures, var_measures, dimensions):
@@ -241,20 +175,269 @@ def handle_export_dataset_filters(dataset_api, dataset, data_filters):
         filter_names.append(data_filter_obj["name"])
         reformatted_filters.append(filter_value)
 
-    df = get_adata(dataset_api, dataset, measures=["obs/index"], data_filters=reformatted_filters)
-    result_df = pd.DataFrame(index=df["index"])
+    adata = get_adata(
+        dataset_api, dataset, measures=["obs/index"], data_filters=reformatted_filters
+    )
+    result_df = pd.DataFrame(index=adata.obs["index"])
     for i in range(len(reformatted_filters)):
         data_filter = reformatted_filters[i]
         filter_name = filter_names[i]
-        df_filtered = apply_filter(df, data_filter)
-        df = pd.DataFrame(index=df_filtered["index"])
+        df_filtered = apply_filter(adata, data_filter)
+        df = pd.DataFrame(index=df_filtered.obs["index"])
         df[filter_name] = True
         result_df = result_df.join(df, rsuffix="r")
     result_df.fillna(False, inplace=True)
     return result_df.to_csv()
 
 
-# embedding - list of basis and coords (whether to return coordinates). For binned embeddings, also measures and dimensions.
+def bin_embedding(adata, embedding, nbins):
+    name = embedding["name"]
+    m = adata.obsm[name]
+    var_measures = embedding.get("measures", [])
+    obs_keys = embedding.get("obs", [])
+    df = adata.to_df(var_measures, obs_keys)
+    coordinate_columns = []
+    for i in range(embedding.get("dimensions", m.shape[1])):
+        column = "{}_{}".format(name, i + 1)
+        df[column] = m[:, i]
+        coordinate_columns.append(column)
+    return EmbeddingAggregator(
+        measures=var_measures,
+        dimensions=obs_keys,
+        nbins=nbins,
+        basis=dict(name=name, full_name="__bin", coordinate_columns=coordinate_columns),
+        agg_function=embedding.get("agg", "max"),
+    ).execute(df)
+
+
+# embedding - list of basis and coords. Binned embeddings (nbins) also have measures, obs, and agg
+# quantize - dict with coordinates (bool) and values (float16 or uint8), see quantize_results
+class DataRequest:
+    """A /data request split into the keys to read and the computation on the data read, so that
+    requests can share one read."""
+
+    def __init__(
+        self,
+        dataset_api,
+        dataset,
+        embedding_list=None,
+        values=None,
+        grouped_stats=None,
+        stats=None,
+        selection=None,
+        quantize=None,
+    ):
+        results = {}
+        # answer unfiltered statistics from precomputed statistics when available
+        if stats is not None:
+            type2measures = get_type_to_measures(stats.get("measures", []))
+            summary = precomputed_summary(
+                dataset_api,
+                dataset,
+                type2measures["obs"],
+                type2measures["X"],
+                stats.get("dimensions", []),
+            )
+            if summary is not None:
+                results["summary"] = summary
+                stats = None
+        if grouped_stats is not None:
+            distribution = precomputed_grouped_stats(
+                dataset_api,
+                dataset,
+                grouped_stats.get("measures", []),
+                grouped_stats.get("dimensions", []),
+            )
+            if distribution is not None:
+                results["distribution"] = distribution
+                grouped_stats = None
+        dimensions = set()
+        measures = set()
+        basis_keys = set()
+        binned_results = []
+        binned_embeddings = []  # binned embeddings that are not precomputed
+        if embedding_list is not None:
+            unbinned_embeddings = []
+            for embedding in embedding_list:
+                nbins = check_bin_input(embedding.get("nbins"))
+                if nbins is None:
+                    unbinned_embeddings.append(embedding)
+                    basis_keys.add(embedding["name"])
+                    continue
+                basis = dict(name=embedding["name"], nbins=nbins, agg=embedding.get("agg", "max"))
+                if "dimensions" in embedding:
+                    basis["dimensions"] = embedding["dimensions"]
+                result = precomputed_embedding(
+                    dataset_api,
+                    dataset,
+                    basis,
+                    [],
+                    embedding.get("measures", []),
+                    embedding.get("obs", []),
+                )
+                if result is not None:
+                    result["nbins"] = nbins
+                    binned_results.append(result)
+                else:
+                    binned_embeddings.append((embedding, nbins))
+                    basis_keys.add(embedding["name"])
+                    measures.update(embedding.get("measures", []))
+                    dimensions.update(embedding.get("obs", []))
+            embedding_list = unbinned_embeddings
+
+        if values is not None:
+            dimensions.update(values.get("dimensions", []))
+            measures.update(values.get("measures", []))
+
+        if selection is not None:
+            data_filter = selection.get("filter")
+            var_keys_filter, obs_keys_filter, selected_points_filter_basis_list = data_filter_keys(
+                data_filter
+            )
+            selection["basis"] = selected_points_filter_basis_list
+            measures.update(var_keys_filter)
+            dimensions.update(obs_keys_filter)
+            dimensions.update(selection.get("dimensions", []))
+            measures.update(selection.get("measures", []))
+            selection_embeddings = selection.get("embeddings", [])
+
+            for embedding in selected_points_filter_basis_list + selection_embeddings:
+                basis_keys.add(embedding["name"])
+
+        if grouped_stats is not None:
+            grouped_stats_dimensions = grouped_stats.get("dimensions", [])
+            for d in grouped_stats_dimensions:
+                if isinstance(d, list):
+                    dimensions.update(d)
+                else:
+                    dimensions.add(d)
+            measures.update(grouped_stats.get("measures", []))
+        if stats is not None:
+            dimensions.update(stats.get("dimensions", []))
+            measures.update(stats.get("measures", []))
+
+        keys = get_type_to_measures(measures)
+        keys["obs"] += list(dimensions)
+        keys["basis"] = list(basis_keys)
+        self.dataset_api = dataset_api
+        self.dataset = dataset
+        self.results = results
+        self.embedding_list = embedding_list
+        self.values = values
+        self.grouped_stats = grouped_stats
+        self.stats = stats
+        self.selection = selection
+        self.quantize = quantize
+        self.binned_results = binned_results
+        self.binned_embeddings = binned_embeddings
+        self.keys = keys
+
+    def execute(self, adata):
+        """Returns the results using adata, the data read for keys."""
+        results = self.results
+        if self.values is not None:
+            dimensions = self.values.get("dimensions", [])
+            measures = self.values.get("measures", [])
+            # measure can be X or layers
+            type2measures = get_type_to_measures(measures)
+            results["values"] = {}
+            for key in type2measures["obs"] + dimensions:
+                series = adata.obs[key]
+                results["values"][key] = series
+                if isinstance(series.dtype, CategoricalDtype):
+                    results["values"][key] = dict(
+                        values=series.values.codes, categories=series.cat.categories.values
+                    )
+                else:
+                    results["values"][key] = series
+
+            def array_to_json(d, var_index, result):
+                is_sparse = scipy.sparse.issparse(d)
+                for i in range(len(var_index)):
+                    x = d[:, i]
+                    if is_sparse:
+                        indices = x.indices
+                        data = x.data
+                        result[var_index[i]] = dict(indices=indices, values=data)
+                    else:
+                        result[var_index[i]] = x
+
+            if adata.uns.get(ADATA_MODULE_UNS_KEY) is not None:
+                adata_modules = adata.uns[ADATA_MODULE_UNS_KEY]
+                array_to_json(adata_modules.X, adata_modules.var.index, results["values"])
+
+            if adata.X is not None:
+                array_to_json(adata.X, adata.var.index, results["values"])
+            if ADATA_LAYERS_UNS_KEY in adata.uns:
+                for layer_name in adata.uns[ADATA_LAYERS_UNS_KEY].keys():
+                    if "layers" not in results:
+                        results["layers"] = {}
+                    results["layers"][layer_name] = {}
+                    adata_layer = adata.uns[ADATA_LAYERS_UNS_KEY][layer_name]
+                    array_to_json(
+                        adata_layer.X, adata_layer.var.index, results["layers"][layer_name]
+                    )
+
+        if len(self.binned_results) > 0 or len(self.binned_embeddings) > 0:
+            results["embeddings"] = list(self.binned_results)
+            for embedding, nbins in self.binned_embeddings:
+                result = bin_embedding(adata, embedding, nbins)
+                result["nbins"] = nbins
+                results["embeddings"].append(result)
+        if self.embedding_list is not None and len(self.embedding_list) > 0:
+            results.setdefault("embeddings", [])
+            for key in dict.fromkeys(embedding["name"] for embedding in self.embedding_list):
+                m = adata.obsm[key]
+                ndim = m.shape[1]
+                coordinates = dict()
+                embedding = dict(name=key, dimensions=ndim, coordinates=coordinates)
+                results["embeddings"].append(embedding)
+                for i in range(ndim):
+                    coordinates["{}_{}".format(key, i + 1)] = m[:, i]
+
+        if self.grouped_stats is not None:
+            results["distribution"] = DotPlotAggregator(
+                var_measures=self.grouped_stats.get("measures", []),
+                dimensions=self.grouped_stats.get("dimensions", []),
+            ).execute(adata)
+        if self.stats is not None:
+            dimensions = self.stats.get("dimensions", [])
+            measures = self.stats.get("measures", [])
+            type2measures = get_type_to_measures(measures)
+            results["summary"] = FeatureAggregator(
+                type2measures["obs"], type2measures["X"], dimensions
+            ).execute(adata)
+        if self.selection is not None:
+            results["selection"] = {}
+            dimensions = self.selection.get("dimensions", [])
+            measures = self.selection.get("measures", [])
+            type2measures = get_type_to_measures(measures)
+            # basis_list = self.selection.get('basis', [])
+            selection_embeddings = self.selection.get("embeddings", [])
+            keep_expr = get_cached_filter_expr(
+                self.dataset_api, self.dataset, adata, self.selection.get("filter")
+            )
+            df = adata[keep_expr] if keep_expr is not None else adata
+            if len(selection_embeddings) > 0:
+                results["selection"]["coordinates"] = {}
+                for embedding in selection_embeddings:
+                    results["selection"]["coordinates"][embedding["name"]] = UniqueAggregator(
+                        "index"
+                    ).execute(df)
+            var_measures = type2measures["X"]
+            results["selection"]["summary"] = FeatureAggregator(
+                type2measures["obs"], type2measures["X"], dimensions
+            ).execute(df)
+            if len(dimensions) > 0 and len(var_measures) > 0:
+                results["selection"]["distribution"] = DotPlotAggregator(
+                    var_measures=var_measures, dimensions=[dimensions]
+                ).execute(df)
+            results["selection"]["count"] = df.shape[0]
+        if self.quantize is not None:
+            quantize_results(results, adata.var.index, self.quantize)
+        return results
+
+
 def handle_data(
     dataset_api,
     dataset,
@@ -263,139 +446,40 @@ def handle_data(
     grouped_stats=None,
     stats=None,
     selection=None,
+    quantize=None,
 ):
-    dimensions = set()
-    measures = set()
-    basis_keys = set()
-    if embedding_list is not None:
-        for embedding in embedding_list:
-            basis_keys.add(embedding["name"])
-
-    if values is not None:
-        dimensions.update(values.get("dimensions", []))
-        measures.update(values.get("measures", []))
-
-    if selection is not None:
-        data_filter = selection.get("filter")
-        var_keys_filter, obs_keys_filter, selected_points_filter_basis_list = data_filter_keys(
-            data_filter
-        )
-        selection["basis"] = selected_points_filter_basis_list
-        measures.update(var_keys_filter)
-        dimensions.update(obs_keys_filter)
-        dimensions.update(selection.get("dimensions", []))
-        measures.update(selection.get("measures", []))
-        selection_embeddings = selection.get("embeddings", [])
-
-        for embedding in selected_points_filter_basis_list + selection_embeddings:
-            basis_keys.add(embedding["name"])
-
-    if grouped_stats is not None:
-        grouped_stats_dimensions = grouped_stats.get("dimensions", [])
-        for d in grouped_stats_dimensions:
-            if isinstance(d, list):
-                dimensions.update(d)
-            else:
-                dimensions.add(d)
-        measures.update(grouped_stats.get("measures", []))
-    if stats is not None:
-        dimensions.update(stats.get("dimensions", []))
-        measures.update(stats.get("measures", []))
-
-    keys = get_type_to_measures(measures)
-    keys["obs"] += list(dimensions)
-    keys["basis"] = list(basis_keys)
-    adata = dataset_api.read_dataset(dataset=dataset, keys=keys)
-    results = {}
-    if values is not None:
-        dimensions = values.get("dimensions", [])
-        measures = values.get("measures", [])
-        # measure can be X or layers
-        type2measures = get_type_to_measures(measures)
-        results["values"] = {}
-        for key in type2measures["obs"] + dimensions:
-            series = adata.obs[key]
-            results["values"][key] = series
-            if isinstance(series.dtype, CategoricalDtype):
-                results["values"][key] = dict(
-                    values=series.values.codes, categories=series.cat.categories.values
-                )
-            else:
-                results["values"][key] = series
+    data_request = DataRequest(
+        dataset_api,
+        dataset,
+        embedding_list=embedding_list,
+        values=values,
+        grouped_stats=grouped_stats,
+        stats=stats,
+        selection=selection,
+        quantize=quantize,
+    )
+    return data_request.execute(dataset_api.read_dataset(dataset=dataset, keys=data_request.keys))
 
-        def array_to_json(d, var_index, result):
-            is_sparse = scipy.sparse.issparse(d)
-            for i in range(len(var_index)):
-                x = d[:, i]
-                if is_sparse:
-                    indices = x.indices
-                    data = x.data
-                    result[var_index[i]] = dict(indices=indices, values=data)
-                else:
-                    result[var_index[i]] = x
-
-        if adata.uns.get(ADATA_MODULE_UNS_KEY) is not None:
-            adata_modules = adata.uns[ADATA_MODULE_UNS_KEY]
-            array_to_json(adata_modules.X, adata_modules.var.index, results["values"])
-
-        if adata.X is not None:
-            array_to_json(adata.X, adata.var.index, results["values"])
-        if ADATA_LAYERS_UNS_KEY in adata.uns:
-            for layer_name in adata.uns[ADATA_LAYERS_UNS_KEY].keys():
-                if "layers" not in results:
-                    results["layers"] = {}
-                results["layers"][layer_name] = {}
-                adata_layer = adata.uns[ADATA_LAYERS_UNS_KEY][layer_name]
-                array_to_json(adata_layer.X, adata_layer.var.index, results["layers"][layer_name])
-
-    if embedding_list is not None and len(embedding_list) > 0:
-        results["embeddings"] = []
-        for key in adata.obsm.keys():
-            m = adata.obsm[key]
-            ndim = m.shape[1]
-            coordinates = dict()
-            embedding = dict(name=key, dimensions=ndim, coordinates=coordinates)
-            results["embeddings"].append(embedding)
-            for i in range(ndim):
-                coordinates["{}_{}".format(key, i + 1)] = m[:, i]
-
-    if grouped_stats is not None:
-        results["distribution"] = DotPlotAggregator(
-            var_measures=grouped_stats.get("measures", []),
-            dimensions=grouped_stats.get("dimensions", []),
-        ).execute(adata)
-    if stats is not None:
-        dimensions = stats.get("dimensions", [])
-        measures = stats.get("measures", [])
-        type2measures = get_type_to_measures(measures)
-        results["summary"] = FeatureAggregator(
-            type2measures["obs"], type2measures["X"], dimensions
-        ).execute(adata)
-    if selection is not None:
-        results["selection"] = {}
-        dimensions = selection.get("dimensions", [])
-        measures = selection.get("measures", [])
-        type2measures = get_type_to_measures(measures)
-        # basis_list = selection.get('basis', [])
-        selection_embeddings = selection.get("embeddings", [])
-        df = apply_filter(adata, data_filter)
-        if len(selection_embeddings) > 0:
-            results["selection"]["coordinates"] = {}
-            for embedding in selection_embeddings:
-                results["selection"]["coordinates"][embedding["name"]] = UniqueAggregator(
-                    "index"
-                ).execute(df)
-        var_measures = type2measures["X"]
-        results["selection"]["summary"] = FeatureAggregator(
-            type2measures["obs"], type2measures["X"], dimensions
-        ).execute(df)
-        if len(dimensions) > 0 and len(var_measures) > 0:
-            results["selection"]["distribution"] = DotPlotAggregator(
-                var_measures=var_measures, dimensions=[dimensions]
-            ).execute(df)
-        results["selection"]["count"] = df.shape[0]
 
-    return results
+def merge_keys(keys_list):
+    """Returns the union of keys passed to read_dataset (dicts of key type to list of keys)."""
+    merged = {}
+    for keys in keys_list:
+        for key_type, type_keys in keys.items():
+            merged.setdefault(key_type, {}).update(dict.fromkeys(type_keys))
+    return {key_type: list(type_keys) for key_type, type_keys in merged.items()}
+
+
+def handle_data_batch(dataset_api, dataset, data_requests):
+    """Reads the union of the keys of data_requests (list of handle_data keyword arguments) once.
+
+    :return: Generator of the results of each request, computed as the generator is consumed
+    """
+    data_requests = [DataRequest(dataset_api, dataset, **kwargs) for kwargs in data_requests]
+    adata = dataset_api.read_dataset(
+        dataset=dataset, keys=merge_keys([data_request.keys for data_request in data_requests])
+    )
+    return (data_request.execute(adata.select(data_request.keys)) for data_request in data_requests)
 
 
 def handle_selection_ids(dataset_api, dataset, data_filter):
@@ -411,6 +495,7 @@ def get_adata(
     dimensions=[],
     data_filters=[],
     dataset_info=None,
+    rows=None,
 ):
     type2measures = get_type_to_measures(measures)
     var_keys_filter = []
@@ -434,7 +519,7 @@ def get_adata(
         basis_keys.add(embedding["name"])
 
     adata = dataset_api.read_dataset(
-        dataset=dataset, keys=dict(obs=obs_keys, X=var_keys, basis=list(basis_keys))
+        dataset=dataset, keys=dict(obs=obs_keys, X=var_keys, basis=list(basis_keys)), rows=rows
     )
     # for basis_obj in basis_objs:
     #     if not basis_obj['precomputed'] and basis_obj['nbins'] is not None:
@@ -454,17 +539,15 @@ def get_selected_data(
     data_filter=None,
     dataset_info=None,
 ):
-    df = get_adata(
-        dataset_api,
-        dataset,
-        embeddings,
-        measures,
-        dimensions,
-        [data_filter] if data_filter is not None else [],
-        dataset_info=dataset_info,
+    # evaluate the filter first so that only selected rows are read
+    rows = None
+    if data_filter is not None:
+        masks, _ = get_mask(dataset_api, dataset, dataset_info, [data_filter])
+        if masks[0] is not None:
+            rows = np.flatnonzero(masks[0])
+    return get_adata(
+        dataset_api, dataset, embeddings, measures, dimensions, dataset_info=dataset_info, rows=rows
     )
-    df = apply_filter(df, data_filter)
-    return df
 
 
 def data_filter_keys(data_filter, dataset_info=None):
@@ -482,10 +565,15 @@ def data_filter_keys(data_filter, dataset_info=None):
             elif key == "__index":
                 continue
             else:
-                name, key_type = get_var_name_type(
-                    key, default_type="obs", dataset_info=dataset_info
-                )
-                user_filter["field"] = name
+                key_type = user_filter.get("field_type")
+                if key_type is None:  # record the type removed from field, e.g. X/CD4 or obs/CD4
+                    name, key_type = get_var_name_type(
+                        key, default_type="obs", dataset_info=dataset_info
+                    )
+                    user_filter["field"] = name
+                    user_filter["field_type"] = key_type
+                else:  # already resolved
+                    name = key
                 if key_type == "X":
                     var_keys.add(name)
                 else:
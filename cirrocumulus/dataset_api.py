@@ -1,6 +1,19 @@
 import os
+import time
 
+from cirrocumulus.envir import (
+    CIRRO_CACHE_VALIDATE_INTERVAL,
+    CIRRO_DATASET_CACHE_SIZE,
+    CIRRO_SCHEMA_CACHE_DIR,
+)
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.schema_cache import (
+    get_default_schema_cache_dir,
+    read_cached_schema,
+    write_cached_schema,
+)
 from cirrocumulus.util import get_fs
+from cirrocumulus.var_index import get_var_page, split_var
 
 
 def get_path(dataset, dataset_path):
@@ -17,8 +30,16 @@ class DatasetAPI:
     def __init__(self):
         self.suffix_to_provider = {}
         self.default_provider = None
-        self.cached_dataset_info = None
-        self.cached_dataset_id = None
+        cache_size = int(os.environ.get(CIRRO_DATASET_CACHE_SIZE, "16"))
+        # (path, version) -> dataset info or (schema, var table)
+        self.dataset_info_cache = LRUCache(cache_size)
+        self.schema_cache = LRUCache(cache_size)
+        self.validate_interval = float(os.environ.get(CIRRO_CACHE_VALIDATE_INTERVAL, "5"))
+        self.path_to_version = {}  # path -> (version, time version was checked)
+        # schemas are also persisted so that they survive server restarts
+        self.schema_cache_dir = os.environ.get(
+            CIRRO_SCHEMA_CACHE_DIR, get_default_schema_cache_dir()
+        )
 
     def get_dataset_provider(self, path):
         index = path.rfind(".")
@@ -36,32 +57,117 @@ class DatasetAPI:
         for suffix in suffixes:
             self.suffix_to_provider[suffix.lower()] = provider
 
+    def get_version(self, path):
+        """Returns the version of the dataset at path, checking the store at most once per
+        validate_interval seconds."""
+        now = time.time()
+        entry = self.path_to_version.get(path)
+        if entry is not None and now - entry[1] < self.validate_interval:
+            return entry[0]
+        provider = self.get_dataset_provider(path)
+        version = provider.get_version(get_fs(path), path)
+        if entry is not None and entry[0] != version:
+            provider.invalidate(path)
+        self.path_to_version[path] = (version, now)
+        return version
+
     def get_dataset_info(self, dataset):
-        dataset_id = dataset["id"]
-        if self.cached_dataset_id == dataset_id:
-            dataset_info = self.cached_dataset_info
-        else:
-            path = dataset["url"]
+        path = dataset["url"]
+        key = (path, self.get_version(path))
+        dataset_info = self.dataset_info_cache.get(key)
+        if dataset_info is None:
             provider = self.get_dataset_provider(path)
             dataset_info = provider.get_dataset_info(get_fs(path), path)
-            self.cached_dataset_info = dataset_info
-            self.cached_dataset_id = dataset_id
+            dataset_info["version"] = key[1]
+            self.dataset_info_cache.put(key, dataset_info)
         return dataset_info
 
-    def get_schema(self, dataset):
+    def get_schema_and_var(self, dataset):
+        """Returns a tuple of the provider schema without var and the var table."""
         path = dataset["url"]
-        provider = self.get_dataset_provider(path)
-        schema_dict = provider.get_schema(get_fs(path), path)
+        key = (path, self.get_version(path))
+        entry = self.schema_cache.get(key)
+        if entry is None:
+            provider_schema = read_cached_schema(self.schema_cache_dir, path, key[1])
+            if provider_schema is None:
+                provider = self.get_dataset_provider(path)
+                provider_schema = provider.get_schema(get_fs(path), path)
+                write_cached_schema(self.schema_cache_dir, path, key[1], provider_schema)
+            entry = split_var(provider_schema)
+            self.schema_cache.put(key, entry)
+        return entry
+
+    def get_var(self, dataset, offset=0, limit=None, q=None):
+        """Returns a page of the var table, optionally only features matching q."""
+        schema, table = self.get_schema_and_var(dataset)
+        result = get_var_page(table, offset=offset, limit=limit, q=q)
+        result["hash"] = schema["varHash"]
+        return result
+
+    def get_schema(self, dataset):
+        """Returns the dataset schema. The var table is served separately by get_var."""
+        schema_dict = self.get_schema_and_var(dataset)[0].copy()
         if "summary" in dataset:
             schema_dict["summary"] = dataset["summary"]
         if "markers" in schema_dict:
             schema_dict["markers_read_only"] = schema_dict.pop("markers")
         return schema_dict
 
-    def read_dataset(self, dataset, keys=[]):
+    def read_dataset(self, dataset, keys=[], rows=None):
+        """Reads the data for keys, optionally only for rows (row positions)."""
+        path = dataset["url"]
+        provider = self.get_dataset_provider(path)
+        kwargs = {}
+        if rows is not None and provider.supports_row_subset():
+            kwargs["rows"] = rows
+        adata = provider.read_dataset(
+            get_fs(path),
+            path,
+            keys=keys,
+            dataset=dataset,
+            dataset_info=self.get_dataset_info(dataset),
+            **kwargs,
+        )
+        if rows is not None and "rows" not in kwargs:
+            adata = adata[rows]
+        return adata
+
+    def read_precomputed_stats(self, dataset, obs_keys=[], var_keys=[]):
+        """Returns precomputed summary statistics or None if not available."""
+        path = dataset["url"]
+        provider = self.get_dataset_provider(path)
+        return provider.read_precomputed_stats(
+            get_fs(path),
+            path,
+            obs_keys=obs_keys,
+            var_keys=var_keys,
+            dataset_info=self.get_dataset_info(dataset),
+        )
+
+    def read_precomputed_grouped_stats(self, dataset, obs_keys=[], var_keys=[]):
+        """Returns precomputed grouped statistics or None if not available."""
+        path = dataset["url"]
+        provider = self.get_dataset_provider(path)
+        return provider.read_precomputed_grouped_stats(
+            get_fs(path),
+            path,
+            obs_keys=obs_keys,
+            var_keys=var_keys,
+            dataset_info=self.get_dataset_info(dataset),
+        )
+
+    def read_precomputed_basis(self, dataset, obs_keys=[], var_keys=[], basis=None):
+        """Returns a precomputed binned embedding or None if not available."""
         path = dataset["url"]
         provider = self.get_dataset_provider(path)
-        return provider.read_dataset(get_fs(path), path, keys=keys, dataset=dataset)
+        return provider.read_precomputed_basis(
+            get_fs(path),
+            path,
+            obs_keys=obs_keys,
+            var_keys=var_keys,
+            basis=basis,
+            dataset_info=self.get_dataset_info(dataset),
+        )
 
     def get_result(self, dataset, result_id):
         path = dataset["url"]
@@ -6,13 +6,19 @@ class DotPlotAggregator:
         self.var_measures = var_measures
         self.dimensions = dimensions
 
-    def execute(self, df):
+    def execute(self, adata):
         results = []
         # {categories:[], name:'', values:[{name:'', percentExpressed:0, mean:0}]}
         var_measures = self.var_measures
         dimensions = self.dimensions
         if len(var_measures) == 0 or len(dimensions) == 0:
             return results
+        obs_keys = []
+        for d in dimensions:
+            for key in d if isinstance(d, list) else [d]:
+                if key not in obs_keys:
+                    obs_keys.append(key)
+        df = adata.to_df(var_measures, obs_keys)
 
         def mean(x):
             return x.mean()
@@ -1,27 +1,111 @@
 import numpy as np
+import pandas as pd
 from pandas import CategoricalDtype
 
 
-def mean_agg(x):
-    return x.mean()
-
-
-def sparse_sum_agg(x):
-    return x.sparse.fill_value if x.sparse.npoints == 0 else x.sum()
-
-
-def sparse_max_agg(x):
-    return x.sparse.fill_value if x.sparse.npoints == 0 else np.max(x.values.sp_values)
-
-
-def purity_agg(x):
-    value_counts = x.value_counts(sort=False)
-    largest = value_counts.nlargest(1)
-    return largest[0] / value_counts.sum()
-
-
-def mode_agg(x):
-    return x.mode()[0]
+# maximum size of the bin by category count matrix used to compute modes, larger matrices are
+# computed from the sorted (bin, category) pairs that occur
+max_dense_mode_size = 1 << 22
+# aggregations computed with Bins, others (e.g. min or median) are computed with pandas groupby
+bins_agg_functions = ["max", "sum", "mean"]
+
+
+class Bins:
+    """Observations grouped by bin id. The grouping is computed once and shared by all
+    aggregations, which return one value per bin in sorted bin id order."""
+
+    def __init__(self, bin_ids):
+        self.bins, self.first, self.inverse, self.counts = np.unique(
+            bin_ids, return_index=True, return_inverse=True, return_counts=True
+        )
+        self.inverse = self.inverse.reshape(-1)
+        self.n_bins = len(self.bins)
+        self._order = None
+        self._starts = None
+
+    def _sorted(self, values):
+        if self._order is None:
+            self._order = np.argsort(self.inverse, kind="stable")
+            self._starts = np.zeros(self.n_bins, dtype=np.int64)
+            np.cumsum(self.counts[:-1], out=self._starts[1:])
+        return values[self._order]
+
+    def reduce(self, ufunc, values):
+        """Reduces the values in each bin with ufunc (e.g. np.minimum)."""
+        return ufunc.reduceat(self._sorted(values), self._starts)
+
+    def max(self, values):
+        """Maximum ignoring NaN, NaN when all values in a bin are NaN."""
+        return self.reduce(np.fmax, values)
+
+    def sum(self, values):
+        """Sum ignoring NaN."""
+        if values.dtype.kind in "biu":
+            return self.reduce(np.add, values.astype(np.int64))
+        return np.bincount(
+            self.inverse, weights=np.nan_to_num(values, nan=0.0), minlength=self.n_bins
+        ).astype(values.dtype)
+
+    def mean(self, values):
+        """Mean ignoring NaN."""
+        if values.dtype.kind in "biu":
+            return np.bincount(self.inverse, weights=values, minlength=self.n_bins) / self.counts
+        finite = ~np.isnan(values)
+        total = np.bincount(self.inverse[finite], weights=values[finite], minlength=self.n_bins)
+        count = np.bincount(self.inverse[finite], minlength=self.n_bins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (total / count).astype(values.dtype)
+
+    def sparse(self, agg_function, indices, values, fill_value):
+        """Aggregates a sparse column given the positions and values of its stored points only.
+
+        Bins without stored points are fill_value. Max only considers stored points.
+        """
+        point_bins = self.inverse[indices]
+        n_points = np.bincount(point_bins, minlength=self.n_bins)
+        if agg_function == "max":
+            result = np.full(self.n_bins, -np.inf, dtype=np.float64)
+            np.maximum.at(result, point_bins, values)
+        else:
+            result = np.bincount(point_bins, weights=values, minlength=self.n_bins)
+            result += fill_value * (self.counts - n_points)
+            if agg_function == "mean":
+                result /= self.counts
+        result[n_points == 0] = fill_value
+        return result.astype(values.dtype)
+
+    def mode(self, codes, n_categories):
+        """Most frequent code (ties go to the lowest code) and its fraction of the non-missing
+        codes (-1) in each bin. Bins without codes have mode -1 and purity NaN.
+
+        :return: Tuple of mode and purity
+        """
+        keep = codes >= 0
+        pairs = self.inverse[keep] * n_categories + codes[keep]
+        if self.n_bins * n_categories <= max_dense_mode_size:
+            counts = np.bincount(pairs, minlength=self.n_bins * n_categories).reshape(
+                self.n_bins, n_categories
+            )
+            mode = counts.argmax(axis=1)
+            largest = counts[np.arange(self.n_bins), mode]
+            totals = counts.sum(axis=1)
+        else:
+            pairs, pair_counts = np.unique(pairs, return_counts=True)
+            pair_bins = pairs // n_categories
+            # pairs are sorted by bin then code, keep the first largest count in each bin
+            order = np.lexsort((-pair_counts, pair_bins))
+            pair_bins, pairs, pair_counts = pair_bins[order], pairs[order], pair_counts[order]
+            is_mode = np.ones(len(pair_bins), dtype=bool)
+            is_mode[1:] = pair_bins[1:] != pair_bins[:-1]
+            mode = np.zeros(self.n_bins, dtype=np.int64)
+            mode[pair_bins[is_mode]] = pairs[is_mode] % n_categories
+            largest = np.zeros(self.n_bins, dtype=np.int64)
+            largest[pair_bins[is_mode]] = pair_counts[is_mode]
+            totals = np.bincount(pair_bins, weights=pair_counts, minlength=self.n_bins)
+        mode[totals == 0] = -1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            purity = largest / totals
+        return mode, purity
 
 
 class EmbeddingAggregator:
@@ -61,98 +145,96 @@ class EmbeddingAggregator:
                 df[coordinate_columns[1]] + nbins * df[coordinate_columns[0]]
             )
 
-    def execute(self, df):
-        result = {"coordinates": {}, "values": {}}
-        measures = self.measures
-        dimensions = self.dimensions
-        add_count = self.add_count
+    def execute_binned(self, df, result):
         basis = self.basis
-        if basis is not None:
-            result["name"] = basis["name"]
-        nbins = self.nbins
         agg_function = self.agg_function
-        compute_purity = not self.quick and nbins is not None
-        if nbins is not None:
-            if basis["full_name"] not in df:
-                EmbeddingAggregator.convert_coords_to_bin(
-                    df=df,
-                    nbins=nbins,
-                    coordinate_columns=basis["coordinate_columns"],
-                    bin_name=basis["full_name"],
-                )
-
-            if add_count:
-                df["__count"] = 1.0
-
-            # bin level summary, coordinates have already been converted
-            agg_dict = {}
-            full_basis_name = basis["full_name"]
-            for column in basis["coordinate_columns"]:
-                agg_dict[column] = "min"
-            for column in measures:
-                if hasattr(df[column], "sparse"):
-                    if agg_function == "max":
-                        sparse_agg = sparse_max_agg
-                    elif agg_function == "mean":
-                        sparse_agg = mean_agg
-                    elif agg_function == "sum":
-                        sparse_agg = sparse_sum_agg
-                    agg_dict[column] = sparse_agg
-                else:
-                    agg_dict[column] = agg_function
-
-            for column in dimensions:
-                agg_dict[column] = (mode_agg, purity_agg) if compute_purity else mode_agg
-            if add_count:
-                agg_dict["__count"] = "sum"
-
-            agg_df = df.groupby(full_basis_name).agg(agg_dict)
-
-            if add_count:
-                series = agg_df["__count"]
-                if compute_purity:
-                    series = series[series.columns[0]]
-                result["values"]["__count"] = series
-            if self.coords:
-                result["coordinates"]["bins"] = agg_df.index
-
-        else:  # no binning
-            if add_count:
-                result["values"]["__count"] = np.ones(len(df))
-            agg_df = df
-        for column in dimensions:
-            series = agg_df[column]
-            if nbins is not None:
-                if compute_purity:
-                    result["values"][column] = dict(
-                        value=series["mode_agg"], purity=series["purity_agg"]
+        compute_purity = not self.quick
+        if basis["full_name"] not in df:
+            EmbeddingAggregator.convert_coords_to_bin(
+                df=df,
+                nbins=self.nbins,
+                coordinate_columns=basis["coordinate_columns"],
+                bin_name=basis["full_name"],
+            )
+        # bin level summary, coordinates have already been converted
+        bins = Bins(df[basis["full_name"]].values)
+        bin_index = pd.Index(bins.bins, name=basis["full_name"])
+        if self.add_count:
+            result["values"]["__count"] = pd.Series(
+                bins.counts.astype(np.float64), index=bin_index, name="__count"
+            )
+        for column in self.dimensions:
+            values = df[column].values
+            if not isinstance(values, pd.Categorical):
+                codes, categories = pd.factorize(values, sort=True)
+                values = pd.Categorical.from_codes(codes, categories)
+            mode, purity = bins.mode(values.codes.astype(np.int64), len(values.categories))
+            value = pd.Series(
+                np.asarray(pd.Categorical.from_codes(mode, values.categories)),
+                index=bin_index,
+                name=column,
+            )
+            result["values"][column] = (
+                dict(value=value, purity=pd.Series(purity, index=bin_index, name=column))
+                if compute_purity
+                else dict(value=value)
+            )
+        use_bins = agg_function in bins_agg_functions
+        for column in self.measures:
+            values = df[column].values
+            if isinstance(values, pd.arrays.SparseArray):
+                if use_bins:
+                    values = bins.sparse(
+                        agg_function, values.sp_index.indices, values.sp_values, values.fill_value
                     )
                 else:
-                    result["values"][column] = dict(value=series)
+                    values = (
+                        pd.Series(values.to_dense()).groupby(bins.inverse).agg(agg_function).values
+                    )
+                keep = values != 0
+                result["values"][column] = dict(
+                    indices=np.flatnonzero(keep).astype(np.int32), values=values[keep]
+                )
+            elif use_bins and values.dtype.kind in "biuf":
+                result["values"][column] = pd.Series(
+                    getattr(bins, agg_function)(values), index=bin_index, name=column
+                )
             else:
+                series = df[column].groupby(bins.inverse).agg(agg_function)
+                series.index = bin_index
                 result["values"][column] = series
-        for column in measures:
-            series = agg_df[column]
-            if compute_purity:
-                series = series[series.columns[0]]
-            is_sparse = hasattr(series, "sparse")
-            if is_sparse:
-                # result['values'][column] = series.sparse.to_dense()
+        if self.coords:
+            result["coordinates"]["bins"] = bin_index
+            for column in basis["coordinate_columns"]:
+                result["coordinates"][column] = pd.Series(
+                    bins.reduce(np.minimum, df[column].values), index=bin_index, name=column
+                )
+        return result
+
+    def execute(self, df):
+        result = {"coordinates": {}, "values": {}}
+        basis = self.basis
+        if basis is not None:
+            result["name"] = basis["name"]
+        if self.nbins is not None:
+            return self.execute_binned(df, result)
+        if self.add_count:
+            result["values"]["__count"] = np.ones(len(df))
+        for column in self.dimensions:
+            result["values"][column] = df[column]
+        for column in self.measures:
+            series = df[column]
+            if hasattr(series, "sparse"):
                 result["values"][column] = dict(
                     indices=series.values.sp_index.indices, values=series.values.sp_values
                 )
+            elif isinstance(series.dtype, CategoricalDtype):
+                result["values"][column] = dict(
+                    values=series.values, categories=series.cat.categories.values
+                )
             else:
-                if isinstance(series.dtype, CategoricalDtype):
-                    result["values"][column] = dict(
-                        values=series.values, categories=series.cat.categories.values
-                    )
-                else:
-                    result["values"][column] = series
-
+                result["values"][column] = series
         if self.coords:
             for column in basis["coordinate_columns"]:
-                series = agg_df[column]
-                if compute_purity:
-                    series = series[series.columns[0]]
-                result["coordinates"][column] = series
+                result["coordinates"][column] = df[column]
         return result
@@ -14,6 +14,27 @@ CIRRO_BRAND = "CIRRO_BRAND"
 CIRRO_UPLOAD = "CIRRO_UPLOAD"
 
 CIRRO_COMPRESS = "CIRRO_COMPRESS"
+# maximum number of open zarr/h5ad root groups kept per process
+CIRRO_GROUP_POOL_SIZE = "CIRRO_GROUP_POOL_SIZE"
+# maximum number of dataset schemas and dataset infos kept per process
+CIRRO_DATASET_CACHE_SIZE = "CIRRO_DATASET_CACHE_SIZE"
+# local directory to persist computed dataset schemas to, set to an empty string to disable
+CIRRO_SCHEMA_CACHE_DIR = "CIRRO_SCHEMA_CACHE_DIR"
+# minimum number of seconds between checks for dataset modifications
+CIRRO_CACHE_VALIDATE_INTERVAL = "CIRRO_CACHE_VALIDATE_INTERVAL"
+# maximum number of bytes of decoded feature values kept per process
+CIRRO_FEATURE_CACHE_BYTES = "CIRRO_FEATURE_CACHE_BYTES"
+# maximum number of bytes of decoded obs columns kept per process
+CIRRO_OBS_CACHE_BYTES = "CIRRO_OBS_CACHE_BYTES"
+# maximum number of bytes of packed selection filter masks kept per process
+CIRRO_MASK_CACHE_BYTES = "CIRRO_MASK_CACHE_BYTES"
+# maximum number of bytes of precomputed summary statistics kept per process
+CIRRO_STATS_CACHE_BYTES = "CIRRO_STATS_CACHE_BYTES"
+# size of the h5py raw data chunk cache for each open h5ad file
+CIRRO_H5_CHUNK_CACHE_BYTES = "CIRRO_H5_CHUNK_CACHE_BYTES"
+# maximum number of concurrent reads per filesystem protocol, can be set per protocol by appending
+# the protocol (e.g. CIRRO_IO_MAX_WORKERS_GS)
+CIRRO_IO_MAX_WORKERS = "CIRRO_IO_MAX_WORKERS"
 CIRRO_JOB_RESULTS = "CIRRO_JOB_RESULTS"  # job result storage location
 CIRRO_DATABASE_CLASS = "CIRRO_DATABASE_CLASS"
 CIRRO_DATABASE = "CIRRO_DATABASE"
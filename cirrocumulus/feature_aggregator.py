@@ -26,8 +26,8 @@ class FeatureAggregator:
     def execute(self, adata):
         result = {}
         for column in self.dimensions:
-            df_counts = adata.obs.agg({column: lambda x: x.value_counts(sort=False)})
-            dimension_summary = {"categories": df_counts.index, "counts": df_counts[column]}
+            counts = adata.obs[column].value_counts(sort=False)
+            dimension_summary = {"categories": counts.index, "counts": counts}
             result[column] = dimension_summary
         if len(self.var_measures) > 0:
             FeatureAggregator.add_to_result(X_stats(adata), result)
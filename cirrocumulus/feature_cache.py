@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import scipy.sparse
+
+from cirrocumulus.envir import CIRRO_FEATURE_CACHE_BYTES
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.sparse_util import csc_columns, csc_from_columns
+
+
+def column_nbytes(column):
+    if isinstance(column, tuple):  # sparse column
+        return column[0].nbytes + column[1].nbytes
+    return column.nbytes
+
+
+# (dataset path, dataset version, matrix name, feature) -> decoded column. Sparse columns are
+# stored as (indices, data) tuples and dense columns as 1-d arrays.
+feature_cache = LRUCache(
+    max_size=int(os.environ.get(CIRRO_FEATURE_CACHE_BYTES, str(128 * 1024 * 1024))),
+    size_fn=column_nbytes,
+)
+
+
+def get_cache_key(path, dataset_info, name):
+    """Returns the cache key prefix for matrix name in dataset or None when the dataset version is
+    unknown."""
+    if dataset_info is None or dataset_info.get("version") is None:
+        return None
+    return path, dataset_info["version"], name
+
+
+def get_columns(cache_key, keys, read_fn, n_rows):
+    """Returns a matrix with one column per feature in keys, reading only features not in the cache.
+
+    :param cache_key: Identifies the matrix the features belong to (see get_cache_key)
+    :param keys: List of features
+    :param read_fn: Function that takes a list of features and returns a sparse matrix or a dense
+        array with one column per feature
+    :param n_rows: Number of rows in the matrix
+    """
+    key_to_column = {}
+    missing = []
+    for key in keys:
+        if key not in key_to_column:
+            column = feature_cache.get(cache_key + (key,))
+            key_to_column[key] = column
+            if column is None:
+                missing.append(key)
+    dtype = None
+    if len(missing) > 0:
+        X = read_fn(missing)
+        dtype = X.dtype
+        if scipy.sparse.issparse(X):
+            missing_columns = csc_columns(X.tocsc())
+        else:
+            X = np.asarray(X)
+            missing_columns = [X[:, j].copy() for j in range(X.shape[1])]
+        for key, column in zip(missing, missing_columns):
+            key_to_column[key] = column
+            feature_cache.put(cache_key + (key,), column)
+    columns = [key_to_column[key] for key in keys]
+    if len(columns) > 0 and not isinstance(columns[0], tuple):
+        return np.column_stack(columns)
+    return csc_from_columns(columns, n_rows, dtype)
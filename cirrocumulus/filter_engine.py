@@ -0,0 +1,184 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+
+class RangePredicate:
+    """Chained comparisons (e.g. [">", "<="]) on one field reduced to bounds and (in)equalities."""
+
+    def __init__(self, field, ops, values):
+        self.lower = None  # (value, inclusive)
+        self.upper = None
+        self.equal = []
+        self.not_equal = []
+        for op, value in zip(ops, values):
+            if op == ">" or op == ">=":
+                inclusive = op == ">="
+                if (
+                    self.lower is None
+                    or value > self.lower[0]
+                    or (value == self.lower[0] and not inclusive)
+                ):
+                    self.lower = (value, inclusive)
+            elif op == "<" or op == "<=":
+                inclusive = op == "<="
+                if (
+                    self.upper is None
+                    or value < self.upper[0]
+                    or (value == self.upper[0] and not inclusive)
+                ):
+                    self.upper = (value, inclusive)
+            elif op == "=":
+                self.equal.append(value)
+            elif op == "!=":
+                self.not_equal.append(value)
+            else:
+                raise ValueError(
+                    "Unknown filter, field: {}, operation: {}, value: {}".format(field, ops, values)
+                )
+
+    def __call__(self, x):
+        keep = None
+
+        def update(keep_i):
+            return keep_i if keep is None else keep & keep_i
+
+        if self.lower is not None:
+            keep = update(x >= self.lower[0] if self.lower[1] else x > self.lower[0])
+        if self.upper is not None:
+            keep = update(x <= self.upper[0] if self.upper[1] else x < self.upper[0])
+        for value in self.equal:
+            keep = update(x == value)
+        for value in self.not_equal:
+            keep = update(x != value)
+        return keep
+
+
+def _in_mask(values, value):
+    if isinstance(values, pd.Categorical):
+        # lookup table over the category codes, the last entry is for missing values (code -1)
+        lut = np.zeros(len(values.categories) + 1, dtype=bool)
+        indices = values.categories.get_indexer(pd.Index(value))
+        lut[indices[indices >= 0]] = True
+        lut[-1] = any(pd.isna(v) for v in value)
+        return lut[values.codes]
+    return pd.Series(values, copy=False).isin(value).values
+
+
+def _get_column(adata, field):
+    """Returns the obs values or a sparse feature column (as a csc matrix) or dense feature
+    values."""
+    if field in adata.obs:
+        return adata.obs.get_values(field)
+    # first column when names are duplicated
+    values = adata.X[:, [adata.var.index.get_indexer_for([field])[0]]]
+    if scipy.sparse.issparse(values):
+        return values.tocsc()
+    return np.asarray(values).flatten()
+
+
+def _range_mask(values, predicate, n_obs):
+    if isinstance(values, pd.Categorical):
+        values = pd.Series(values)
+    if scipy.sparse.issparse(values):
+        # evaluate the predicate on the stored values only, other rows have the value 0
+        keep = np.full(n_obs, bool(predicate(0)), dtype=bool)
+        keep[values.indices] = predicate(values.data)
+        return keep
+    keep = predicate(values)
+    return keep.values if isinstance(keep, pd.Series) else np.asarray(keep)
+
+
+class FilterPlan:
+    """A data filter compiled into a list of terms that are evaluated to boolean masks.
+
+    Each term is a tuple of kind (points, index, ranges, bitmap, in, or range), field, argument, and
+    invert.
+    """
+
+    def __init__(self, terms, combine="and"):
+        self.terms = terms
+        self.combine = combine
+
+    def fields(self):
+        return [term[1] for term in self.terms if term[0] in ("in", "range")]
+
+    def evaluate(self, adata):
+        """Returns a boolean mask over the rows of adata or None if there are no terms."""
+        n_obs = adata.shape[0]
+        keep_expr = None
+        for kind, field, arg, invert in self.terms:
+            if kind == "points" or kind == "index":
+                keep = np.zeros(n_obs, dtype=bool)
+                indices = np.asarray(arg, dtype=np.int64)
+                if kind == "points":  # ignore points that are out of range
+                    indices = indices[(indices >= 0) & (indices < n_obs)]
+                keep[indices] = True
+            elif kind == "ranges":
+                ranges = np.clip(arg, 0, n_obs)
+                ranges = ranges[ranges[:, 0] < ranges[:, 1]]
+                # +1 at each start and -1 at each stop, rows covered by a range have a positive sum
+                delta = np.zeros(n_obs + 1, dtype=np.int64)
+                np.add.at(delta, ranges[:, 0], 1)
+                np.add.at(delta, ranges[:, 1], -1)
+                keep = np.cumsum(delta[:-1]) > 0
+            elif kind == "bitmap":
+                keep = np.unpackbits(arg, count=n_obs).astype(bool)
+            elif kind == "in":
+                keep = _in_mask(_get_column(adata, field), arg)
+            else:
+                keep = _range_mask(_get_column(adata, field), arg, n_obs)
+            if invert:
+                keep = ~keep
+            if keep_expr is None:
+                keep_expr = keep
+            elif self.combine == "and":
+                keep_expr &= keep
+            else:
+                keep_expr |= keep
+        return keep_expr
+
+
+def _selection_term(kind, field, value, invert):
+    """Point selections are a list of indices, a dict with ranges (flattened list of half-open
+    start, stop pairs), or a dict with bitmap (base64 encoded numpy.packbits of the mask)."""
+    if isinstance(value, dict):
+        if "ranges" in value:
+            return (
+                "ranges",
+                field,
+                np.asarray(value["ranges"], dtype=np.int64).reshape(-1, 2),
+                invert,
+            )
+        if "bitmap" in value:
+            bitmap = np.frombuffer(base64.b64decode(value["bitmap"]), dtype=np.uint8)
+            return "bitmap", field, bitmap, invert
+    return kind, field, value, invert
+
+
+def compile_filter(data_filter):
+    """Compiles a data filter (dict with filters and combine) into a FilterPlan."""
+    terms = []
+    combine = "and"
+    if data_filter is not None:
+        combine = data_filter.get("combine", "and")
+        for filter_obj in data_filter.get("filters", []):
+            field = filter_obj["field"]
+            op = filter_obj["operation"]
+            value = filter_obj["value"]
+            invert = filter_obj.get("invert", False)
+            if isinstance(field, dict):  # selection box
+                if "points" in value:
+                    value = value["points"]
+                elif "ranges" not in value and "bitmap" not in value:
+                    continue
+                terms.append(_selection_term("points", field["name"], value, invert))
+            elif field == "__index":
+                terms.append(_selection_term("index", field, value, invert))
+            elif op == "in":
+                terms.append(("in", field, value, invert))
+            else:  # array of operations e.g. >, <
+                terms.append(("range", field, RangePredicate(field, op, value), invert))
+    return FilterPlan(terms, combine)
@@ -1,14 +1,52 @@
+import os
 import json
+import weakref
 
 import h5py
 import numpy as np
 
 from cirrocumulus.abstract_backed_dataset import AbstractBackedDataset
+from cirrocumulus.envir import CIRRO_H5_CHUNK_CACHE_BYTES
+from cirrocumulus.obsm_mmap import memmap_h5_dataset
+
+
+# maximum number of bytes read at once when slicing dense arrays
+max_block_bytes = 64 * 1024 * 1024
+
+
+def read_dense_columns_by_chunk(X, ordered, order):
+    """Reads columns from a chunked dataset, reading each touched chunk once.
+
+    Requested columns are grouped by chunk and each group is read in row blocks.
+
+    :param X: Chunked h5py dataset
+    :param ordered: Sorted column positions
+    :param order: Position in the result for each column in ordered
+    """
+    n_rows = X.shape[0]
+    result = np.empty((n_rows, len(ordered)), dtype=X.dtype)
+    if len(ordered) == 0:
+        return result
+    chunk_rows, chunk_cols = X.chunks
+    group_starts = np.flatnonzero(np.diff(ordered // chunk_cols)) + 1
+    for group in np.split(np.arange(len(ordered)), group_starts):
+        columns = ordered[group]
+        start, end = columns[0], columns[-1] + 1
+        row_block = max(1, max_block_bytes // (X.dtype.itemsize * (end - start)))
+        row_block = max(chunk_rows, row_block // chunk_rows * chunk_rows)
+        for row_start in range(0, n_rows, row_block):
+            row_end = min(n_rows, row_start + row_block)
+            block = X[row_start:row_end, start:end]
+            result[row_start:row_end, order[group]] = block[:, columns - start]
+    return result
 
 
 class H5ADDataset(AbstractBackedDataset):
     def __init__(self):
         super().__init__()
+        # group -> underlying file object. HDF5 holds a reference to the file object until all
+        # objects in the file are closed, so dropping the group does not close it while in use.
+        self._files = weakref.WeakKeyDictionary()
 
     def get_suffixes(self):
         return ["h5ad"]
@@ -17,17 +55,44 @@ class H5ADDataset(AbstractBackedDataset):
         return isinstance(node, h5py.Group)
 
     def open_group(self, filesystem, path):
-        return h5py.File(filesystem.open(path, "rb"), mode="r")
+        kwargs = {}
+        if os.environ.get(CIRRO_H5_CHUNK_CACHE_BYTES) is not None:
+            kwargs["rdcc_nbytes"] = int(os.environ[CIRRO_H5_CHUNK_CACHE_BYTES])
+        f = filesystem.open(path, "rb")
+        try:
+            group = h5py.File(f, mode="r", **kwargs)
+        except Exception:
+            f.close()
+            raise
+        self._files[group] = f
+        return group
+
+    def close_group(self, group):
+        f = self._files.pop(group, None)
+        group.close()
+        if f is not None:
+            f.close()
 
     def slice_dense_array(self, X, indices):
+        n_rows, n_cols = X.shape
+        if isinstance(indices, slice):
+            indices = np.arange(n_cols)[indices]
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + n_cols, indices)
         # indexing elements must be in increasing order
-        order = np.argsort(indices)
+        order = np.argsort(indices, kind="stable")
         ordered = indices[order]
-        rev_order = np.argsort(order)
-        value = X[:, ordered]
+        if X.chunks is None:  # HDF5 reads contiguous column selections efficiently
+            rev_order = np.argsort(order)
+            value = X[:, ordered]
+            return value[:, rev_order]
+        return read_dense_columns_by_chunk(X, ordered, order)
 
-        return value[:, rev_order]
+    def read_obsm(self, filesystem, path, group, key, dataset_info):
+        node = group[key]
+        m = memmap_h5_dataset(filesystem, path, node, dataset_info)
+        return m if m is not None else node[...]
 
     def get_schema(self, filesystem, path):
-        with h5py.File(filesystem.open(path, "rb"), mode="r") as f:
-            return json.loads(str(f["uns"]["cirro-schema"][...].astype(str)))
+        f = self.get_group(filesystem, path)
+        return json.loads(str(f["uns"]["cirro-schema"][...].astype(str)))
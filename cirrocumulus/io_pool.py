@@ -0,0 +1,78 @@
+import os
+import threading
+import concurrent.futures
+
+from fsspec.implementations.local import LocalFileSystem
+
+from cirrocumulus.envir import CIRRO_IO_MAX_WORKERS
+
+
+_lock = threading.RLock()
+_protocol_to_executor = {}
+_in_flight = {}  # key -> future
+
+
+def get_protocol(filesystem):
+    protocol = filesystem.protocol
+    return protocol if isinstance(protocol, str) else protocol[0]
+
+
+def is_local(filesystem):
+    return isinstance(filesystem, LocalFileSystem)
+
+
+def get_max_workers(protocol):
+    """Returns the maximum number of concurrent reads for protocol, configured with
+    CIRRO_IO_MAX_WORKERS_<PROTOCOL> (e.g. CIRRO_IO_MAX_WORKERS_GS) or CIRRO_IO_MAX_WORKERS."""
+    value = os.environ.get(CIRRO_IO_MAX_WORKERS + "_" + protocol.upper())
+    if value is None:
+        value = os.environ.get(CIRRO_IO_MAX_WORKERS, "12")
+    return int(value)
+
+
+def get_executor(filesystem):
+    """Returns the executor used for reads from filesystem, one per protocol so that a slow store
+    does not hold up reads from other stores."""
+    protocol = get_protocol(filesystem)
+    with _lock:
+        executor = _protocol_to_executor.get(protocol)
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=get_max_workers(protocol), thread_name_prefix="cirro-io-" + protocol
+            )
+            _protocol_to_executor[protocol] = executor
+    return executor
+
+
+def submit(filesystem, key, fn, *args, **kwargs):
+    """Submits fn to the executor for filesystem. If a read with the same key is in flight, returns
+    its future instead of submitting a duplicate read.
+
+    :param filesystem: The filesystem fn reads from
+    :param key: Hashable key identifying the read or None to always submit
+    """
+    if key is None:
+        return get_executor(filesystem).submit(fn, *args, **kwargs)
+    key = (get_protocol(filesystem), key)
+    with _lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = get_executor(filesystem).submit(fn, *args, **kwargs)
+            _in_flight[key] = future
+            future.add_done_callback(lambda f: _remove_in_flight(key, f))
+    return future
+
+
+def _remove_in_flight(key, future):
+    with _lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def read_bytes(filesystem, path):
+    """Reads the entire file at path. Uses a single request on async filesystems (e.g. s3, gcs, http)
+    which share a connection pool across reads."""
+    if getattr(filesystem, "async_impl", False):
+        return filesystem.cat_file(path)
+    with filesystem.open(path, "rb") as f:
+        return f.read()
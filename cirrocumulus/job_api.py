@@ -2,6 +2,7 @@ import os
 import math
 import logging
 
+import numpy as np
 import pandas as pd
 
 from cirrocumulus.diff_exp import DE
@@ -139,13 +140,12 @@ def get_obs(dataset_api, dataset, dataset_info, params):
                 filter_names[i] = "group_" + str(i + 1)
         obs = pd.DataFrame(index=pd.RangeIndex(dataset_info["shape"][0]).astype(str))
         obs_field = "selection"  # order of categories needs to match filter names
-        # obs[obs_field] = "3"
         masks, _ = get_mask(dataset_api, dataset, dataset_info, filters)
+        codes = np.full(len(obs), -1, dtype=np.int8)
         for i in range(2):
-            obs.loc[masks[i], obs_field] = filter_names[i]
-        obs[obs_field] = (
-            obs[obs_field].astype("category").cat.as_ordered().cat.reorder_categories(filter_names)
-        )
+            if masks[i] is not None:
+                codes[masks[i]] = i
+        obs[obs_field] = pd.Categorical.from_codes(codes, filter_names, ordered=True)
         return obs, obs_field
 
 
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cirrocumulus.abstract_dataset import AbstractDataset
+from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY
+from cirrocumulus.envir import CIRRO_GROUP_POOL_SIZE
+from cirrocumulus.feature_cache import get_cache_key, get_columns
+from cirrocumulus.jsonl_io import JsonlReader
+from cirrocumulus.lite_adata import LiteAnnData
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.obs_cache import get_obs_columns
+from cirrocumulus.sparse_util import csc_from_columns
+
+
+# process-wide pool of open jsonl files, path -> JsonlReader. Evicted readers are not closed as
+# other threads may still be reading from them, the file is closed when the reader is collected.
+reader_pool = LRUCache(max_size=int(os.environ.get(CIRRO_GROUP_POOL_SIZE, "32")))
+
+
+def read_columns(reader, names, n_rows):
+    """Decodes the features in names and returns a CSC matrix or a dense array."""
+    columns = []
+    is_sparse = False
+    for name in names:
+        value = reader.read_key(name)
+        if "index" in value:
+            is_sparse = True
+            columns.append(
+                (
+                    np.asarray(value["index"], dtype=np.int32),
+                    np.asarray(value["value"], dtype=np.float32),
+                )
+            )
+        else:
+            columns.append(np.asarray(value["value"], dtype=np.float32))
+    if is_sparse:
+        return csc_from_columns(columns, n_rows, np.float32)
+    if len(columns) == 0:
+        return np.zeros((n_rows, 0), dtype=np.float32)
+    return np.column_stack(columns)
+
+
+def read_obs(reader, key):
+    value = reader.read_key(key)
+    if isinstance(value, dict):  # categorical
+        return pd.Categorical.from_codes(value["values"], value["categories"])
+    values = pd.Series(value).values
+    if key == "index":
+        values = values.astype(str)
+    return values
+
+
+class JsonlDataset(AbstractDataset):
+    def __init__(self):
+        super().__init__()
+
+    def get_suffixes(self):
+        return ["jsonl"]
+
+    def get_reader(self, filesystem, path):
+        """Returns the reader for path, reusing an open reader from the pool when possible."""
+        reader = reader_pool.get(path)
+        if reader is None:
+            reader = JsonlReader(path, filesystem)
+            pooled_reader = reader_pool.setdefault(path, reader)
+            if pooled_reader is not reader:  # opened concurrently by another thread
+                reader.close()
+            reader = pooled_reader
+        return reader
+
+    def invalidate(self, path):
+        reader_pool.pop(path)
+
+    def get_result(self, filesystem, path, dataset, result_id):
+        return os.path.join(os.path.splitext(path)[0], "uns", result_id + ".json")
+
+    def get_schema(self, filesystem, path):
+        return self.get_reader(filesystem, path).read_key("schema")
+
+    def get_X(self, reader, var_ids, keys, n_rows, cache_key=None, prefix=""):
+        if len(keys) == 1 and isinstance(keys[0], slice):  # special case if slice specified
+            keys = var_ids[keys[0]]
+            cache_key = None
+
+        def read_fn(missing):
+            return read_columns(reader, [prefix + key for key in missing], n_rows)
+
+        if cache_key is not None:
+            X = get_columns(cache_key, keys, read_fn, n_rows)
+        else:
+            X = read_fn(keys)
+        return X, pd.DataFrame(index=keys)
+
+    def read_dataset(self, filesystem, path, keys=None, dataset=None, dataset_info=None):
+        keys = keys.copy()
+        X_keys = keys.pop("X", [])
+        obs_keys = keys.pop("obs", [])
+        basis_keys = keys.pop("basis", [])
+        keys.pop("module", [])
+        # additional keys belong to layers
+        X = None
+        obs = None
+        var = None
+        obsm = {}
+        if dataset_info is None:
+            dataset_info = self.get_dataset_info(filesystem, path)
+        reader = self.get_reader(filesystem, path)
+        n_rows = dataset_info["shape"][0]
+        layers = {}
+        for layer_key in keys.keys():
+            X_layer, var_layer = self.get_X(
+                reader,
+                dataset_info["var"],
+                keys[layer_key],
+                n_rows,
+                get_cache_key(path, dataset_info, "layers/" + layer_key),
+                layer_key + "/",
+            )
+            layers[layer_key] = LiteAnnData(X=X_layer, var=var_layer)
+        if len(X_keys) > 0:
+            X, var = self.get_X(
+                reader, dataset_info["var"], X_keys, n_rows, get_cache_key(path, dataset_info, "X")
+            )
+        if len(obs_keys) > 0:
+            key_to_values = get_obs_columns(
+                path,
+                dataset_info,
+                obs_keys,
+                lambda keys: {key: read_obs(reader, key) for key in keys},
+            )
+            obs = {key: key_to_values[key] for key in obs_keys}
+        for key in basis_keys:
+            value = reader.read_key(key)
+            obsm[key] = np.column_stack([np.asarray(v, dtype=np.float32) for v in value.values()])
+        adata = LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=n_rows)
+        adata.uns[ADATA_LAYERS_UNS_KEY] = layers
+        return adata
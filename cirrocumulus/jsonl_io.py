@@ -1,19 +1,23 @@
 import os
 import gzip
 import json
+import mmap
 import logging
 
 import numpy as np
+import fsspec
 import pandas as pd
 import scipy.sparse
 from pandas import CategoricalDtype
 
+from cirrocumulus.io_pool import is_local
 from cirrocumulus.util import dumps
 
 
 logger = logging.getLogger("cirro")
 
 LINE_END = "\n".encode("UTF-8")
+GZIP_MAGIC = b"\x1f\x8b"
 
 
 def write_jsonl(d, f, name, index, compress=False):
@@ -29,36 +33,69 @@ def write_jsonl(d, f, name, index, compress=False):
     f.write(LINE_END)
 
 
-def read_adata_jsonl(path, keys):
-    with open(path + ".idx.json", "rt") as f:
-        index = json.load(f)
-    compress = False
+class JsonlReader:
+    """Reads entries from a jsonl file written by save_dataset_jsonl.
+
+    The byte-offset index is parsed once. Local files are memory-mapped, other files are read with
+    range requests.
+    """
+
+    def __init__(self, path, filesystem):
+        with filesystem.open(path + ".idx.json", "rt") as f:
+            self.index = json.load(f)["index"]
+        self.path = path
+        self.filesystem = filesystem
+        self._buffer = None
+        if is_local(filesystem):
+            # mmap keeps its own file descriptor and unmaps when the reader is garbage collected
+            with open(fsspec.core.strip_protocol(path), "rb") as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, key):
+        return key in self.index
 
-    def read_key(f, index_key):
-        start, end = index["index"][index_key]
-        f.seek(start)
-        b = f.read(end - start + 1)
-        if compress:
+    def read_key(self, key):
+        start, end = self.index[key]
+        if self._buffer is not None:
+            b = self._buffer[start : end + 1]
+        else:
+            b = self.filesystem.cat_file(self.path, start=start, end=end + 1)
+        if b[:2] == GZIP_MAGIC:
             b = gzip.decompress(b)
-        return json.loads(b.decode("UTF-8"))
+        return json.loads(b)[key]
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
 
-    df = pd.DataFrame()
-    with open(path, "rb") as f:
-        shape = read_key("schema")["shape"]
+
+def read_adata_jsonl(path, keys, filesystem=None):
+    if filesystem is None:
+        filesystem = fsspec.filesystem("file")
+    reader = JsonlReader(path, filesystem)
+    try:
+        df = pd.DataFrame()
+        shape = reader.read_key("schema")["shape"]
         for key in keys:
-            value = read_key(f, key)
+            value = reader.read_key(key)
             if isinstance(value, dict):
                 if "index" in value:
                     array = np.zeros(shape[0])
                     array[value["index"]] = value["value"]
                     df[key] = pd.arrays.SparseArray(array)
+                elif "value" in value:
+                    df[key] = value["value"]
+                elif "categories" in value:
+                    df[key] = pd.Categorical.from_codes(value["values"], value["categories"])
                 else:
                     # obsm
                     for obsm_index in value:
                         df[obsm_index] = value[obsm_index]
             else:
                 df[key] = value
-
+    finally:
+        reader.close()
     return df
 
 
@@ -66,7 +103,8 @@ def save_dataset_jsonl(dataset, schema, output_dir, base_name, filesystem):
     compress = False
     index = {}  # key to byte start-end
     filesystem.makedirs(output_dir, exist_ok=True)
-    jsonl_path = os.path.join(output_dir, base_name)
+    # results are saved to output_dir, the jsonl file and index are written to base_name
+    jsonl_path = base_name
     with filesystem.open(jsonl_path, "wb") as f:
         save_adata_X(dataset, f, index, compress)
         save_data_obs(dataset, f, index, compress)
@@ -75,9 +113,7 @@ def save_dataset_jsonl(dataset, schema, output_dir, base_name, filesystem):
             save_adata_X(dataset, f, index, compress, layer)
         write_jsonl(schema, f, "schema", index)
 
-    with filesystem.open(
-        os.path.join(output_dir, base_name + ".idx.json"), "wt"
-    ) as f:  # save index
+    with filesystem.open(jsonl_path + ".idx.json", "wt") as f:  # save index
         # json.dump(result, f)
         result = dict(index=index, file=os.path.basename(jsonl_path))
         f.write(dumps(result, double_precision=2, orient="values"))
@@ -34,6 +34,9 @@ def configure_app(app, list_of_dataset_paths, spatial_directories, marker_paths)
         dataset_api.add(ZarrDataset())
     except ModuleNotFoundError:
         pass
+    from cirrocumulus.jsonl_dataset import JsonlDataset
+
+    dataset_api.add(JsonlDataset())
     app.config[CIRRO_AUTH] = NoAuth()
     os.environ[CIRRO_JOB_TYPE + "de"] = "cirrocumulus.job_api.run_de"
     os.environ[CIRRO_JOB_TYPE + "ot_trajectory"] = "cirrocumulus.job_api.run_ot_trajectory"
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY, ADATA_MODULE_UNS_KEY
+from cirrocumulus.var_index import get_var_positions
+
+
+class Obs:
+    """Obs columns stored as a dict of arrays that can be accessed like a data frame.
+
+    Row ids are integer positions in the dataset. String ids are only created when index is
+    accessed.
+    """
+
+    def __init__(self, columns=None, n_obs=None, positions=None):
+        self._columns = {}
+        if columns is not None:
+            for key, values in columns.items():
+                self[key] = values
+        self._positions = positions
+        self._index = None
+        if n_obs is None:
+            if positions is not None:
+                n_obs = len(positions)
+            elif len(self._columns) > 0:
+                n_obs = len(next(iter(self._columns.values())))
+            else:
+                n_obs = 0
+        self.n_obs = n_obs
+
+    @property
+    def positions(self):
+        """Row positions in the dataset."""
+        return self._positions if self._positions is not None else np.arange(self.n_obs)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = pd.Index(self.positions.astype(str))
+        return self._index
+
+    @property
+    def columns(self):
+        return pd.Index(list(self._columns.keys()))
+
+    def keys(self):
+        return self._columns.keys()
+
+    def get_values(self, key):
+        """Returns the array for key without wrapping it in a Series."""
+        return self._columns[key]
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return self.n_obs
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, pd.Index)):
+            return pd.DataFrame({k: self[k] for k in key})
+        return pd.Series(self._columns[key], name=key, copy=False)
+
+    def __setitem__(self, key, values):
+        if isinstance(values, pd.Series):
+            values = values.values
+        self._columns[key] = values
+
+    def subset(self, rows):
+        return Obs(
+            {key: values[rows] for key, values in self._columns.items()},
+            n_obs=len(rows),
+            positions=self.positions[rows],
+        )
+
+    def to_df(self):
+        return pd.DataFrame(self._columns, index=self.index)
+
+
+class LiteAnnData:
+    """Minimal AnnData-like container returned by dataset providers.
+
+    Holds X (sparse, dense, or None), var (data frame indexed by feature), obs (Obs), obsm (dict of
+    arrays), and uns (dict that can hold layers and modules).
+    """
+
+    def __init__(self, X=None, obs=None, var=None, obsm=None, uns=None, n_obs=None, positions=None):
+        self.X = X
+        self.var = var if var is not None else pd.DataFrame(index=pd.Index([], dtype=object))
+        self.obsm = obsm if obsm is not None else {}
+        self.uns = uns if uns is not None else {}
+        if not isinstance(obs, Obs):
+            if n_obs is None and positions is None:
+                if X is not None:
+                    n_obs = X.shape[0]
+                elif len(self.obsm) > 0:
+                    n_obs = next(iter(self.obsm.values())).shape[0]
+            obs = Obs(obs, n_obs=n_obs, positions=positions)
+        self.obs = obs
+
+    @property
+    def shape(self):
+        return self.obs.n_obs, len(self.var.index)
+
+    @property
+    def obs_names(self):
+        return self.obs.index
+
+    @property
+    def var_names(self):
+        return self.var.index
+
+    def __getitem__(self, rows):
+        """Returns the rows specified by a boolean mask, positions, or slice."""
+        if isinstance(rows, slice):
+            rows = np.arange(self.obs.n_obs)[rows]
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        X = self.X
+        if X is not None:
+            X = X[rows]
+        uns = {}
+        for key, value in self.uns.items():
+            if isinstance(value, LiteAnnData):
+                value = value[rows]
+            elif isinstance(value, dict):
+                value = {k: v[rows] if isinstance(v, LiteAnnData) else v for k, v in value.items()}
+            uns[key] = value
+        return LiteAnnData(
+            X=X,
+            obs=self.obs.subset(rows),
+            var=self.var,
+            obsm={key: value[rows] for key, value in self.obsm.items()},
+            uns=uns,
+        )
+
+    def _select_var(self, var_keys):
+        if len(var_keys) == 0 or self.X is None:
+            return LiteAnnData(n_obs=self.obs.n_obs)
+        indices = get_var_positions(self.var.index, list(dict.fromkeys(var_keys)))
+        X = self.X[:, indices]
+        if isinstance(X, np.ndarray):
+            # keep the memory layout so that reductions give the same results as reading the keys
+            X = np.require(X, requirements="C" if self.X.flags.c_contiguous else "F")
+        return LiteAnnData(X=X, var=self.var.iloc[indices])
+
+    def select(self, keys):
+        """Returns the columns specified by keys (dict passed to read_dataset) of data read for a
+        superset of keys."""
+        keys = keys.copy()
+        obs_keys = keys.pop("obs", [])
+        basis_keys = keys.pop("basis", [])
+        module_keys = keys.pop("module", [])
+        adata = self._select_var(keys.pop("X", []))
+        adata.obs = Obs(
+            {key: self.obs.get_values(key) for key in obs_keys},
+            n_obs=self.obs.n_obs,
+            positions=self.obs._positions,
+        )
+        adata.obsm = {key: self.obsm[key] for key in basis_keys}
+        if len(module_keys) > 0:
+            adata.uns[ADATA_MODULE_UNS_KEY] = self.uns[ADATA_MODULE_UNS_KEY]._select_var(
+                module_keys
+            )
+        if ADATA_LAYERS_UNS_KEY in self.uns:
+            # remaining keys belong to layers
+            layers = self.uns[ADATA_LAYERS_UNS_KEY]
+            adata.uns[ADATA_LAYERS_UNS_KEY] = {
+                layer: layers[layer]._select_var(layer_keys) for layer, layer_keys in keys.items()
+            }
+        return adata
+
+    def get_X_column(self, name):
+        """Returns the values for feature name as a 1-d array."""
+        # first column when names are duplicated
+        values = self.X[:, self.var.index.get_indexer_for([name])[0]]
+        if scipy.sparse.issparse(values):
+            values = values.toarray()
+        return np.asarray(values).flatten()
+
+    def to_df(self, var_keys=(), obs_keys=()):
+        """Returns a data frame with the specified features and obs columns."""
+        d = {}
+        for key in var_keys:
+            d[key] = self.get_X_column(key)
+        for key in obs_keys:
+            d[key] = self.obs.get_values(key)
+        return pd.DataFrame(d)
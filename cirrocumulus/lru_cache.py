@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe least recently used cache.
+
+    :param max_size: Maximum total size of cached values. 0 disables caching.
+    :param size_fn: Function that returns the size of a value. Each value has size 1 when None.
+    :param on_evict: Function called with the key and value of entries removed from the cache.
+    """
+
+    def __init__(self, max_size, size_fn=None, on_evict=None):
+        self.max_size = max_size
+        self.size_fn = size_fn
+        self.on_evict = on_evict
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Adds value to the cache, replacing any existing value for key.
+
+        Returns True if the value was cached.
+        """
+        size = self.size_fn(value) if self.size_fn is not None else 1
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+                if previous[0] is not value:
+                    evicted.append((key, previous[0]))
+            cached = size <= self.max_size
+            if cached:
+                self._entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_size:
+                    evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                    self.size -= evicted_size
+                    self.evictions += 1
+                    evicted.append((evicted_key, evicted_value))
+        self._notify(evicted)
+        return cached
+
+    def setdefault(self, key, value):
+        """Returns the cached value for key if present, otherwise caches and returns value."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+            self.put(key, value)
+            return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+        if entry is not None:
+            self._notify([(key, entry[0])])
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, entry[0]) for key, entry in self._entries.items()]
+            self._entries.clear()
+            self.size = 0
+        self._notify(evicted)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_ratio=self.hits / requests if requests > 0 else 0.0,
+                evictions=self.evictions,
+                count=len(self._entries),
+                size=self.size,
+                max_size=self.max_size,
+            )
+
+    def _notify(self, evicted):
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
@@ -0,0 +1,51 @@
+import os
+import json
+
+import numpy as np
+
+from cirrocumulus.envir import CIRRO_MASK_CACHE_BYTES
+from cirrocumulus.lru_cache import LRUCache
+
+
+# (dataset path, dataset version, canonical filter) -> (mask packed to bits, number of rows, number
+# of selected rows)
+mask_cache = LRUCache(
+    max_size=int(os.environ.get(CIRRO_MASK_CACHE_BYTES, str(32 * 1024 * 1024))),
+    size_fn=lambda entry: entry[0].nbytes,
+)
+
+
+def get_filter_key(data_filter):
+    """Returns a string that is the same for equivalent filters, ignoring the order of filters and
+    of the values of 'in' filters. Filters resolved by data_filter_keys include field_type, so that
+    e.g. X/CD4 and obs/CD4 have different keys."""
+    filters = []
+    for filter_obj in data_filter.get("filters", []):
+        value = filter_obj["value"]
+        if filter_obj["operation"] == "in" and isinstance(value, list):
+            filter_obj = dict(filter_obj, value=sorted(value, key=str))
+        filters.append(json.dumps(filter_obj, sort_keys=True, separators=(",", ":"), default=str))
+    filters.sort()
+    return data_filter.get("combine", "and") + "[" + ",".join(filters) + "]"
+
+
+def _get_cache_key(path, dataset_info, data_filter):
+    if data_filter is None or dataset_info is None or dataset_info.get("version") is None:
+        return None
+    return path, dataset_info["version"], get_filter_key(data_filter)
+
+
+def get_cached_mask(path, dataset_info, data_filter):
+    """Returns a tuple of boolean mask and number of selected rows or None if not cached."""
+    key = _get_cache_key(path, dataset_info, data_filter)
+    entry = mask_cache.get(key) if key is not None else None
+    if entry is None:
+        return None
+    packed, n_obs, count = entry
+    return np.unpackbits(packed, count=n_obs).astype(bool), count
+
+
+def cache_mask(path, dataset_info, data_filter, mask):
+    key = _get_cache_key(path, dataset_info, data_filter)
+    if key is not None and mask is not None:
+        mask_cache.put(key, (np.packbits(mask), len(mask), int(mask.sum())))
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cirrocumulus.envir import CIRRO_OBS_CACHE_BYTES
+from cirrocumulus.lru_cache import LRUCache
+
+
+def obs_nbytes(values):
+    if isinstance(values, pd.Categorical):
+        return values.codes.nbytes + values.categories.memory_usage(deep=True)
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        return pd.Index(values).memory_usage(deep=True)
+    return values.nbytes
+
+
+# (dataset path, dataset version, obs key) -> decoded column. Categoricals are stored as codes plus
+# categories and string columns such as the index as fixed width bytes when possible.
+obs_cache = LRUCache(
+    max_size=int(os.environ.get(CIRRO_OBS_CACHE_BYTES, str(64 * 1024 * 1024))),
+    size_fn=obs_nbytes,
+)
+
+
+def encode_strings(values):
+    """Stores ASCII string arrays as fixed width bytes, which are much smaller than str objects.
+
+    Arrays that contain anything other than strings (e.g. None, NaN, or bool) are stored unchanged
+    so that they are returned as they were read.
+    """
+    if (
+        isinstance(values, np.ndarray)
+        and values.dtype.kind in ("O", "U")
+        and pd.api.types.infer_dtype(values, skipna=False) == "string"
+    ):
+        try:
+            return values.astype(bytes)
+        except (UnicodeEncodeError, ValueError, TypeError):
+            pass
+    return values
+
+
+def decode_strings(values):
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == "S":
+            return values.astype(str).astype(object)
+        values = values.view()  # cached arrays are shared by requests
+        values.flags.writeable = False
+    return values
+
+
+def get_obs_columns(path, dataset_info, keys, read_fn):
+    """Returns a dict of obs key to values, reading only keys that are not in the cache.
+
+    :param path: Dataset path
+    :param dataset_info: Dataset info, used for the dataset version. Columns are not cached if the
+        version is unknown
+    :param keys: List of obs keys
+    :param read_fn: Function that takes a list of keys and returns a dict of key to values
+    """
+    if dataset_info is None or dataset_info.get("version") is None:
+        return read_fn(keys)
+    cache_key = (path, dataset_info["version"])
+    key_to_values = {}
+    missing = []
+    for key in keys:
+        values = obs_cache.get(cache_key + (key,))
+        if values is None:
+            missing.append(key)
+        else:
+            key_to_values[key] = decode_strings(values)
+    if len(missing) > 0:
+        for key, values in read_fn(missing).items():
+            if isinstance(values, pd.Series):
+                values = values.values
+            cached_values = encode_strings(values)
+            if cached_values is values and isinstance(values, np.ndarray):
+                cached_values = values.copy()  # callers can modify values
+            obs_cache.put(cache_key + (key,), cached_values)
+            key_to_values[key] = values
+    return key_to_values
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+from fsspec.core import strip_protocol
+
+from cirrocumulus.io_pool import is_local
+from cirrocumulus.lru_cache import LRUCache
+
+
+# (file path, dataset version, offset) -> read-only memory-mapped array. Pages are shared by all
+# processes through the OS page cache.
+mmap_pool = LRUCache(max_size=64)
+
+
+def get_npy_path(obsm_dir, key):
+    return obsm_dir + "/" + key + ".npy"
+
+
+def save_obsm_npy(adata, obsm_dir, filesystem, whitelist=None, dtype=None):
+    """Writes each embedding in adata.obsm to obsm_dir/<key>.npy so that it can be memory-mapped.
+    Nothing is written to filesystems that are not local as the files are only read locally.
+
+    :param dtype: Data type to store embeddings as. Defaults to the type in adata.obsm.
+    """
+    if not is_local(filesystem):
+        return
+    for name in adata.obsm.keys():
+        if whitelist is None or name in whitelist:
+            m = np.asarray(adata.obsm[name])
+            if m.ndim != 2 or m.dtype.kind not in "biuf":
+                continue
+            if dtype is not None:
+                m = m.astype(dtype, copy=False)
+            with filesystem.open(get_npy_path(obsm_dir, name), "wb") as f:
+                np.save(f, np.ascontiguousarray(m))
+
+
+def load_obsm_npy(filesystem, path, key, dataset_info):
+    """Returns a memory map of the embedding key written by save_obsm_npy or None if the dataset is
+    not on a local filesystem or does not have the file."""
+    if not is_local(filesystem):
+        return None
+    npy_path = get_npy_path(strip_protocol(path) + "/obsm", key)
+    cache_key = (npy_path, dataset_info.get("version"), 0)
+    m = mmap_pool.get(cache_key)
+    if m is None:
+        if not os.path.exists(npy_path):
+            return None
+        m = np.load(npy_path, mmap_mode="r")
+        if m.ndim != 2 or m.shape[0] != dataset_info["shape"][0]:  # stale file
+            return None
+        if cache_key[1] is not None:
+            mmap_pool.put(cache_key, m)
+    return m
+
+
+def memmap_h5_dataset(filesystem, path, node, dataset_info):
+    """Returns a memory map of an uncompressed, contiguous h5py dataset or None if the dataset
+    can not be mapped."""
+    if (
+        not is_local(filesystem)
+        or node.chunks is not None
+        or node.compression is not None
+        or node.dtype.kind not in "biuf"
+    ):
+        return None
+    offset = node.id.get_offset()
+    if offset is None:  # not allocated or stored externally
+        return None
+    local_path = strip_protocol(path)
+    cache_key = (local_path, dataset_info.get("version"), offset)
+    m = mmap_pool.get(cache_key)
+    if m is None:
+        m = np.memmap(local_path, dtype=node.dtype, mode="r", offset=offset, shape=node.shape)
+        if cache_key[1] is not None:
+            mmap_pool.put(cache_key, m)
+    return m
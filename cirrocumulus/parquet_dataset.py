@@ -7,36 +7,114 @@ import pandas as pd
 import pyarrow as pa
 import scipy.sparse
 import pyarrow.parquet as pq
-from anndata import AnnData
 
+from cirrocumulus import io_pool
 from cirrocumulus.abstract_dataset import AbstractDataset
 from cirrocumulus.anndata_util import ADATA_LAYERS_UNS_KEY
+from cirrocumulus.feature_cache import get_cache_key, get_columns
+from cirrocumulus.io_pool import read_bytes
+from cirrocumulus.lite_adata import LiteAnnData
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.obs_cache import get_obs_columns
+from cirrocumulus.obsm_mmap import load_obsm_npy
+from cirrocumulus.util import get_version
 
 
-max_workers = min(12, pa.cpu_count())
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+# (file path, dataset version) -> parquet file metadata
+metadata_cache = LRUCache(max_size=256)
 
 
 def read_table(path, filesystem, columns=None):
     return pq.read_table(path, filesystem=filesystem, columns=columns, use_threads=False)
 
 
+def read_small_table(path, filesystem, columns=None):
+    if getattr(filesystem, "async_impl", False):
+        # fetch the whole object in one request instead of reading the footer and columns separately
+        return pq.read_table(
+            pa.BufferReader(read_bytes(filesystem, path)), columns=columns, use_threads=False
+        )
+    return read_table(path, filesystem, columns)
+
+
 def read_tables(paths, filesystem, columns=None):
     futures = []
+    key_columns = tuple(columns) if columns is not None else None
     for path in paths:
-        future = executor.submit(read_table, path, filesystem=filesystem, columns=columns)
+        future = io_pool.submit(
+            filesystem,
+            ("table", path, key_columns),
+            read_small_table,
+            path,
+            filesystem,
+            columns,
+        )
         futures.append(future)
     concurrent.futures.wait(futures)
     return futures
 
 
-def get_matrix(futures, shape=None):
+def read_row_groups(path, row_groups, filesystem, version_key=None):
+    """Reads row groups from one file using a single file handle.
+
+    :return: List of tables, one per row group
+    """
+    order = np.argsort(row_groups, kind="stable")
+    metadata_key = (path,) + version_key if version_key is not None else None
+    metadata = metadata_cache.get(metadata_key) if metadata_key is not None else None
+    with filesystem.open(path, "rb") as f:
+        parquet_file = pq.ParquetFile(f, metadata=metadata)
+        if metadata is None and metadata_key is not None:
+            metadata_cache.put(metadata_key, parquet_file.metadata)
+        sorted_row_groups = [row_groups[i] for i in order]
+        table = parquet_file.read_row_groups(sorted_row_groups, use_threads=False)
+        tables = [None] * len(row_groups)
+        offset = 0
+        for i, row_group in zip(order, sorted_row_groups):
+            num_rows = parquet_file.metadata.row_group(row_group).num_rows
+            tables[i] = table.slice(offset, num_rows)
+            offset += num_rows
+    return tables
+
+
+def read_packed_tables(keys, node_path, packed, filesystem, version_key=None):
+    """Reads features stored in the packed layout (many features per file, one row group per
+    feature), reading each file once.
+
+    :return: List of tables in the same order as keys
+    """
+    file_to_positions = {}
+    for i in range(len(keys)):
+        file_index, row_group = packed["features"][keys[i]]
+        file_to_positions.setdefault(file_index, []).append((i, row_group))
+    futures = []
+    for file_index, positions in file_to_positions.items():
+        path = node_path + "/" + packed["files"][file_index]
+        row_groups = [p[1] for p in positions]
+        future = io_pool.submit(
+            filesystem,
+            ("row_groups", path, tuple(row_groups)),
+            read_row_groups,
+            path,
+            row_groups,
+            filesystem,
+            version_key,
+        )
+        futures.append(future)
+    tables = [None] * len(keys)
+    for future, positions in zip(futures, file_to_positions.values()):
+        for p, table in zip(positions, future.result()):
+            tables[p[0]] = table
+    return tables
+
+
+def get_matrix(tables, shape=None):
     data = []
     row = []
     col = []
     is_sparse = None
-    for i in range(len(futures)):
-        t = futures[i].result()
+    for i in range(len(tables)):
+        t = tables[i]
         if i == 0:
             is_sparse = "index" in t.column_names
         if is_sparse:
@@ -51,21 +129,32 @@ def get_matrix(futures, shape=None):
         col = np.concatenate(col)
         # X = scipy.sparse.coo_matrix((data, (row, col)), shape=(shape[0], len(keys))).to_csc()
         # X = scipy.sparse.csr_matrix((data, (row, col)), shape=(shape[0], len(var_keys)))
-        X = scipy.sparse.csc_matrix((data, (row, col)), shape=(shape[0], len(futures)))
+        X = scipy.sparse.csc_matrix((data, (row, col)), shape=(shape[0], len(tables)))
     else:
         X = np.array(data).T
     return X
 
 
-def read_matrix(keys, node_path, dataset_info, filesystem, shape):
+def read_matrix(keys, node_path, dataset_info, filesystem, shape, cache_key=None, packed=None):
+    def read_keys(keys):
+        if packed is not None:
+            version_key = (dataset_info["version"],) if "version" in dataset_info else None
+            return get_matrix(
+                read_packed_tables(keys, node_path, packed, filesystem, version_key), shape
+            )
+        paths = [node_path + "/" + key + ".parquet" for key in keys]
+        return get_matrix([future.result() for future in read_tables(paths, filesystem)], shape)
+
     if len(keys) == 1 and isinstance(
         keys[0], slice
     ):  # special case if slice specified for performance
         get_item_x = keys[0]
         keys = dataset_info["var"][get_item_x]
-
-    paths = [node_path + "/" + key + ".parquet" for key in keys]
-    X = get_matrix(read_tables(paths, filesystem), shape)
+        X = read_keys(keys)
+    elif cache_key is not None:
+        X = get_columns(cache_key, keys, read_keys, shape[0])
+    else:
+        X = read_keys(keys)
     var = pd.DataFrame(index=keys)
     return X, var
 
@@ -77,9 +166,18 @@ class ParquetDataset(AbstractDataset):
     def get_suffixes(self):
         return ["parquet", "pq", "cpq"]
 
-    def read_data_sparse(self, filesystem, path, keys, dataset=None):
-        dataset_info = self.get_dataset_info(filesystem, path)
+    def get_version(self, filesystem, path):
+        if not path.endswith(".parquet"):  # directory
+            version = get_version(filesystem, os.path.join(path, "index.json.gz"))
+            if version is not None:
+                return version
+        return super().get_version(filesystem, path)
+
+    def read_data_sparse(self, filesystem, path, keys, dataset=None, dataset_info=None):
+        if dataset_info is None:
+            dataset_info = self.get_dataset_info(filesystem, path)
         shape = dataset_info["shape"]
+        packed_index = dataset_info.get("packed") or {}
         X = None
         obs = None
         var = None
@@ -96,9 +194,10 @@ class ParquetDataset(AbstractDataset):
                 dataset_info=dataset_info,
                 filesystem=filesystem,
                 shape=shape,
+                cache_key=get_cache_key(path, dataset_info, "layers/" + layer_key),
+                packed=packed_index.get("layers/" + layer_key),
             )
-            adata_layer = AnnData(X=X_layer, var=var_layer)
-            layers[layer_key] = adata_layer
+            layers[layer_key] = LiteAnnData(X=X_layer, var=var_layer)
 
         if len(X_keys) > 0:
             X, var = read_matrix(
@@ -107,19 +206,30 @@ class ParquetDataset(AbstractDataset):
                 dataset_info=dataset_info,
                 filesystem=filesystem,
                 shape=shape,
+                cache_key=get_cache_key(path, dataset_info, "X"),
+                packed=packed_index.get("X"),
             )
         if len(obs_keys) > 0:
-            obs = pd.DataFrame()
             node_path = os.path.join(path, "obs")
-            paths = [node_path + "/" + key + ".parquet" for key in obs_keys]
-            futures = read_tables(paths, filesystem, columns=["value"])
-            for i in range(len(futures)):
-                df = futures[i].result().to_pandas()
-                obs[obs_keys[i]] = df["value"]
+
+            def read_obs(keys):
+                paths = [node_path + "/" + key + ".parquet" for key in keys]
+                futures = read_tables(paths, filesystem, columns=["value"])
+                return {keys[i]: futures[i].result().to_pandas()["value"] for i in range(len(keys))}
+
+            key_to_values = get_obs_columns(path, dataset_info, obs_keys, read_obs)
+            obs = {key: key_to_values[key] for key in obs_keys}
 
         if len(basis_keys) > 0:
+            read_basis_keys = []
+            for key in basis_keys:
+                m = load_obsm_npy(filesystem, path, key, dataset_info)
+                if m is not None:
+                    obsm[key] = m
+                else:
+                    read_basis_keys.append(key)
             node_path = os.path.join(path, "obsm")
-            paths = [node_path + "/" + key + ".parquet" for key in basis_keys]
+            paths = [node_path + "/" + key + ".parquet" for key in read_basis_keys]
             futures = read_tables(paths, filesystem)
             for i in range(len(futures)):
                 table = futures[i].result()
@@ -127,12 +237,8 @@ class ParquetDataset(AbstractDataset):
                 for c in table.column_names:
                     vals.append(table.column(c))
                 vals = np.array(vals).T
-                obsm[basis_keys[i]] = vals
-                if X is None:
-                    X = scipy.sparse.coo_matrix((vals.shape[0], 0))
-        if X is None and obs is None and len(obsm.keys()) == 0:
-            obs = pd.DataFrame(index=pd.RangeIndex(dataset_info["shape"][0]).astype(str))
-        adata = AnnData(X=X, obs=obs, var=var, obsm=obsm)
+                obsm[read_basis_keys[i]] = vals
+        adata = LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=shape[0])
         adata.uns[ADATA_LAYERS_UNS_KEY] = layers
         return adata
 
@@ -152,26 +258,58 @@ class ParquetDataset(AbstractDataset):
             for key in basis:
                 # 2d only
                 all_keys += ["{}_{}".format(key, 1), "{}_{}".format(key, 2)]
-        df = read_table(path, filesystem=filesystem, columns=all_keys)
+        df = read_table(path, filesystem=filesystem, columns=all_keys).to_pandas()
         if len(var_keys) > 0:
-            X = df[var_keys]
+            X = df[var_keys].values
+            var = pd.DataFrame(index=var_keys)
         if len(obs_keys) > 0:
-            obs = df[obs_keys]
+            obs = {key: df[key].values for key in obs_keys}
         if len(basis) > 0:
             for key in basis:
-                obsm[key] = df[["{}_{}".format(key, 1), "{}_{}".format(key, 2)]]
-        return AnnData(X=X, obs=obs, var=var, obsm=obsm)
+                obsm[key] = df[["{}_{}".format(key, 1), "{}_{}".format(key, 2)]].values
+        return LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=len(df))
 
-    def read_dataset(self, filesystem, path, keys=None, dataset=None):
+    def read_dataset(self, filesystem, path, keys=None, dataset=None, dataset_info=None):
         if keys is None:
             keys = {}
         # path is directory
         keys = keys.copy()
         if not path.endswith(".parquet"):
-            return self.read_data_sparse(filesystem, path, keys, dataset)
+            return self.read_data_sparse(filesystem, path, keys, dataset, dataset_info)
         # single parquet file containing everything
         return self.read_data_dense(filesystem, path, keys, dataset)
 
+    def read_stats_table(self, filesystem, path, name):
+        stats_path = os.path.join(path, "stats", name + ".parquet")
+        if not filesystem.exists(stats_path):
+            return None
+        table = read_table(stats_path, filesystem)
+        result = {}
+        for column_name in table.column_names:
+            column = table.column(column_name).combine_chunks()
+            if pa.types.is_fixed_size_list(column.type):  # 2-d array
+                result[column_name] = (
+                    column.flatten().to_numpy().reshape(len(column), column.type.list_size)
+                )
+            else:
+                result[column_name] = column.to_numpy(zero_copy_only=False)
+        return result
+
+    def get_dataset_info(self, filesystem, path):
+        if path.endswith(".parquet"):
+            return super().get_dataset_info(filesystem, path)
+        schema = super().get_schema(filesystem, os.path.join(path, "index.json.gz"))
+        var = schema["var"]
+        d = dict(
+            var=(
+                pd.Index(map(lambda x: x["id"], var)) if isinstance(var[0], dict) else pd.Index(var)
+            ),
+            shape=schema["shape"],
+        )
+        if "packed" in schema:
+            d["packed"] = schema["packed"]
+        return d
+
     def get_schema(self, filesystem, path):
         if path.endswith(".json") or path.endswith(".json.gz"):
             return super().get_schema(filesystem, path)
@@ -232,4 +370,6 @@ class ParquetDataset(AbstractDataset):
                 result["shape"] = (parquet_file.metadata.num_rows, len(result["var"]))
                 return result
         else:  # directory
-            return super().get_schema(filesystem, os.path.join(path, "index.json.gz"))
+            schema = super().get_schema(filesystem, os.path.join(path, "index.json.gz"))
+            schema.pop("packed", None)  # only needed by get_dataset_info
+            return schema
@@ -6,11 +6,15 @@ import pyarrow as pa
 import scipy.sparse
 import pyarrow.parquet as pq
 
+from cirrocumulus.obsm_mmap import save_obsm_npy
 from cirrocumulus.util import dumps
 
 
 logger = logging.getLogger("cirro")
 
+# number of features per file in the packed X layout
+features_per_file = 1000
+
 
 def write_pq(d, output_dir, name, filesystem, write_statistics=True, row_group_size=None):
     filesystem.makedirs(output_dir, exist_ok=True)
@@ -23,52 +27,117 @@ def write_pq(d, output_dir, name, filesystem, write_statistics=True, row_group_s
     )
 
 
-def save_dataset_pq(dataset, schema, output_directory, filesystem, whitelist):
+def save_dataset_pq(
+    dataset, schema, output_directory, filesystem, whitelist, packed=True, stats=None
+):
     X_dir = os.path.join(output_directory, "X")
     obs_dir = os.path.join(output_directory, "obs")
     obsm_dir = os.path.join(output_directory, "obsm")
     filesystem.makedirs(X_dir, exist_ok=True)
     filesystem.makedirs(obs_dir, exist_ok=True)
     filesystem.makedirs(obsm_dir, exist_ok=True)
-
+    schema = schema.copy()
+    packed_index = {}
+    if whitelist["x"]:
+        packed_index["X"] = save_adata_X(
+            dataset, X_dir, filesystem, whitelist=whitelist["x_keys"], packed=packed
+        )
+        for layer in dataset.layers.keys():
+            layer_dir = os.path.join(output_directory, "layers", layer)
+            filesystem.makedirs(layer_dir, exist_ok=True)
+            packed_index["layers/" + layer] = save_adata_X(
+                dataset, layer_dir, filesystem, layer, whitelist=whitelist["x_keys"], packed=packed
+            )
+    if whitelist["obs"]:
+        save_data_obs(dataset, obs_dir, filesystem, whitelist=whitelist["obs_keys"])
+    if whitelist["obsm"]:
+        save_data_obsm(dataset, obsm_dir, filesystem, whitelist=whitelist["obsm_keys"])
+    if stats is not None:
+        save_stats(stats, os.path.join(output_directory, "stats"), filesystem)
+    if packed:
+        schema["packed"] = packed_index
+    # write index last so that it is only present once the dataset is complete
     with filesystem.open(
         os.path.join(output_directory, "index.json.gz"), "wt", compression="gzip"
     ) as f:
         f.write(dumps(schema, double_precision=2, orient="values"))
-        if whitelist["x"]:
-            save_adata_X(dataset, X_dir, filesystem, whitelist=whitelist["x_keys"])
-            for layer in dataset.layers.keys():
-                layer_dir = os.path.join(output_directory, "layers", layer)
-                filesystem.makedirs(layer_dir, exist_ok=True)
-                save_adata_X(dataset, layer_dir, filesystem, layer, whitelist=whitelist["x_keys"])
-        if whitelist["obs"]:
-            save_data_obs(dataset, obs_dir, filesystem, whitelist=whitelist["obs_keys"])
-        if whitelist["obsm"]:
-            save_data_obsm(dataset, obsm_dir, filesystem, whitelist=whitelist["obsm_keys"])
-
-
-def save_adata_X(adata, X_dir, filesystem, layer=None, whitelist=None):
+
+
+def get_X_column(adata_X, j, is_sparse):
+    X = adata_X[:, j]
+    if is_sparse:
+        X = X.toarray().flatten()
+        indices = np.where(X != 0)[0]
+        return dict(index=indices, value=X[indices])
+    return dict(value=X)
+
+
+def save_adata_X(adata, X_dir, filesystem, layer=None, whitelist=None, packed=False):
+    """Saves one parquet file per feature or, if packed, many features per file with one row group
+    per feature.
+
+    :return: If packed, dict with files and a map of feature to [file index, row group index]
+    """
     adata_X = adata.X if layer is None else adata.layers[layer]
     names = adata.var.index
     is_sparse = scipy.sparse.issparse(adata_X)
+    if packed:
+        return save_adata_X_packed(adata_X, names, X_dir, filesystem, is_sparse, whitelist)
     output_dir = X_dir
     for j in range(adata_X.shape[1]):
         filename = names[j]
         if whitelist is None or filename in whitelist:
-            X = adata_X[:, j]
-            if is_sparse:
-                X = X.toarray().flatten()
-
-            if is_sparse:
-                indices = np.where(X != 0)[0]
-                values = X[indices]
-                write_pq(dict(index=indices, value=values), output_dir, filename, filesystem)
-            else:
-                write_pq(dict(value=X), output_dir, filename, filesystem)
+            write_pq(get_X_column(adata_X, j, is_sparse), output_dir, filename, filesystem)
             if j > 0 and (j + 1) % 1000 == 0:
                 logger.info("Wrote adata X {}/{}".format(j + 1, adata_X.shape[1]))
 
 
+def save_adata_X_packed(adata_X, names, X_dir, filesystem, is_sparse, whitelist):
+    files = []
+    features = {}
+    writer = None
+    arrow_schema = None
+    row_group = 0
+    for j in range(adata_X.shape[1]):
+        name = names[j]
+        if whitelist is not None and name not in whitelist:
+            continue
+        table = pa.Table.from_pydict(get_X_column(adata_X, j, is_sparse))
+        if arrow_schema is None:
+            arrow_schema = table.schema
+        if writer is None:
+            files.append("part-{:05d}.parquet".format(len(files)))
+            writer = pq.ParquetWriter(
+                os.path.join(X_dir, files[-1]), arrow_schema, filesystem=filesystem
+            )
+            row_group = 0
+        # one row group per feature
+        writer.write_table(table.cast(arrow_schema), row_group_size=max(1, len(table)))
+        features[name] = [len(files) - 1, row_group]
+        row_group += 1
+        if row_group == features_per_file:
+            writer.close()
+            writer = None
+        if j > 0 and (j + 1) % 1000 == 0:
+            logger.info("Wrote adata X {}/{}".format(j + 1, adata_X.shape[1]))
+    if writer is not None:
+        writer.close()
+    return dict(files=files, features=features)
+
+
+def save_stats(stats, stats_dir, filesystem):
+    logger.info("writing summary statistics")
+    for name, table in stats.items():
+        d = {}
+        for column, value in table.items():
+            if value.ndim == 2:  # store rows as fixed size lists
+                value = pa.FixedSizeListArray.from_arrays(pa.array(value.ravel()), value.shape[1])
+            d[column] = value
+        write_pq(
+            d, os.path.join(stats_dir, os.path.dirname(name)), os.path.basename(name), filesystem
+        )
+
+
 def save_data_obsm(adata, obsm_dir, filesystem, whitelist):
     logger.info("writing adata obsm")
 
@@ -80,6 +149,8 @@ def save_data_obsm(adata, obsm_dir, filesystem, whitelist):
             for i in range(dim):
                 d[name + "_" + str(i + 1)] = m[:, i].astype("float32")
             write_pq(d, obsm_dir, name, filesystem)
+    # uncompressed copy that can be memory-mapped
+    save_obsm_npy(adata, obsm_dir, filesystem, whitelist=whitelist, dtype=np.float32)
 
 
 def save_data_obs(adata, obs_dir, filesystem, whitelist=None):
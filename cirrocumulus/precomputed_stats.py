@@ -0,0 +1,310 @@
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from pandas import CategoricalDtype
+
+from cirrocumulus.anndata_util import X_stats
+from cirrocumulus.embedding_aggregator import Bins
+from cirrocumulus.envir import CIRRO_STATS_CACHE_BYTES
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.var_index import get_var_positions
+
+
+# maximum number of categories in an obs field to compute grouped statistics for
+max_grouped_categories = 100
+# number of bins per axis for each resolution of precomputed binned embeddings
+embedding_nbins = [64, 256, 1000]
+
+
+# nominal size of entries for missing tables, so that they count towards the cache size
+missing_table_nbytes = 256
+
+
+def table_nbytes(entry):
+    table = entry[0]
+    if table is None:
+        return missing_table_nbytes
+    return sum(value.nbytes for value in table.values())
+
+
+# (dataset path, dataset version, table name) -> (table,) where table is a dict of arrays or None
+# when the dataset does not have the table
+stats_cache = LRUCache(
+    max_size=int(os.environ.get(CIRRO_STATS_CACHE_BYTES, str(64 * 1024 * 1024))),
+    size_fn=table_nbytes,
+)
+
+
+def get_expressed(X):
+    """Returns a matrix with the same shape as X that is 1 where X is non-zero and 0 elsewhere."""
+    if scipy.sparse.issparse(X):
+        expressed = X.copy()
+        expressed.data = (expressed.data != 0).astype(np.float64)
+        return expressed
+    return (X != 0).astype(np.float64)
+
+
+def compute_grouped_stats(X, codes, n_categories, expressed=None):
+    """Computes the mean and percent of observations with non-zero values per category.
+
+    :param expressed: Optional matrix returned by get_expressed(X), to share between calls
+    :return: Dict with mean and percentExpressed, arrays of shape (n_features, n_categories)
+    """
+    if expressed is None:
+        expressed = get_expressed(X)
+    keep = codes >= 0
+    indicator = scipy.sparse.csr_matrix(
+        (np.ones(keep.sum()), (codes[keep], np.flatnonzero(keep))),
+        shape=(n_categories, X.shape[0]),
+    )
+    sums = indicator @ X
+    n_expressed = indicator @ expressed
+    if scipy.sparse.issparse(X):
+        sums = sums.toarray()
+        n_expressed = n_expressed.toarray()
+    counts = np.asarray(indicator.sum(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums / counts
+        percent_expressed = 100 * n_expressed / counts
+    return dict(
+        mean=mean.T.astype(np.float32), percentExpressed=percent_expressed.T.astype(np.float32)
+    )
+
+
+def compute_stats(adata, X=True):
+    """Computes summary statistics for features and obs fields.
+
+    :param adata: AnnData
+    :param X: Whether to compute feature statistics
+    :return: Dict that maps table name (X, obs/<field>, counts/<field>, or grouped/<field>) to a
+        dict of arrays
+    """
+    stats = {}
+    expressed = None
+    if X:
+        df = X_stats(adata)
+        stats["X"] = {column: df[column].values for column in df.columns}
+    for name in adata.obs.columns:
+        values = adata.obs[name]
+        if isinstance(values.dtype, CategoricalDtype):
+            codes = values.values.codes
+            categories = values.cat.categories.values
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+            stats["counts/" + name] = dict(categories=categories, counts=counts)
+            if X and 1 < len(categories) <= max_grouped_categories:
+                if expressed is None:
+                    expressed = get_expressed(adata.X)
+                stats["grouped/" + name] = compute_grouped_stats(
+                    adata.X, codes, len(categories), expressed
+                )
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            agg = values.agg(["min", "max", "sum", "mean"])
+            stats["obs/" + name] = {
+                key: np.array([agg[key]], dtype=np.float64) for key in agg.index
+            }
+    return stats
+
+
+def get_stats_table(provider, filesystem, path, name, dataset_info):
+    """Returns the precomputed table name for the dataset at path or None."""
+    key = (path, dataset_info.get("version"), name)
+    entry = stats_cache.get(key)
+    if entry is None:
+        entry = (provider.read_stats_table(filesystem, path, name),)
+        if key[1] is not None:
+            stats_cache.put(key, entry)
+    return entry[0]
+
+
+def get_summary(read_table, var_ids, obs_keys, var_keys):
+    """Returns summary statistics in the format returned by FeatureAggregator or None when not all
+    keys have precomputed statistics."""
+    result = {}
+    for key in obs_keys:
+        table = read_table("counts/" + key)
+        if table is not None:
+            result[key] = {"categories": table["categories"], "counts": table["counts"]}
+            continue
+        table = read_table("obs/" + key)
+        if table is None:
+            return None
+        result[key] = {stat: float(table[stat][0]) for stat in ["min", "max", "sum", "mean"]}
+    if len(var_keys) > 0:
+        table = read_table("X")
+        if table is None:
+            return None
+        indices = get_var_positions(var_ids, var_keys)
+        if (indices < 0).any():
+            return None
+        for key, j in zip(var_keys, indices):
+            result[key] = {
+                "min": float(table["min"][j]),
+                "max": float(table["max"][j]),
+                "sum": float(table["sum"][j]),
+                "mean": float(table["mean"][j]),
+                "numExpressed": int(table["numExpressed"][j]),
+            }
+    return result
+
+
+def get_grouped_stats(read_table, var_ids, var_keys, dimensions):
+    """Returns grouped statistics in the format returned by DotPlotAggregator or None when not all
+    keys have precomputed statistics."""
+    indices = get_var_positions(var_ids, var_keys)
+    if (indices < 0).any():
+        return None
+    results = []
+    for dimension in dimensions:
+        if isinstance(dimension, list):
+            if len(dimension) > 1:  # combined dimensions are not precomputed
+                return None
+            dimension = dimension[0]
+        counts = read_table("counts/" + dimension)
+        if counts is None:
+            return None
+        if len(counts["categories"]) <= 1:
+            continue
+        table = read_table("grouped/" + dimension)
+        if table is None:
+            return None
+        observed = counts["counts"] > 0
+        values = []
+        for key, j in zip(var_keys, indices):
+            values.append(
+                {
+                    "name": key,
+                    "percentExpressed": table["percentExpressed"][j][observed],
+                    "mean": table["mean"][j][observed],
+                }
+            )
+        results.append(
+            {"categories": counts["categories"][observed], "name": dimension, "values": values}
+        )
+    return results
+
+
+def get_bins(coords, nbins):
+    """Assigns observations to bins in the same way as EmbeddingAggregator.convert_coords_to_bin.
+
+    :return: Tuple of bin ids and bin coordinates
+    """
+    bin_coords = np.empty(coords.shape, dtype=np.int64)
+    for i in range(coords.shape[1]):
+        values = coords[:, i]
+        bin_coords[:, i] = np.floor(
+            np.interp(values, [values.min(), values.max()], [0, nbins - 1])
+        ).astype(int)
+    if coords.shape[1] == 2:
+        bin_ids = bin_coords[:, 0] * nbins + bin_coords[:, 1]
+    else:
+        bin_ids = bin_coords[:, 2] + nbins * (bin_coords[:, 1] + nbins * bin_coords[:, 0])
+    return bin_ids, bin_coords
+
+
+def compute_binned_embedding(coords, nbins, obs, features):
+    """Summarizes an embedding at one resolution.
+
+    :param coords: Embedding coordinates
+    :param nbins: Number of bins per axis
+    :param obs: Dict that maps categorical obs field to pd.Categorical
+    :param features: Dict that maps feature to 1-d array of values
+    :return: Dict that maps table name (bins, obs/<field>, X/<feature>) to a dict of arrays
+    """
+    bin_ids, bin_coords = get_bins(coords, nbins)
+    bins = Bins(bin_ids)
+    tables = {
+        "bins": dict(
+            bins=bins.bins, coordinates=bin_coords[bins.first].astype(np.int32), count=bins.counts
+        )
+    }
+    for name, values in obs.items():
+        mode, purity = bins.mode(values.codes.astype(np.int64), len(values.categories))
+        tables["obs/" + name] = dict(
+            mode=mode.astype(np.int32), purity=np.nan_to_num(purity).astype(np.float32)
+        )
+    for name, values in features.items():
+        tables["X/" + name] = {
+            "max": bins.reduce(np.maximum, values),
+            "mean": bins.mean(values).astype(np.float32),
+        }
+    return tables
+
+
+def compute_binned_embeddings(adata, features=None, levels=None):
+    """Computes binned embeddings at multiple resolutions for all embeddings in adata.obsm.
+
+    :param adata: AnnData
+    :param features: Features to compute per-bin max and mean for
+    :param levels: Number of bins per axis for each resolution
+    :return: Dict that maps table name (embedding/<basis>/<nbins>/<table>) to a dict of arrays
+    """
+    if levels is None:
+        levels = embedding_nbins
+    obs = {}
+    for name in adata.obs.columns:
+        values = adata.obs[name]
+        if (
+            isinstance(values.dtype, CategoricalDtype)
+            and 1 < len(values.cat.categories) <= max_grouped_categories
+        ):
+            obs[name] = values.values
+    feature_values = {}
+    if features is not None and len(features) > 0:
+        for name in features:
+            # first column when names are duplicated
+            values = adata.X[:, adata.var.index.get_indexer_for([name])[0]]
+            if scipy.sparse.issparse(values):
+                values = values.toarray()
+            feature_values[name] = np.asarray(values).flatten()
+    stats = {}
+    for key in adata.obsm.keys():
+        coords = np.asarray(adata.obsm[key])
+        for nbins in levels:
+            for name, table in compute_binned_embedding(coords, nbins, obs, feature_values).items():
+                stats["embedding/{}/{}/{}".format(key, nbins, name)] = table
+    return stats
+
+
+def get_binned_embedding(read_table, basis, obs_keys, var_keys):
+    """Returns a binned embedding in the format returned by EmbeddingAggregator or None when the
+    embedding is not precomputed at the requested resolution.
+
+    :param basis: Dict with name, nbins, and optionally dimensions, agg (max or mean) and quick
+        (whether to skip purity)
+    """
+    name = basis["name"]
+    prefix = "embedding/{}/{}/".format(name, basis["nbins"])
+    table = read_table(prefix + "bins")
+    if table is None:
+        return None
+    coordinates = table["coordinates"]
+    if basis.get("dimensions", coordinates.shape[1]) != coordinates.shape[1]:
+        return None
+    agg = basis.get("agg", "max")
+    if len(var_keys) > 0 and agg not in ("max", "mean"):
+        return None
+    result = {"name": name, "coordinates": {"bins": table["bins"]}, "values": {}}
+    for i in range(coordinates.shape[1]):
+        result["coordinates"]["{}_{}".format(name, i + 1)] = coordinates[:, i]
+    for key in obs_keys:
+        if key == "__count":
+            result["values"][key] = table["count"]
+            continue
+        obs_table = read_table(prefix + "obs/" + key)
+        counts = read_table("counts/" + key)
+        if obs_table is None or counts is None:
+            return None
+        value = pd.Series(pd.Categorical.from_codes(obs_table["mode"], counts["categories"]))
+        result["values"][key] = (
+            dict(value=value)
+            if basis.get("quick", True)
+            else dict(value=value, purity=obs_table["purity"])
+        )
+    for key in var_keys:
+        feature_table = read_table(prefix + "X/" + key)
+        if feature_table is None:
+            return None
+        result["values"][key] = feature_table[agg]
+    return result
@@ -12,6 +12,7 @@ from pandas import CategoricalDtype
 from cirrocumulus.anndata_dataset import read_adata
 from cirrocumulus.anndata_util import dataset_schema, get_scanpy_marker_keys
 from cirrocumulus.io_util import SPATIAL_HELP, filter_markers, get_markers, unique_id
+from cirrocumulus.precomputed_stats import compute_binned_embeddings, compute_stats, embedding_nbins
 from cirrocumulus.util import get_fs, open_file, to_json
 
 
@@ -78,13 +79,17 @@ class PrepareData:
         markers=[],
         output_format="zarr",
         no_auto_groups=False,
+        no_stats=False,
         save_whitelist=None,
+        binned_features=None,
     ):
         self.groups = groups
+        self.binned_features = binned_features
         self.group_nfeatures = group_nfeatures
         self.markers = markers
         self.output_format = output_format
         self.no_auto_groups = no_auto_groups
+        self.no_stats = no_stats
         if save_whitelist is None:
             save_whitelist = whitelist_todict(None)
         self.save_whitelist = save_whitelist
@@ -280,10 +285,26 @@ class PrepareData:
                 filesystem.copy(src, dest)
                 image["image"] = "images/" + os.path.basename(src)
 
+        stats = None
+        if output_format in ["parquet", "zarr"] and not self.no_stats:
+            logger.info("Computing summary statistics")
+            stats = compute_stats(dataset, X=self.save_whitelist["x"])
+            # binned embeddings are only served to API requests with nbins, so they are opt-in
+            if self.save_whitelist["obsm"] and self.binned_features is not None:
+                logger.info("Computing binned embeddings")
+                stats.update(
+                    compute_binned_embeddings(
+                        dataset,
+                        self.binned_features if self.save_whitelist["x"] else None,
+                        embedding_nbins,
+                    )
+                )
         if output_format == "parquet":
             from cirrocumulus.parquet_output import save_dataset_pq
 
-            save_dataset_pq(dataset, schema, self.base_output, filesystem, self.save_whitelist)
+            save_dataset_pq(
+                dataset, schema, self.base_output, filesystem, self.save_whitelist, stats=stats
+            )
         elif output_format == "jsonl":
             from cirrocumulus.jsonl_io import save_dataset_jsonl
 
@@ -291,7 +312,9 @@ class PrepareData:
         elif output_format == "zarr":
             from cirrocumulus.zarr_output import save_dataset_zarr
 
-            save_dataset_zarr(dataset, schema, self.base_output, filesystem, self.save_whitelist)
+            save_dataset_zarr(
+                dataset, schema, self.base_output, filesystem, self.save_whitelist, stats=stats
+            )
         else:
             raise ValueError("Unknown format")
 
@@ -337,6 +360,12 @@ def create_parser(description=False):
         help="Disable automatic cluster field detection to compute differential expression results for",
         action="store_true",
     )
+    parser.add_argument(
+        "--no-stats",
+        dest="no_stats",
+        help="Disable precomputing summary statistics and binned embeddings",
+        action="store_true",
+    )
     parser.add_argument(
         "--groups",
         help='List of groups to compute markers for (e.g. louvain). Markers created with cumulus/scanpy are automatically included. Separate multiple groups with a comma to combine groups using "AND" logic (e.g. louvain,day)',
@@ -346,6 +375,11 @@ def create_parser(description=False):
         "--group_nfeatures", help="Number of marker genes/features to include", type=int, default=10
     )
     parser.add_argument("--spatial", help=SPATIAL_HELP)
+    parser.add_argument(
+        "--binned_features",
+        help="Precompute binned embeddings (64, 256, and 1000 bins per axis) for API requests that specify nbins, including per-bin max and mean for these features",
+        action="append",
+    )
     return parser
 
 
@@ -391,7 +425,9 @@ def main(argsv):
         markers=args.markers,
         output_format=output_format,
         no_auto_groups=no_auto_groups,
+        no_stats=args.no_stats,
         save_whitelist=save_whitelist,
+        binned_features=args.binned_features,
     )
     prepare_data.execute()
 
@@ -0,0 +1,70 @@
+import numpy as np
+import scipy.sparse
+
+
+def _quantize(values, dtype):
+    """Maps values to integer buckets.
+
+    :return: Dict with quantized (dtype name), values (bucket per value), min, and scale. Values are
+        restored as min + bucket * scale.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_buckets = np.iinfo(dtype).max
+    finite = values[np.isfinite(values)]
+    vmin = float(finite.min()) if len(finite) > 0 else 0.0
+    vmax = float(finite.max()) if len(finite) > 0 else 0.0
+    scale = (vmax - vmin) / n_buckets if vmax > vmin else 1.0
+    codes = np.rint((np.nan_to_num(values, nan=vmin, posinf=vmax, neginf=vmin) - vmin) / scale)
+    return dict(quantized=np.dtype(dtype).name, values=codes.astype(dtype), min=vmin, scale=scale)
+
+
+def quantize_coordinates(values):
+    """Quantizes embedding coordinates to a uint16 grid."""
+    return _quantize(values, np.uint16)
+
+
+def quantize_values(values, mode):
+    """Quantizes feature values that are either a dense array or a dict with indices and values.
+
+    :param mode: float16 or uint8 (256 buckets between the min and max value)
+    """
+    indices = None
+    if isinstance(values, dict):
+        indices = values["indices"]
+        values = values["values"]
+    elif scipy.sparse.issparse(values):
+        values = values.toarray()
+    values = np.asarray(values).flatten()
+    if mode == "float16":
+        result = dict(quantized="float16", values=values.astype(np.float16))
+    elif mode == "uint8":
+        result = _quantize(values, np.uint8)
+    else:
+        raise ValueError("Unknown quantize mode {}".format(mode))
+    if indices is not None:
+        result["indices"] = indices
+    return result
+
+
+def quantize_results(results, var_keys, quantize):
+    """Quantizes embedding coordinates and feature values in handle_data results in place.
+
+    :param var_keys: Features in results["values"], all values in results["layers"] are features
+    :param quantize: Dict with coordinates (whether to quantize coordinates) and values (None,
+        float16, or uint8)
+    """
+    if quantize.get("coordinates", False):
+        for embedding in results.get("embeddings", []):
+            coordinates = embedding.get("coordinates", {})
+            for key, values in coordinates.items():
+                if key != "bins" and np.asarray(values).dtype.kind == "f":
+                    coordinates[key] = quantize_coordinates(values)
+    mode = quantize.get("values")
+    if mode is not None:
+        values = results.get("values", {})
+        for key in var_keys:
+            if key in values:
+                values[key] = quantize_values(values[key], mode)
+        for values in results.get("layers", {}).values():
+            for key in values:
+                values[key] = quantize_values(values[key], mode)
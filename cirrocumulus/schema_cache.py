@@ -0,0 +1,46 @@
+import os
+import json
+import hashlib
+import logging
+
+from cirrocumulus.util import dumps
+
+
+logger = logging.getLogger("cirro")
+
+
+def get_default_schema_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "cirrocumulus", "schema")
+
+
+def get_schema_cache_path(cache_dir, path, version):
+    key = hashlib.sha1(json.dumps([path, version]).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key + ".json")
+
+
+def read_cached_schema(cache_dir, path, version):
+    """Returns the schema stored for the dataset at path and version or None."""
+    if not cache_dir or version is None:
+        return None
+    try:
+        with open(get_schema_cache_path(cache_dir, path, version), "rt") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cached_schema(cache_dir, path, version, schema):
+    """Stores the schema for the dataset at path and version. Errors are logged and ignored."""
+    if not cache_dir or version is None:
+        return
+    cache_path = get_schema_cache_path(cache_dir, path, version)
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wt") as f:
+            f.write(dumps(schema, double_precision=15, orient="values"))
+        os.replace(tmp_path, cache_path)  # readers never see a partially written file
+    except (OSError, TypeError, ValueError, OverflowError):
+        logger.warning("Unable to write schema cache for {}".format(path), exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
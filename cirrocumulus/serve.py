@@ -67,6 +67,7 @@ def configure_app(app):
             "cirrocumulus.parquet_dataset.ParquetDataset",
             "cirrocumulus.zarr_dataset.ZarrDataset",
             "cirrocumulus.tiledb_dataset.TileDBDataset",
+            "cirrocumulus.jsonl_dataset.JsonlDataset",
         ]
     )
     add_dataset_providers()
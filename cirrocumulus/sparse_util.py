@@ -0,0 +1,51 @@
+import numpy as np
+import scipy.sparse
+
+
+def csc_columns(X):
+    """Splits a CSC matrix into a list of (indices, data) tuples, one per column."""
+    indptr = X.indptr
+    return [
+        (X.indices[indptr[j] : indptr[j + 1]].copy(), X.data[indptr[j] : indptr[j + 1]].copy())
+        for j in range(X.shape[1])
+    ]
+
+
+def csc_from_columns(columns, n_rows, dtype=None):
+    """Creates a CSC matrix from a list of (indices, data) tuples, one per column."""
+    indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    if len(columns) > 0:
+        np.cumsum([len(c[0]) for c in columns], out=indptr[1:])
+        indices = np.concatenate([c[0] for c in columns])
+        data = np.concatenate([c[1] for c in columns])
+    else:
+        indices = np.zeros(0, dtype=np.int32)
+        data = np.zeros(0, dtype=dtype if dtype is not None else np.float32)
+    if dtype is not None:
+        data = data.astype(dtype, copy=False)
+    if indptr[-1] <= np.iinfo(np.int32).max:
+        indptr = indptr.astype(np.int32)
+        indices = indices.astype(np.int32, copy=False)
+    return scipy.sparse.csc_matrix((data, indices, indptr), shape=(n_rows, len(columns)))
+
+
+def range_indices(starts, lengths):
+    """Returns the concatenation of np.arange(start, start + length) for each start and length."""
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+
+
+def csc_gather(X, columns):
+    """Returns the columns at positions columns of CSC matrix X without intermediate copies."""
+    columns = np.asarray(columns, dtype=np.int64)
+    starts = X.indptr[columns].astype(np.int64)
+    lengths = X.indptr[columns + 1].astype(np.int64) - starts
+    take = range_indices(starts, lengths)
+    indptr = np.zeros(len(columns) + 1, dtype=X.indptr.dtype)
+    np.cumsum(lengths, out=indptr[1:])
+    return scipy.sparse.csc_matrix(
+        (X.data[take], X.indices[take], indptr), shape=(X.shape[0], len(columns))
+    )
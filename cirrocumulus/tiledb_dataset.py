@@ -1,12 +1,25 @@
 import os
 import json
 
+import numpy as np
 import pandas as pd
 import tiledb
 import scipy.sparse
-from anndata import AnnData
 
 from cirrocumulus.abstract_dataset import AbstractDataset
+from cirrocumulus.lite_adata import LiteAnnData
+from cirrocumulus.obs_cache import get_obs_columns
+from cirrocumulus.var_index import get_var_positions
+
+
+def rows_to_ranges(rows):
+    """Converts sorted unique row positions to a list of inclusive slices for tiledb multi_index."""
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(rows)])) - 1
+    return [slice(int(rows[start]), int(rows[end])) for start, end in zip(starts, ends)]
 
 
 class TileDBDataset(AbstractDataset):
@@ -88,27 +101,65 @@ class TileDBDataset(AbstractDataset):
             schema_dict["var"] = pd.Index(array.query(attrs=["name_0"])[:]["name_0"])
         return schema_dict
 
-    def read_dataset(self, filesystem, path, keys=None, dataset=None):
+    def supports_row_subset(self):
+        return True
+
+    def read_X(self, array, indices, row_ranges, n_rows, rows=None):
+        """Reads the columns at indices (and optionally only row_ranges) without materializing a
+        dense block for sparse arrays."""
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        col_ranges = [int(i) for i in unique_indices]
+        if n_rows == 0:  # multi_index reads all rows when there are no ranges
+            dtype = array.schema.attr(0).dtype
+            if array.schema.sparse:
+                X = scipy.sparse.csc_matrix((0, len(unique_indices)), dtype=dtype)
+            else:
+                X = np.zeros((0, len(unique_indices)), dtype=dtype)
+        elif array.schema.sparse:
+            result = array.multi_index[row_ranges, col_ranges]
+            obs_dim = array.schema.domain.dim(0).name
+            var_dim = array.schema.domain.dim(1).name
+            row_coords = result[obs_dim]
+            if rows is not None:
+                row_coords = np.searchsorted(rows, row_coords)
+            X = scipy.sparse.csc_matrix(
+                (
+                    result[array.schema.attr(0).name],
+                    (row_coords, np.searchsorted(unique_indices, result[var_dim])),
+                ),
+                shape=(n_rows, len(unique_indices)),
+            )
+        else:
+            X = array.multi_index[row_ranges, col_ranges][array.schema.attr(0).name]
+            X = X.reshape((n_rows, len(unique_indices)))
+        if not np.array_equal(unique_indices, indices):  # restore requested order
+            X = X[:, inverse]
+        return X
+
+    def read_dataset(self, filesystem, path, keys=None, dataset=None, dataset_info=None, rows=None):
         keys = keys.copy()
         var_keys = keys.pop("X", [])
         obs_keys = keys.pop("obs", [])
         basis_keys = keys.pop("basis", [])
-        dataset_info = self.get_dataset_info(filesystem, path)
+        if dataset_info is None:
+            dataset_info = self.get_dataset_info(filesystem, path)
+        n_rows = dataset_info["shape"][0]
+        row_ranges = slice(None)
+        if rows is not None:
+            rows = np.unique(rows)
+            row_ranges = rows_to_ranges(rows)
+            n_rows = len(rows)
         X = None
         obs = None
         var = None
         obsm = {}
         if len(var_keys) > 0:
             with tiledb.open(os.path.join(path, "X"), mode="r") as array:
-                if array.schema.sparse:
-                    raise ValueError("Sparse data not supported")
                 var_names = dataset_info["var"]
-                indices = var_names.get_indexer_for(var_keys).tolist()
-                X = array.multi_index[:, indices][""]
-                X = scipy.sparse.csc_matrix(X)
+                indices = get_var_positions(var_names, var_keys)
+                X = self.read_X(array, indices, row_ranges, n_rows, rows)
                 var = pd.DataFrame(index=var_keys)
         if len(obs_keys) > 0:
-            obs = pd.DataFrame()
             _obs_keys = []
 
             for key in obs_keys:
@@ -116,15 +167,32 @@ class TileDBDataset(AbstractDataset):
                     _obs_keys.append(dataset_info.get("obsIndex", "name_0"))
                 else:
                     _obs_keys.append(key)
-            with tiledb.open(os.path.join(path, "obs"), mode="r") as array:
-                ordered_dict = array.query(attrs=_obs_keys)[:]
-            for key in ordered_dict:
-                obs[key] = ordered_dict[key]
+
+            def read_obs(keys):
+                with tiledb.open(os.path.join(path, "obs"), mode="r") as array:
+                    if rows is not None and len(rows) == 0:
+                        return {
+                            key: np.array([], dtype=array.schema.attr(key).dtype) for key in keys
+                        }
+                    if rows is not None:
+                        return array.query(attrs=keys).multi_index[row_ranges]
+                    return array.query(attrs=keys)[:]
+
+            if rows is not None:  # only cache entire columns
+                key_to_values = read_obs(_obs_keys)
+            else:
+                key_to_values = get_obs_columns(path, dataset_info, _obs_keys, read_obs)
+            obs = {key: key_to_values[_key] for key, _key in zip(obs_keys, _obs_keys)}
 
         if len(basis_keys) > 0:
             for key in basis_keys:
                 with tiledb.open(os.path.join(path, "emb", key), mode="r") as array:
-                    obsm[key] = array[:]
-                    if X is None:
-                        X = scipy.sparse.coo_matrix(([], ([], [])), shape=(array.shape[0], 0))
-        return AnnData(X=X, obs=obs, var=var, obsm=obsm)
+                    shape = (n_rows,) + array.shape[1:]
+                    if rows is not None and len(rows) == 0:
+                        obsm[key] = np.zeros(shape, dtype=array.schema.attr(0).dtype)
+                    elif rows is not None:  # multi_index returns flattened values
+                        values = array.multi_index[row_ranges, :][array.schema.attr(0).name]
+                        obsm[key] = values.reshape(shape)
+                    else:
+                        obsm[key] = array[:]
+        return LiteAnnData(X=X, obs=obs, var=var, obsm=obsm, n_obs=n_rows, positions=rows)
@@ -1,13 +1,17 @@
 import os
+import zlib
+import types
+import struct
+import hashlib
 from urllib.parse import urlparse
 
 import numpy as np
 import fsspec
 import pandas as pd
 import pandas._libs.json as ujson
-from flask import make_response
+from flask import Response, make_response, request
 
-from cirrocumulus.envir import CIRRO_DATASET_PROVIDERS
+from cirrocumulus.envir import CIRRO_COMPRESS, CIRRO_DATASET_PROVIDERS
 
 
 try:
@@ -56,6 +60,29 @@ def get_fs(path):
     return fsspec.filesystem(get_scheme(path), **fsspec_kwargs)
 
 
+def get_version(filesystem, path):
+    """Returns a token that changes when the file or directory at path is modified.
+
+    Uses the ETag or checksum reported by object stores when available, falling back to the
+    modification time and size.
+    """
+    try:
+        info = filesystem.info(path)
+    except (FileNotFoundError, OSError):
+        return None
+    etag = None
+    for key in ["ETag", "etag", "md5Hash", "generation"]:
+        if info.get(key) is not None:
+            etag = str(info[key])
+            break
+    mtime = None
+    for key in ["mtime", "LastModified", "updated", "last_modified", "created"]:
+        if info.get(key) is not None:
+            mtime = str(info[key])
+            break
+    return info.get("size"), etag, mtime
+
+
 def open_file(urlpath, mode="rb", compression=None):
     return fsspec.open(urlpath, mode=mode, compression=compression, **fsspec_kwargs)
 
@@ -64,16 +91,211 @@ def to_json(data, orient="values"):
     return dumps(data, double_precision=2, orient=orient)
 
 
-def json_response(data, response=200):
+def json_response(data, response=200, conditional=False):
+    """Returns a JSON response.
+
+    :param conditional: Whether to add a strong ETag computed from the content and respond with 304
+        when it matches the request's If-None-Match header
+    """
     # response = make_response(simplejson.dumps(data, check_circular=True), response)
     # response = make_response(json.dumps(data), response)
     s = dumps(data, double_precision=2, orient="values")
     # s = nujson.dumps(data, double_precision=1)
     response = make_response(s, response)
     response.headers["Content-Type"] = "application/json"
+    if conditional:
+        response.set_etag(hashlib.sha1(s.encode("utf-8")).hexdigest())
+        response.headers["Cache-Control"] = "no-cache"  # always revalidate using the ETag
+        response.make_conditional(request)
+    return response
+
+
+def iter_json(data, double_precision=2, chunk_size=65536):
+    """Encodes data as JSON incrementally. Arrays, series, and indices longer than chunk_size are
+    encoded chunk_size elements at a time. Generators are encoded as lists while they are
+    consumed."""
+    if isinstance(data, dict):
+        yield "{"
+        for i, (key, value) in enumerate(data.items()):
+            yield ("," if i > 0 else "") + dumps(str(key)) + ":"
+            yield from iter_json(value, double_precision, chunk_size)
+        yield "}"
+    elif isinstance(data, (list, tuple, types.GeneratorType)):
+        yield "["
+        for i, value in enumerate(data):
+            if i > 0:
+                yield ","
+            yield from iter_json(value, double_precision, chunk_size)
+        yield "]"
+    elif isinstance(data, (np.ndarray, pd.Series, pd.Index)) and len(data) > chunk_size:
+        yield "["
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start : start + chunk_size]
+            s = dumps(chunk, double_precision=double_precision, orient="values")
+            yield ("," if start > 0 else "") + s[1:-1]  # remove brackets
+        yield "]"
+    else:
+        yield dumps(data, double_precision=double_precision, orient="values")
+
+
+def iter_columns_json(df, double_precision=2):
+    """Same as df.to_json(orient="columns"), encoded one column at a time."""
+    yield "{"
+    for i, column in enumerate(df.columns):
+        values = df[column].to_json(double_precision=double_precision)
+        yield ("," if i > 0 else "") + dumps(str(column)) + ":" + values
+    yield "}"
+
+
+def _iter_bytes(chunks, buffer_size=65536):
+    """Joins small chunks of text into UTF-8 encoded blocks of about buffer_size."""
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if size > 0:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _iter_gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 for gzip header
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def streaming_json_response(data, response=200, conditional=False):
+    """Returns a JSON response that is encoded while it is sent, so that the whole string is never
+    held in memory.
+
+    :param conditional: Whether to add a strong ETag computed from the content and respond with 304
+        when it matches the request's If-None-Match header. The content is encoded twice.
+    """
+    etag = None
+    if conditional:
+        h = hashlib.sha1()
+        for block in _iter_bytes(iter_json(data)):
+            h.update(block)
+        etag = h.hexdigest()
+    blocks = _iter_bytes(iter_json(data))
+    # compress here as flask-compress would need to collect the whole stream first
+    compress = bool(os.environ.get(CIRRO_COMPRESS, "true")) and "gzip" in request.headers.get(
+        "Accept-Encoding", ""
+    )
+    if compress:
+        blocks = _iter_gzip(blocks)
+    r = Response(blocks, status=response, mimetype="application/json")
+    if compress:
+        r.headers["Content-Encoding"] = "gzip"
+        r.headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        r.set_etag(etag)
+        r.headers["Cache-Control"] = "no-cache"  # always revalidate using the ETag
+        r.make_conditional(request)
+    return r
+
+
+# typed array responses: little endian uint32 header length, JSON header, then the array buffers.
+# Arrays in the header are replaced by {"__typed_array": index into header["arrays"]}. The header
+# and each buffer are padded to 8 bytes so that clients can create typed array views without
+# copying.
+TYPED_ARRAYS_MIMETYPE = "application/x-cirro-typed-arrays"
+typed_array_dtypes = {
+    "int8",
+    "uint8",
+    "int16",
+    "uint16",
+    "int32",
+    "uint32",
+    "float16",  # clients decode half precision values
+    "float32",
+    "float64",
+}
+
+
+def _to_typed_array(value):
+    """Returns value as a 1-d little endian array with a type supported by JavaScript typed arrays
+    or None."""
+    if isinstance(value, (pd.Series, pd.Index)):
+        if isinstance(value.dtype, pd.CategoricalDtype):
+            return None
+        value = value.values
+    if not isinstance(value, np.ndarray) or value.ndim != 1:
+        return None
+    if value.dtype.kind == "b":
+        value = value.view(np.uint8)
+    elif value.dtype.kind in "iu" and value.dtype.itemsize == 8:
+        int32_info = np.iinfo(np.int32)
+        if len(value) == 0 or (value.min() >= int32_info.min and value.max() <= int32_info.max):
+            value = value.astype(np.int32)
+        else:
+            value = value.astype(np.float64)
+    if value.dtype.name not in typed_array_dtypes:
+        return None
+    return np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+
+
+def _extract_typed_arrays(value, arrays):
+    if isinstance(value, dict):
+        return {key: _extract_typed_arrays(v, arrays) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_extract_typed_arrays(v, arrays) for v in value]
+    array = _to_typed_array(value)
+    if array is None:
+        return value
+    arrays.append(array)
+    return {"__typed_array": len(arrays) - 1}
+
+
+def _pad(n):
+    return b"\0" * (-n % 8)
+
+
+def typed_arrays_response(data):
+    """Returns a response that streams the numeric arrays in data without converting them to
+    text."""
+    arrays = []
+    tree = _extract_typed_arrays(data, arrays)
+    descriptors = []
+    offset = 0
+    for array in arrays:
+        descriptors.append(dict(dtype=array.dtype.name, offset=offset, length=len(array)))
+        offset += array.nbytes + len(_pad(array.nbytes))
+    header = dumps(dict(data=tree, arrays=descriptors), double_precision=15, orient="values")
+    header = header.encode("utf-8")
+    prefix = struct.pack("<I", len(header)) + header
+    prefix += _pad(len(prefix))
+
+    def generate():
+        yield prefix
+        for array in arrays:
+            yield memoryview(array).cast("B")
+            yield _pad(array.nbytes)
+
+    response = Response(generate(), mimetype=TYPED_ARRAYS_MIMETYPE)
+    response.headers["Content-Length"] = str(len(prefix) + offset)
     return response
 
 
+def data_response(data):
+    """Returns data as typed arrays when the client accepts them, otherwise as JSON."""
+    if (
+        request.accept_mimetypes.best_match(["application/json", TYPED_ARRAYS_MIMETYPE])
+        == TYPED_ARRAYS_MIMETYPE
+    ):
+        if isinstance(data, types.GeneratorType):
+            data = list(data)  # the header is written before the array buffers
+        return typed_arrays_response(data)
+    return streaming_json_response(data)
+
+
 def get_email_domain(email):
     at_index = email.find("@")
     domain = None
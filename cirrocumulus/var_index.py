@@ -0,0 +1,73 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from cirrocumulus.util import dumps
+
+
+def get_var_positions(var_ids, keys):
+    """Returns one position in var_ids for each key (the first one when ids are duplicated) or -1
+    for keys that are not found."""
+    if var_ids.is_unique:
+        return var_ids.get_indexer(keys)
+    first = ~var_ids.duplicated()
+    positions = var_ids[first].get_indexer(keys)
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+def get_var_table(var):
+    """Converts the schema var (list of feature ids or list of records with an id) to columns.
+
+    :return: Dict that maps column name to array, id is always the first column
+    """
+    if len(var) > 0 and isinstance(var[0], dict):
+        df = pd.DataFrame.from_records(var)
+        columns = ["id"] + [c for c in df.columns if c != "id"]
+        return {c: df[c].values for c in columns}
+    return {"id": np.asarray(var, dtype=object)}
+
+
+def get_var_hash(table):
+    """Returns a hash of the var table content."""
+    return hashlib.sha1(dumps(table, orient="values").encode("utf-8")).hexdigest()
+
+
+def split_var(schema):
+    """Replaces var in schema with varCount and varHash.
+
+    :return: Tuple of schema without var and var table
+    """
+    schema = schema.copy()
+    table = get_var_table(schema.pop("var", []))
+    schema["varCount"] = len(table["id"])
+    schema["varHash"] = get_var_hash(table)
+    return schema, table
+
+
+def search_var(ids, q):
+    """Returns indices of features whose id contains q (case insensitive), prefix matches first."""
+    lower_ids = pd.Series(ids, dtype=object).str.lower()
+    q = q.lower()
+    is_prefix = lower_ids.str.startswith(q, na=False).values
+    is_substring = lower_ids.str.contains(q, regex=False, na=False).values
+    return np.concatenate([np.flatnonzero(is_prefix), np.flatnonzero(is_substring & ~is_prefix)])
+
+
+def get_var_page(table, offset=0, limit=None, q=None):
+    """Returns a page of the var table, optionally only features matching q.
+
+    :return: Dict with total (number of matching features), offset, and columns
+    """
+    indices = None
+    total = len(table["id"])
+    if q is not None and q != "":
+        indices = search_var(table["id"], q)
+        total = len(indices)
+    end = total if limit is None else min(total, offset + limit)
+    if indices is not None:
+        indices = indices[offset:end]
+        columns = {name: values[indices] for name, values in table.items()}
+    else:
+        columns = {name: values[offset:end] for name, values in table.items()}
+    return dict(total=total, offset=offset, columns=columns)
@@ -2,8 +2,10 @@ import json
 
 import zarr
 
+from cirrocumulus import io_pool
 from cirrocumulus.abstract_backed_dataset import AbstractBackedDataset
 from cirrocumulus.anndata_util import dataset_schema
+from cirrocumulus.util import get_version
 
 
 class ZarrDataset(AbstractBackedDataset):
@@ -19,11 +21,33 @@ class ZarrDataset(AbstractBackedDataset):
     def open_group(self, filesystem, path):
         return zarr.open_group(filesystem.get_mapper(path), mode="r")
 
+    def get_version(self, filesystem, path):
+        # directory modification times do not reflect changes to nested arrays
+        for key in [".zmetadata", "uns/cirro-schema/.zarray", "X/.zarray", "X/.zattrs"]:
+            version = get_version(filesystem, path + "/" + key)
+            if version is not None:
+                return version
+        return super().get_version(filesystem, path)
+
+    def read_ranges(self, arrays, ranges):
+        filesystem = getattr(arrays[0].store, "fs", None)
+        if len(ranges) <= 1 or filesystem is None:
+            return super().read_ranges(arrays, ranges)
+        # read chunks concurrently
+        futures = [
+            [
+                io_pool.submit(filesystem, None, array.__getitem__, slice(start, end))
+                for array in arrays
+            ]
+            for start, end in ranges
+        ]
+        return [tuple(future.result() for future in range_futures) for range_futures in futures]
+
     def slice_dense_array(self, X, indices):
         return X.get_orthogonal_selection((slice(None), indices))
 
     def get_schema(self, filesystem, path):
-        g = zarr.open_group(filesystem.get_mapper(path), mode="r")
+        g = self.get_group(filesystem, path)
         if "cirro-schema" in g["uns"]:
             s = str(g["uns"]["cirro-schema"][()])
             return json.loads(s)
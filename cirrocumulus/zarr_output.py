@@ -2,10 +2,11 @@ import zarr
 
 from cirrocumulus.anndata_util import ADATA_MODULE_UNS_KEY, get_pegasus_marker_keys
 from cirrocumulus.anndata_zarr import write_attribute
+from cirrocumulus.obsm_mmap import save_obsm_npy
 from cirrocumulus.util import dumps
 
 
-def save_dataset_zarr(dataset, schema, output_directory, filesystem, whitelist):
+def save_dataset_zarr(dataset, schema, output_directory, filesystem, whitelist, stats=None):
     module_dataset = None
     if dataset.uns.get(ADATA_MODULE_UNS_KEY) is not None:
         module_dataset = dataset.uns[ADATA_MODULE_UNS_KEY]
@@ -31,11 +32,15 @@ def save_dataset_zarr(dataset, schema, output_directory, filesystem, whitelist):
         write_attribute(group, "obs", dataset.obs)
     if whitelist["obsm"]:
         write_attribute(group, "obsm", dataset.obsm)
+        # uncompressed copy that can be memory-mapped
+        save_obsm_npy(dataset, output_directory + "/obsm", filesystem)
 
     pg_marker_keys = get_pegasus_marker_keys(dataset)
     for key in list(dataset.varm.keys()):
         if key not in pg_marker_keys:
             del dataset.varm[key]
+    if stats is not None:
+        write_attribute(group, "uns/cirro-stats", stats)
     write_attribute(group, "varm", dataset.varm)
     write_attribute(group, "var", dataset.var)
     # uns_whitelist = set(['module', 'cirro-schema'])
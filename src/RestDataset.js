@@ -2,6 +2,9 @@ import {API, getIdToken} from './actions';
 import {getPassingFilterIndices} from './dataset_filter';
 import {cacheValues, computeDerivedStats} from './VectorUtil';
 
+// dataset id -> {hash, features}, so that features are only fetched when the dataset changes
+const varCache = new Map();
+
 function reshapeDistributionResult(distribution) {
   const results = [];
   distribution.forEach((distributionResult) => {
@@ -42,6 +45,142 @@ function convertSparseAndCategoricalArrays(resultObject, ndim) {
   }
 }
 
+const TYPED_ARRAYS_MIMETYPE = 'application/x-cirro-typed-arrays';
+const TYPED_ARRAY_TYPES = {
+  int8: Int8Array,
+  uint8: Uint8Array,
+  int16: Int16Array,
+  uint16: Uint16Array,
+  int32: Int32Array,
+  uint32: Uint32Array,
+  float32: Float32Array,
+  float64: Float64Array,
+};
+
+// convert IEEE 754 half precision values stored as uint16 to Float32Array
+function decodeFloat16(buffer, offset, length) {
+  const bits = new Uint16Array(buffer, offset, length);
+  const values = new Float32Array(length);
+  for (let i = 0; i < length; i++) {
+    const h = bits[i];
+    const sign = h & 0x8000 ? -1 : 1;
+    const exponent = (h >> 10) & 0x1f;
+    const fraction = h & 0x3ff;
+    if (exponent === 0) {
+      values[i] = sign * Math.pow(2, -14) * (fraction / 1024);
+    } else if (exponent === 0x1f) {
+      values[i] = fraction ? NaN : sign * Infinity;
+    } else {
+      values[i] = sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+    }
+  }
+  return values;
+}
+
+// restore values quantized by the server (see cirrocumulus/quantize.py)
+function dequantize(data) {
+  if (data == null || data.quantized == null) {
+    return data;
+  }
+  let values = data.values;
+  if (data.quantized === 'float16') {
+    values = Float32Array.from(values);
+  } else {
+    const n = values.length;
+    const restored = new Float32Array(n);
+    for (let i = 0; i < n; i++) {
+      restored[i] = data.min + values[i] * data.scale;
+    }
+    values = restored;
+  }
+  return data.indices ? {indices: data.indices, values: values} : values;
+}
+
+function dequantizeResult(result) {
+  const valuesList = [result.values].concat(
+    result.layers ? Object.values(result.layers) : [],
+  );
+  valuesList.forEach((values) => {
+    for (const key in values) {
+      values[key] = dequantize(values[key]);
+    }
+  });
+  if (result.embeddings) {
+    result.embeddings.forEach((embedding) => {
+      for (const key in embedding.coordinates) {
+        embedding.coordinates[key] = dequantize(embedding.coordinates[key]);
+      }
+    });
+  }
+  return result;
+}
+
+// decode a typed arrays response: uint32 header length, JSON header, and 8 byte aligned buffers
+function readTypedArrays(buffer) {
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)),
+  );
+  const start = Math.ceil((4 + headerLength) / 8) * 8;
+
+  function convert(value) {
+    if (Array.isArray(value)) {
+      return value.map(convert);
+    } else if (value != null && typeof value === 'object') {
+      if (value.__typed_array != null) {
+        const array = header.arrays[value.__typed_array];
+        if (array.dtype === 'float16') {
+          return decodeFloat16(buffer, start + array.offset, array.length);
+        }
+        return new TYPED_ARRAY_TYPES[array.dtype](
+          buffer,
+          start + array.offset,
+          array.length,
+        );
+      }
+      const result = {};
+      for (const key in value) {
+        result[key] = convert(value[key]);
+      }
+      return result;
+    }
+    return value;
+  }
+
+  return convert(header.data);
+}
+
+function readDataResponse(response) {
+  if (response.headers.get('Content-Type') === TYPED_ARRAYS_MIMETYPE) {
+    return response.arrayBuffer().then(readTypedArrays);
+  }
+  return response.json();
+}
+
+// send lasso and box selections as [start, stop) ranges when that is shorter than the indices
+function encodeSelection(key, value) {
+  if (
+    value != null &&
+    value.field === '__index' &&
+    Array.isArray(value.value) &&
+    value.value.length > 2
+  ) {
+    const indices = Int32Array.from(value.value).sort();
+    const ranges = [];
+    for (let i = 0, n = indices.length; i < n; i++) {
+      if (i > 0 && indices[i] <= indices[i - 1] + 1) {
+        ranges[ranges.length - 1] = indices[i] + 1;
+      } else {
+        ranges.push(indices[i], indices[i] + 1);
+      }
+    }
+    if (ranges.length < indices.length) {
+      return Object.assign({}, value, {value: {ranges: ranges}});
+    }
+  }
+  return value;
+}
+
 export class RestDataset {
   /**
    *
@@ -76,7 +215,7 @@ export class RestDataset {
       });
     } else {
       return fetch(API + '/selected_ids', {
-        body: JSON.stringify(q),
+        body: JSON.stringify(q, encodeSelection),
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -158,6 +297,44 @@ export class RestDataset {
     });
   }
 
+  // requests made in the same tick are sent together to /data/batch so that the server reads once
+  fetchData(jsonData) {
+    if (this.pendingData == null) {
+      this.pendingData = [];
+      setTimeout(() => this.flushData(), 0);
+    }
+    return new Promise((resolve, reject) => {
+      this.pendingData.push({jsonData, resolve, reject});
+    });
+  }
+
+  flushData() {
+    const pending = this.pendingData;
+    this.pendingData = null;
+    const batch = pending.length > 1;
+    const body = batch
+      ? '{"id":' +
+        JSON.stringify(this.id) +
+        ',"requests":[' +
+        pending.map((item) => item.jsonData).join(',') +
+        ']}'
+      : pending[0].jsonData;
+    fetch(API + (batch ? '/data/batch' : '/data'), {
+      body: body,
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: TYPED_ARRAYS_MIMETYPE + ', application/json;q=0.9',
+        Authorization: 'Bearer ' + getIdToken(),
+      },
+    })
+      .then(readDataResponse)
+      .then((result) => {
+        pending.forEach((item, i) => item.resolve(batch ? result[i] : result));
+      })
+      .catch((err) => pending.forEach((item) => item.reject(err)));
+  }
+
   getDataPromise(data, cachedData) {
     data.id = this.id;
     let dataSend = data;
@@ -172,18 +349,15 @@ export class RestDataset {
         dataSend.values = data.values;
       }
     }
-    let jsonData = JSON.stringify(dataSend);
+    if (dataSend.embedding) {
+      // coordinates are only needed at screen precision
+      dataSend.quantize = {coordinates: true};
+    }
+    let jsonData = JSON.stringify(dataSend, encodeSelection);
     let p =
       jsonData !== '{}'
-        ? fetch(API + '/data', {
-            body: jsonData,
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-              Authorization: 'Bearer ' + getIdToken(),
-            },
-          })
-            .then((r) => r.json())
+        ? this.fetchData(jsonData)
+            .then(dequantizeResult)
             .then((result) => {
               if (result.values) {
                 convertSparseAndCategoricalArrays(
@@ -230,9 +404,50 @@ export class RestDataset {
       .then((response) => {
         return response.json();
       })
+      .then((result) => {
+        if (result.var == null && result.varCount != null) {
+          return this.getVarPromise(result.varHash).then((varResult) => {
+            result.var = varResult;
+            return result;
+          });
+        }
+        return result;
+      })
       .then((result) => {
         this.schema = result;
         return result;
       });
   }
+
+  getVarPromise(hash) {
+    const cached = varCache.get(this.id);
+    if (cached != null && cached.hash === hash) {
+      return Promise.resolve(cached.features);
+    }
+    // the hash makes the response immutable so the browser can reuse it across sessions
+    return fetch(
+      API + '/var?id=' + this.id + '&hash=' + encodeURIComponent(hash),
+      {
+        headers: {Authorization: 'Bearer ' + getIdToken()},
+      },
+    )
+      .then((response) => {
+        return response.json();
+      })
+      .then((result) => {
+        // convert columns to records
+        const columns = result.columns;
+        const names = Object.keys(columns);
+        const features = new Array(result.total);
+        for (let i = 0; i < features.length; i++) {
+          const feature = {};
+          for (let j = 0; j < names.length; j++) {
+            feature[names[j]] = columns[names[j]][i];
+          }
+          features[i] = feature;
+        }
+        varCache.set(this.id, {hash: hash, features: features});
+        return features;
+      });
+  }
 }
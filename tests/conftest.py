@@ -6,6 +6,11 @@ import scipy.sparse
 
 from cirrocumulus.anndata_dataset import AnndataDataset
 from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.envir import CIRRO_SCHEMA_CACHE_DIR
+
+
+# do not persist schemas outside of test directories
+os.environ.setdefault(CIRRO_SCHEMA_CACHE_DIR, "")
 
 
 @pytest.fixture(scope="module", autouse=True, params=[True, False])
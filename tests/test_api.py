@@ -1,5 +1,9 @@
 import os
+import gzip
+import json
+import struct
 
+import numpy as np
 import pytest
 import anndata
 
@@ -7,6 +11,7 @@ from cirrocumulus.envir import CIRRO_DB_URI, CIRRO_TEST
 from cirrocumulus.launch import configure_app, create_app
 from cirrocumulus.prepare_data import PrepareData
 from cirrocumulus.serve import cached_app
+from cirrocumulus.util import TYPED_ARRAYS_MIMETYPE
 
 
 @pytest.fixture(scope="session", params=[True, False])
@@ -46,8 +51,107 @@ def test_server(app_conf):
 def test_schema(app_conf):
     client, dataset_id = app_conf
     r = client.get("/api/schema?id={}".format(dataset_id)).json
-    assert isinstance(r["var"], list)
+    assert "var" not in r and r["varCount"] == 1838
     assert isinstance(r["obs"], list)
     assert isinstance(r["embeddings"], list)
     assert len(r["obsCat"]) == 1 and r["obsCat"][0] == "louvain"
     assert r["shape"][0] == 2638 and r["shape"][1] == 1838
+
+
+def test_var(app_conf):
+    client, dataset_id = app_conf
+    r = client.get("/api/var?id={}".format(dataset_id)).json
+    assert r["total"] == 1838 and len(r["columns"]["id"]) == 1838
+    page = client.get("/api/var?id={}&offset=10&limit=5".format(dataset_id)).json
+    assert page["columns"]["id"] == r["columns"]["id"][10:15]
+    search = client.get("/api/var?id={}&q=s".format(dataset_id)).json
+    assert search["columns"]["id"][0] == "SUMO3"  # prefix matches first
+    assert {"TNFRSF4", "DSCR3"}.issubset(search["columns"]["id"])
+    assert all("s" in feature.lower() for feature in search["columns"]["id"])
+    for query in ["offset=-1", "offset=a", "limit=-5", "limit=1.5"]:
+        assert client.get("/api/var?id={}&{}".format(dataset_id, query)).status_code == 400
+    var_hash = client.get("/api/schema?id={}".format(dataset_id)).json["varHash"]
+    r = client.get("/api/var?id={}&hash={}".format(dataset_id, var_hash))
+    assert "immutable" in r.headers["Cache-Control"]
+    r = client.get("/api/var?id={}&hash=stale".format(dataset_id))
+    assert r.headers["Cache-Control"] == "no-cache"
+
+
+def test_schema_etag(app_conf):
+    client, dataset_id = app_conf
+    r = client.get("/api/schema?id={}".format(dataset_id))
+    assert r.status_code == 200 and r.headers.get("ETag") is not None
+    r2 = client.get(
+        "/api/schema?id={}".format(dataset_id), headers={"If-None-Match": r.headers["ETag"]}
+    )
+    assert r2.status_code == 304 and len(r2.data) == 0
+
+
+def test_schema_gzip(app_conf):
+    client, dataset_id = app_conf
+    expected = client.get("/api/schema?id={}".format(dataset_id)).json
+    r = client.get("/api/schema?id={}".format(dataset_id), headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(r.data)) == expected
+
+
+def read_typed_arrays(content):
+    header_length = struct.unpack("<I", content[:4])[0]
+    header = json.loads(content[4 : 4 + header_length])
+    start = 4 + header_length + (-(4 + header_length) % 8)
+
+    def convert(value):
+        if isinstance(value, dict):
+            if "__typed_array" in value:
+                array = header["arrays"][value["__typed_array"]]
+                return np.frombuffer(
+                    content,
+                    dtype=array["dtype"],
+                    count=array["length"],
+                    offset=start + array["offset"],
+                )
+            return {key: convert(v) for key, v in value.items()}
+        if isinstance(value, list):
+            return [convert(v) for v in value]
+        return value
+
+    return convert(header["data"])
+
+
+def test_data_typed_arrays(app_conf):
+    client, dataset_id = app_conf
+    data = dict(
+        id=dataset_id,
+        values=dict(dimensions=["louvain"], measures=["DSCR3", "obs/n_genes"]),
+        embedding=[dict(name="X_umap")],
+    )
+    expected = client.post("/api/data", json=data).json
+    r = client.post("/api/data", json=data, headers={"Accept": TYPED_ARRAYS_MIMETYPE})
+    assert r.mimetype == TYPED_ARRAYS_MIMETYPE
+    result = read_typed_arrays(r.data)
+    assert result["values"]["louvain"]["categories"] == expected["values"]["louvain"]["categories"]
+    np.testing.assert_array_equal(
+        result["values"]["louvain"]["values"], expected["values"]["louvain"]["values"]
+    )
+    np.testing.assert_allclose(
+        result["values"]["n_genes"], expected["values"]["n_genes"], atol=0.01
+    )
+    dscr3 = result["values"]["DSCR3"]
+    expected_dscr3 = expected["values"]["DSCR3"]
+    if isinstance(expected_dscr3, dict):
+        np.testing.assert_array_equal(dscr3["indices"], expected_dscr3["indices"])
+        dscr3, expected_dscr3 = dscr3["values"], expected_dscr3["values"]
+    np.testing.assert_allclose(dscr3, expected_dscr3, atol=0.01)
+    for key, values in expected["embeddings"][0]["coordinates"].items():
+        np.testing.assert_allclose(result["embeddings"][0]["coordinates"][key], values, atol=0.01)
+
+
+def test_data_batch(app_conf):
+    client, dataset_id = app_conf
+    requests = [
+        dict(values=dict(measures=["DSCR3"])),
+        dict(values=dict(dimensions=["louvain"]), embedding=[dict(name="X_umap")]),
+    ]
+    expected = [client.post("/api/data", json=dict(id=dataset_id, **r)).json for r in requests]
+    r = client.post("/api/data/batch", json=dict(id=dataset_id, requests=requests))
+    assert r.json == expected
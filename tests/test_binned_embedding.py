@@ -0,0 +1,59 @@
+import numpy as np
+
+from cirrocumulus.data_processing import handle_data
+from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.prepare_data import PrepareData
+from cirrocumulus.zarr_dataset import ZarrDataset
+
+
+def test_binned_embedding(
+    test_data, dataset_api, input_dataset, measures, dimensions, basis, tmp_path
+):
+    binned_features = measures[:2]
+    embedding_list = [
+        dict(name=basis, nbins=64, measures=binned_features, obs=dimensions, agg="max"),
+        dict(name=basis, nbins=256),
+    ]
+    expected = handle_data(
+        dataset_api=dataset_api, dataset=input_dataset, embedding_list=embedding_list
+    )
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(
+        datasets=[test_data],
+        output=output_dir,
+        output_format="zarr",
+        no_auto_groups=True,
+        binned_features=binned_features,
+    ).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    assert dataset_api.read_precomputed_basis(
+        dataset, obs_keys=dimensions, var_keys=binned_features, basis=embedding_list[0]
+    )
+    results = handle_data(dataset_api=dataset_api, dataset=dataset, embedding_list=embedding_list)
+    assert len(results["embeddings"]) == 2
+    for result, expected_result in zip(results["embeddings"], expected["embeddings"]):
+        assert result["nbins"] == expected_result["nbins"]
+        for key, value in expected_result["coordinates"].items():
+            np.testing.assert_array_equal(result["coordinates"][key], value)
+        assert result["values"].keys() == expected_result["values"].keys()
+        for key, value in expected_result["values"].items():
+            if key in dimensions:
+                assert list(result["values"][key]["value"]) == list(value["value"])
+            else:
+                np.testing.assert_allclose(result["values"][key], value, rtol=1e-5)
+
+
+def test_binned_embedding_opt_in(test_data, basis, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    assert not dataset_api.read_precomputed_basis(
+        dataset, obs_keys=[], var_keys=[], basis=dict(name=basis, nbins=64)
+    )
+    assert all(
+        "nbins" not in embedding for embedding in dataset_api.get_schema(dataset)["embeddings"]
+    )
@@ -0,0 +1,270 @@
+import gc
+import os
+import time
+
+import numpy as np
+import fsspec
+import pandas as pd
+import anndata
+import scipy.sparse
+
+from cirrocumulus.abstract_backed_dataset import group_pool
+from cirrocumulus.anndata_dataset import AnndataDataset
+from cirrocumulus.data_processing import handle_selection_ids
+from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.feature_cache import feature_cache, get_cache_key
+from cirrocumulus.h5ad_dataset import H5ADDataset
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.mask_cache import cache_mask, get_cached_mask, get_filter_key, mask_cache
+from cirrocumulus.obs_cache import get_obs_columns, obs_cache
+from cirrocumulus.prepare_data import PrepareData
+from cirrocumulus.zarr_dataset import ZarrDataset
+
+
+def test_lru_cache_eviction():
+    evicted = []
+    cache = LRUCache(max_size=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # b is now least recently used
+    cache.put("c", 3)
+    assert evicted == ["b"]
+    assert "b" not in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["evictions"] == 1
+
+
+def test_lru_cache_size_fn():
+    cache = LRUCache(max_size=10, size_fn=len)
+    assert cache.put("a", "x" * 6)
+    assert cache.put("b", "x" * 4)
+    assert not cache.put("c", "x" * 11)  # larger than cache
+    cache.put("d", "x")
+    assert "a" not in cache and "b" in cache and "d" in cache
+    assert cache.size == 5
+
+
+def test_group_pool(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    fs = fsspec.filesystem("file")
+    reader = ZarrDataset()
+    misses = group_pool.misses
+    group = reader.get_group(fs, output_dir)
+    assert group_pool.misses == misses + 1
+    reader.read_dataset(fs, output_dir, keys=dict(obs=["louvain"]))
+    reader.get_schema(fs, output_dir)
+    assert reader.get_group(fs, output_dir) is group
+    assert group_pool.misses == misses + 1
+
+
+def test_group_pool_invalidate(test_data, tmp_path):
+    path = str(tmp_path / "test.h5ad")
+    test_data.write(path)
+    fs = fsspec.filesystem("file")
+    reader = H5ADDataset()
+    group = reader.get_group(fs, path)
+    obs = group["obs"]
+    reader.invalidate(path)  # the group is still in use
+    gc.collect()
+    assert "louvain" in obs
+    group2 = reader.get_group(fs, path)
+    assert group2 is not group and group2.id.valid
+    assert reader.get_group(fs, path) is group2
+
+    # a new dataset version replaces the pooled group
+    dataset_api = DatasetAPI()
+    dataset_api.add(reader)
+    dataset_api.validate_interval = 0
+    dataset = dict(id="test", url=path)
+    assert len(dataset_api.get_dataset_info(dataset)["var"]) == test_data.shape[1]
+    group3 = group_pool.get(path)
+    time.sleep(0.01)
+    test_data[:, test_data.var.index[:10]].copy().write(str(tmp_path / "test2.h5ad"))
+    os.replace(str(tmp_path / "test2.h5ad"), path)
+    assert len(dataset_api.get_dataset_info(dataset)["var"]) == 10
+    assert group_pool.get(path) is not group3
+    assert "louvain" in group3["obs"]
+
+
+def test_dataset_info_cache(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset_api.validate_interval = 0
+    dataset = dict(id="test", url=output_dir)
+    dataset_info = dataset_api.get_dataset_info(dataset)
+    schema = dataset_api.get_schema(dataset)
+    assert dataset_api.get_dataset_info(dataset) is dataset_info
+    assert dataset_api.get_schema(dataset) == schema
+    assert dataset_api.schema_cache.stats()["hits"] == 1
+
+    # rewrite dataset with fewer features
+    time.sleep(0.01)
+    PrepareData(
+        datasets=[test_data[:, test_data.var.index[:10]].copy()],
+        output=output_dir,
+        no_auto_groups=True,
+    ).execute()
+    dataset_info2 = dataset_api.get_dataset_info(dataset)
+    assert dataset_info2 is not dataset_info
+    assert len(dataset_info2["var"]) == 10
+    assert len(dataset_api.get_dataset_info(dataset)["var"]) == 10
+
+
+def test_schema_disk_cache(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset = dict(id="test", url=output_dir)
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset_api.schema_cache_dir = str(tmp_path / "schema")
+    schema = dataset_api.get_schema(dataset)
+
+    def get_schema(filesystem, path):
+        raise AssertionError("schema should be read from disk")
+
+    provider = ZarrDataset()
+    provider.get_schema = get_schema
+    dataset_api2 = DatasetAPI()
+    dataset_api2.add(provider)
+    dataset_api2.schema_cache_dir = dataset_api.schema_cache_dir
+    schema2 = dataset_api2.get_schema(dataset)
+    assert schema2["shape"] == list(schema["shape"])
+    assert schema2["varHash"] == schema["varHash"]
+
+
+def test_feature_cache(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    keys = ["DSCR3", "TNFRSF4", "DSCR3"]
+    X = dataset_api.read_dataset(dataset, keys=dict(X=keys)).X
+    misses = feature_cache.misses
+    hits = feature_cache.hits
+    X2 = dataset_api.read_dataset(dataset, keys=dict(X=["SUMO3", "TNFRSF4"])).X
+    assert feature_cache.hits == hits + 1 and feature_cache.misses == misses + 1
+    X_expected = test_data.X
+    if scipy.sparse.issparse(X_expected):
+        X_expected = X_expected.toarray()
+    var_index = test_data.var.index
+    for x, x_keys in [(X, keys), (X2, ["SUMO3", "TNFRSF4"])]:
+        x = x.toarray() if scipy.sparse.issparse(x) else x
+        np.testing.assert_array_equal(x, X_expected[:, var_index.get_indexer_for(x_keys)])
+
+
+def test_obs_cache(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    keys = dict(obs=["louvain", "index", "n_genes"])
+    obs = dataset_api.read_dataset(dataset, keys=keys).obs
+    hits = obs_cache.hits
+    obs2 = dataset_api.read_dataset(dataset, keys=keys).obs
+    assert obs_cache.hits == hits + 3
+    version = dataset_api.get_dataset_info(dataset)["version"]
+    assert obs_cache.get((output_dir, version, "index")).dtype.kind == "S"
+    assert isinstance(obs_cache.get((output_dir, version, "louvain")), pd.Categorical)
+    pd.testing.assert_frame_equal(obs.to_df(), obs2.to_df())
+    assert list(obs2["index"]) == list(test_data.obs.index)
+    np.testing.assert_array_equal(obs2["louvain"].values, test_data.obs["louvain"].values)
+
+
+def test_obs_cache_object_columns():
+    columns = dict(
+        missing=np.array(["a", None, np.nan, "b"], dtype=object),
+        bool=np.array([True, False, True, False], dtype=object),
+        number=np.array([1, 2.5, "c", 3], dtype=object),
+        float=np.arange(4.0),
+    )
+    read_fn = lambda keys: {key: columns[key].copy() for key in keys}
+    dataset_info = dict(version=str(time.time_ns()))
+    values = get_obs_columns("test", dataset_info, list(columns), read_fn)
+    values["float"][0] = -1  # values returned on a miss can be modified
+    for key in columns:
+        cached = get_obs_columns("test", dataset_info, [key], read_fn)[key]
+        assert cached.dtype == columns[key].dtype
+        pd.testing.assert_series_equal(pd.Series(cached), pd.Series(columns[key]))
+        assert [type(v) for v in cached] == [type(v) for v in columns[key]]
+    assert not cached.flags.writeable
+
+
+def test_cache_unknown_version():
+    dataset_info = dict(version=None)
+    assert get_cache_key("test", dataset_info, "X") is None
+    read_fn = lambda keys: {key: np.arange(4.0) for key in keys}
+    size = len(obs_cache)
+    get_obs_columns("test", dataset_info, ["a"], read_fn)
+    assert len(obs_cache) == size
+    data_filter = dict(filters=[dict(field="a", operation="in", value=["1"])])
+    cache_mask("test", dataset_info, data_filter, np.ones(4, dtype=bool))
+    assert get_cached_mask("test", dataset_info, data_filter) is None
+
+
+def test_mask_cache(test_data, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+
+    def get_filter(values):
+        return {
+            "filters": [
+                {"field": "louvain", "operation": "in", "value": values},
+                {"field": "X/DSCR3", "operation": [">"], "value": [0]},
+            ]
+        }
+
+    ids = handle_selection_ids(dataset_api, dataset, get_filter(["1", "5"]))["ids"]
+    hits = mask_cache.hits
+    # equivalent filter, served from the cache
+    data_filter = get_filter(["5", "1"])
+    data_filter["filters"].reverse()
+    assert get_filter_key(data_filter) == get_filter_key(get_filter(["1", "5"]))
+    assert list(handle_selection_ids(dataset_api, dataset, data_filter)["ids"]) == list(ids)
+    assert mask_cache.hits == hits + 1
+
+
+def test_mask_cache_key_type(test_data, tmp_path):
+    # obs field with the same name as a feature
+    test_data = test_data.copy()
+    test_data.obs["DSCR3"] = np.arange(test_data.shape[0]) % 2
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(datasets=[test_data], output=output_dir, no_auto_groups=True).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    for key_type in ["obs", "X"]:
+        data_filter = dict(filters=[dict(field=key_type + "/DSCR3", operation=[">"], value=[0])])
+        if key_type == "obs":
+            values = test_data.obs["DSCR3"].values
+        else:
+            values = test_data[:, "DSCR3"].X
+            values = values.toarray() if scipy.sparse.issparse(values) else values
+        expected = test_data.obs.index[values.flatten() > 0]
+        ids = handle_selection_ids(dataset_api, dataset, data_filter)["ids"]
+        assert list(ids) == list(expected)
+
+
+def test_feature_cache_duplicate_var_names(tmp_path):
+    X = np.arange(24, dtype=np.float32).reshape(4, 6)
+    var = pd.DataFrame(index=["A", "A", "C", "B", "A", "D"])
+    for sparse in [True, False]:
+        path = str(tmp_path / "test{}.h5ad".format(sparse))
+        data = anndata.AnnData(X=scipy.sparse.csc_matrix(X) if sparse else X, var=var)
+        data.write(path)
+        for provider in [H5ADDataset(), AnndataDataset()]:
+            dataset_api = DatasetAPI()
+            dataset_api.add(provider)
+            dataset = dict(id="test", url=path)
+            for keys in [["A", "B"], ["B", "C", "A"]]:  # the second read uses the cache for A, B
+                adata = dataset_api.read_dataset(dataset, keys=dict(X=keys))
+                result = adata.X.toarray() if scipy.sparse.issparse(adata.X) else adata.X
+                np.testing.assert_array_equal(result, X[:, [dict(A=0, B=3, C=2)[k] for k in keys]])
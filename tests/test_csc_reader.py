@@ -0,0 +1,67 @@
+import h5py
+import zarr
+import numpy as np
+import fsspec
+import anndata
+import scipy.sparse
+
+from cirrocumulus.anndata_dataset import AnndataDataset
+from cirrocumulus.csc_reader import plan_ranges, read_csc_columns, read_ranges
+from cirrocumulus.sparse_util import csc_gather
+from cirrocumulus.zarr_dataset import ZarrDataset
+
+
+def test_plan_ranges():
+    starts = np.array([10, 0, 4, 30, 4])
+    ends = np.array([12, 4, 6, 40, 4])
+    assert plan_ranges(starts, ends) == [[0, 6], [10, 12], [30, 40]]
+    assert plan_ranges(starts, ends, max_gap=4) == [[0, 12], [30, 40]]
+
+
+def write_csc(group, X, chunks):
+    group.attrs["encoding-type"] = "csc_matrix"
+    group.attrs["shape"] = X.shape
+    for key in ["data", "indices", "indptr"]:
+        group.create_dataset(key, data=getattr(X, key), chunks=chunks)
+
+
+def test_read_csc_columns(tmp_path):
+    X = scipy.sparse.random(100, 50, density=0.1, format="csc", dtype=np.float32, random_state=0)
+    X[:, 7] = 0  # empty column
+    X.eliminate_zeros()
+    columns = np.array([30, 7, 2, 3, 30, 49])
+    expected = X[:, columns].toarray()
+    z = zarr.open_group(fsspec.filesystem("file").get_mapper(str(tmp_path / "test.zarr")), mode="w")
+    write_csc(z.create_group("X"), X, (16,))
+    with h5py.File(str(tmp_path / "test.h5"), "w") as f:
+        write_csc(f.create_group("X"), X, (16,))
+        for node, read_ranges_fn in [
+            (z["X"], ZarrDataset().read_ranges),
+            (f["X"], read_ranges),
+        ]:
+            result = read_csc_columns(node, columns, read_ranges=read_ranges_fn)
+            assert scipy.sparse.isspmatrix_csc(result)
+            np.testing.assert_array_equal(result.toarray(), expected)
+            np.testing.assert_array_equal(
+                read_csc_columns(node, slice(5, 10)).toarray(), X[:, 5:10].toarray()
+            )
+        assert read_csc_columns(f["X"], [7]).nnz == 0
+
+
+def test_csc_gather():
+    X = scipy.sparse.random(100, 50, density=0.1, format="csc", dtype=np.float32, random_state=1)
+    columns = [49, 0, 7, 7, 20]
+    result = csc_gather(X, columns)
+    assert scipy.sparse.isspmatrix_csc(result)
+    np.testing.assert_array_equal(result.toarray(), X[:, columns].toarray())
+
+
+def test_add_data_not_modified():
+    X = scipy.sparse.random(10, 5, density=0.5, format="csr", dtype=np.float32, random_state=2)
+    adata = anndata.AnnData(X=X, layers=dict(counts=X.copy()))
+    dataset = AnndataDataset()
+    dataset.add_data("test", adata)
+    result = dataset.read_dataset(None, "test", keys=dict(X=["1", "3"], counts=["0"]))
+    np.testing.assert_array_equal(result.X.toarray(), X[:, [1, 3]].toarray())
+    assert scipy.sparse.isspmatrix_csr(adata.X)
+    assert scipy.sparse.isspmatrix_csr(adata.layers["counts"])
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from cirrocumulus.data_processing import handle_data, handle_data_batch
+
+
+def assert_results_equal(result, expected):
+    if isinstance(expected, dict):
+        assert set(result.keys()) == set(expected.keys())
+        for key in expected:
+            assert_results_equal(result[key], expected[key])
+    elif isinstance(expected, (list, tuple)):
+        assert len(result) == len(expected)
+        for r, e in zip(result, expected):
+            assert_results_equal(r, e)
+    elif isinstance(expected, (np.ndarray, pd.Series, pd.Index)):
+        np.testing.assert_array_equal(np.asarray(result), np.asarray(expected))
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(result, expected, check_like=True)
+    else:
+        assert result == expected
+
+
+def test_data_batch(dataset_api, input_dataset, measures, dimensions, continuous_obs, basis):
+    data_requests = [
+        dict(embedding_list=[dict(name=basis)], values=dict(measures=measures[:1])),
+        dict(values=dict(dimensions=dimensions, measures=["obs/" + continuous_obs[0]])),
+        dict(stats=dict(measures=measures, dimensions=dimensions)),
+        dict(
+            selection=dict(
+                filter=dict(filters=[dict(field=dimensions[0], operation="in", value=["1", "2"])]),
+                measures=measures[1:],
+                dimensions=dimensions,
+            )
+        ),
+    ]
+    expected = [
+        handle_data(dataset_api=dataset_api, dataset=input_dataset, **kwargs)
+        for kwargs in data_requests
+    ]
+    read_dataset = dataset_api.read_dataset
+    reads = []
+
+    def counting_read_dataset(**kwargs):
+        reads.append(kwargs["keys"])
+        return read_dataset(**kwargs)
+
+    dataset_api.read_dataset = counting_read_dataset
+    try:
+        results = list(handle_data_batch(dataset_api, input_dataset, data_requests))
+    finally:
+        dataset_api.read_dataset = read_dataset
+    assert len(reads) == 1
+    assert_results_equal(results, expected)
@@ -0,0 +1,23 @@
+import h5py
+import numpy as np
+
+from cirrocumulus.h5ad_dataset import H5ADDataset
+
+
+def test_slice_dense_array(tmp_path):
+    X = np.random.default_rng(0).random((100, 50), dtype=np.float32)
+    indices = np.array([45, 3, 7, 44, 3, 20])
+    with h5py.File(str(tmp_path / "test.h5"), "w") as f:
+        f.create_dataset("chunked", data=X, chunks=(16, 8))
+        f.create_dataset("contiguous", data=X)
+        reader = H5ADDataset()
+        np.testing.assert_array_equal(
+            reader.slice_dense_array(f["chunked"], indices), X[:, indices]
+        )
+        np.testing.assert_array_equal(
+            reader.slice_dense_array(f["contiguous"], indices[indices != 3]),
+            X[:, indices[indices != 3]],
+        )
+        np.testing.assert_array_equal(
+            reader.slice_dense_array(f["chunked"], slice(10, 20)), X[:, 10:20]
+        )
@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+import pytest
 import scipy.sparse
 from pandas import CategoricalDtype
 
@@ -8,7 +9,10 @@ from cirrocumulus.embedding_aggregator import EmbeddingAggregator
 
 
 def create_df(test_data, measures, dimensions, basis):
-    df = pd.DataFrame(test_data[:, measures].X.toarray(), columns=measures)
+    X = test_data[:, measures].X
+    if scipy.sparse.issparse(X):
+        X = X.toarray()
+    df = pd.DataFrame(X, columns=measures)
     df = df.join(test_data.obs[dimensions].reset_index())
     return df.join(
         pd.DataFrame(test_data.obsm["X_umap"][:, 0:2], columns=basis["coordinate_columns"])
@@ -94,18 +98,45 @@ def test_no_binning(
         )
 
 
-#
-# @pytest.fixture(autouse=True, params=['sum', 'mean', 'max'])
-# def agg_function(request):
-#     return request.param
-#
-#
-# def test_binning(dataset_api, input_dataset, test_data, measures, dimensions, continuous_obs, basis,
-#                  agg_function):
-#     nbins = 100
-#     basis_dict = get_basis(basis, nbins, agg_function)
-#     grouped_df = group_df(test_data, measures, dimensions, continuous_obs, basis_dict)
-#     embedding_list = [dict(nbins=nbins, ndim=2, basis=basis, dimensions=dimensions, agg=agg_function)]
-#     embedding_list[0]['measures'] = measures + list(map(lambda x: 'obs/' + x, continuous_obs))
-#     results = handle_data(dataset_api=dataset_api, dataset=input_dataset, embedding_list=embedding_list)
-#     diff_binning(grouped_df, measures, dimensions, continuous_obs, basis_dict, results['embeddings'][0])
+@pytest.mark.parametrize("agg_function", ["max", "sum", "mean", "min", "median"])
+def test_binning(test_data, measures, dimensions, continuous_obs, basis, agg_function):
+    basis_dict = dict(
+        name=basis,
+        full_name="__bin",
+        coordinate_columns=[basis + "_1", basis + "_2"],
+        agg=agg_function,
+    )
+    grouped_df = group_df(test_data, measures, dimensions, continuous_obs, basis_dict)
+    df = create_df(test_data, measures, dimensions + continuous_obs, basis_dict)
+    results = EmbeddingAggregator(
+        measures=measures + continuous_obs,
+        dimensions=dimensions,
+        nbins=100,
+        basis=basis_dict,
+        agg_function=agg_function,
+    ).execute(df)
+    diff_binning(grouped_df, measures, dimensions, continuous_obs, basis_dict, results)
+
+
+@pytest.mark.parametrize("agg_function", ["max", "sum", "mean", "min", "median"])
+def test_binning_sparse(test_data, measures, dimensions, basis, agg_function):
+    basis_dict = dict(
+        name=basis,
+        full_name="__bin",
+        coordinate_columns=[basis + "_1", basis + "_2"],
+        agg=agg_function,
+    )
+    grouped_df = group_df(test_data, measures, dimensions, [], basis_dict)
+    df = create_df(test_data, measures, dimensions, basis_dict)
+    for key in measures:
+        df[key] = pd.arrays.SparseArray(df[key].values, fill_value=0)
+    results = EmbeddingAggregator(
+        measures=measures,
+        dimensions=dimensions,
+        nbins=100,
+        basis=basis_dict,
+        agg_function=agg_function,
+    ).execute(df)
+    for key in measures:
+        assert isinstance(results["values"][key], dict)
+    diff_binning(grouped_df, measures, dimensions, [], basis_dict, results)
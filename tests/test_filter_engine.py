@@ -0,0 +1,64 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+from cirrocumulus.data_processing import get_mask
+from cirrocumulus.filter_engine import compile_filter
+from cirrocumulus.lite_adata import LiteAnnData
+
+
+@pytest.mark.parametrize("combine", ["and", "or"])
+def test_filter_engine(dataset_api, input_dataset, test_data, continuous_obs, combine):
+    field = continuous_obs[0]
+    values = test_data.obs_vector(field)
+    threshold = np.median(values)
+    gene_values = test_data.obs_vector("DSCR3")
+    data_filter = {
+        "filters": [
+            {"field": "louvain", "operation": "in", "value": ["1", "5", "not-a-category"]},
+            {"field": field, "operation": [">=", ">", "!="], "value": [0, threshold, 1]},
+            {"field": "X/DSCR3", "operation": ["<"], "value": [1], "invert": True},
+            {"field": dict(name="X_umap"), "operation": "in", "value": dict(points=[0, 5, 10])},
+        ],
+        "combine": combine,
+    }
+    expected = [
+        test_data.obs["louvain"].isin(["1", "5"]).values,
+        (values > threshold) & (values != 1),
+        ~(gene_values < 1),
+        np.isin(np.arange(test_data.shape[0]), [0, 5, 10]),
+    ]
+    expected = (
+        np.logical_and.reduce(expected) if combine == "and" else np.logical_or.reduce(expected)
+    )
+    masks, _ = get_mask(
+        dataset_api, input_dataset, dataset_api.get_dataset_info(input_dataset), [data_filter]
+    )
+    np.testing.assert_array_equal(masks[0], expected)
+
+
+def test_selection_encodings(dataset_api, input_dataset, test_data):
+    n_obs = test_data.shape[0]
+    expected = np.zeros(n_obs, dtype=bool)
+    expected[[0, 1, 2, 10, 11, n_obs - 1]] = True
+    encodings = [
+        list(np.flatnonzero(expected)),
+        dict(ranges=[0, 3, 10, 12, 11, 12, n_obs - 1, n_obs + 5]),
+        dict(bitmap=base64.b64encode(np.packbits(expected).tobytes()).decode("ascii")),
+    ]
+    for value in encodings:
+        data_filter = {"filters": [{"field": "__index", "operation": "in", "value": value}]}
+        masks, _ = get_mask(dataset_api, input_dataset, None, [data_filter])
+        np.testing.assert_array_equal(masks[0], expected)
+
+
+def test_filter_duplicate_var_names():
+    X = np.array([[0, 1, 0], [2, 0, 0], [0, 0, 3], [4, 0, 5]], dtype=np.float32)
+    var = pd.DataFrame(index=["A", "B", "A"])
+    data_filter = dict(filters=[dict(field="A", operation=[">"], value=[0])])
+    for x in [X, scipy.sparse.csc_matrix(X)]:
+        mask = compile_filter(data_filter).evaluate(LiteAnnData(X=x, var=var))
+        np.testing.assert_array_equal(mask, X[:, 0] > 0)
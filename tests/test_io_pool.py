@@ -0,0 +1,29 @@
+import threading
+
+import fsspec
+
+from cirrocumulus import io_pool
+
+
+def test_single_flight(tmp_path):
+    fs = fsspec.filesystem("file")
+    path = str(tmp_path / "test.txt")
+    with open(path, "wb") as f:
+        f.write(b"test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def read(path):
+        calls.append(path)
+        started.set()
+        release.wait(10)
+        return io_pool.read_bytes(fs, path)
+
+    future = io_pool.submit(fs, ("test", path), read, path)
+    started.wait(10)
+    assert io_pool.submit(fs, ("test", path), read, path) is future
+    release.set()
+    assert future.result() == b"test"
+    assert io_pool.submit(fs, ("test", path), read, path).result() == b"test"
+    assert len(calls) == 2
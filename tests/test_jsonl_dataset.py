@@ -0,0 +1,87 @@
+import threading
+
+import numpy as np
+import fsspec
+import scipy.sparse
+
+from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.jsonl_dataset import JsonlDataset, reader_pool
+from cirrocumulus.jsonl_io import JsonlReader, write_jsonl
+from cirrocumulus.prepare_data import PrepareData
+
+
+def test_jsonl_dataset(test_data, measures, basis, tmp_path):
+    output = str(tmp_path / "test.jsonl")
+    PrepareData(
+        datasets=[test_data], output=output, output_format="jsonl", no_auto_groups=True
+    ).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(JsonlDataset())
+    dataset = dict(id="test", url=output)
+    assert dataset_api.get_schema(dataset)["shape"] == list(test_data.shape)
+    adata = dataset_api.read_dataset(
+        dataset, keys=dict(X=measures, obs=["louvain", "index", "n_genes"], basis=[basis])
+    )
+    X = adata.X.toarray() if scipy.sparse.issparse(adata.X) else adata.X
+    X_expected = test_data[:, measures].X
+    X_expected = X_expected.toarray() if scipy.sparse.issparse(X_expected) else X_expected
+    np.testing.assert_allclose(X, X_expected, atol=0.01)
+    assert list(adata.obs["index"]) == list(test_data.obs.index)
+    np.testing.assert_array_equal(adata.obs["louvain"].values, test_data.obs["louvain"].values)
+    np.testing.assert_array_equal(adata.obs["n_genes"].values, test_data.obs["n_genes"].values)
+    np.testing.assert_allclose(adata.obsm[basis], test_data.obsm[basis], atol=0.01)
+    reader_pool.clear()
+
+
+def test_jsonl_reader_evicted_while_reading(tmp_path):
+    path = str(tmp_path / "test.jsonl")
+    index = {}
+    with open(path, "wb") as f:
+        write_jsonl(list(range(100)), f, "a", index)
+    with open(path + ".idx.json", "wt") as f:
+        f.write('{"index": {"a": %s}}' % index["a"])
+    fs = fsspec.filesystem("file")
+    dataset = JsonlDataset()
+    errors = []
+
+    def read():
+        try:
+            for _ in range(200):
+                assert dataset.get_reader(fs, path).read_key("a") == list(range(100))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        dataset.invalidate(path)
+    for t in threads:
+        t.join()
+    assert errors == []
+    reader = dataset.get_reader(fs, path)
+    dataset.invalidate(path)
+    assert reader._buffer is not None  # not closed while in use
+    assert reader.read_key("a") == list(range(100))
+
+
+def test_jsonl_gzip(tmp_path):
+    path = str(tmp_path / "test.jsonl")
+    index = {}
+    with open(path, "wb") as f:
+        write_jsonl([1, 2], f, "a", index, compress=True)
+        write_jsonl([3], f, "b", index)
+    with open(path + ".idx.json", "wt") as f:
+        f.write('{"index": {"a": %s, "b": %s}}' % (index["a"], index["b"]))
+    reader = JsonlReader(path, fsspec.filesystem("file"))
+    assert reader.read_key("a") == [1, 2]
+    assert reader.read_key("b") == [3]
+    reader.close()
+
+    fs = fsspec.filesystem("memory")  # read with range requests
+    for suffix in ["", ".idx.json"]:
+        with open(path + suffix, "rb") as f:
+            fs.pipe("/test.jsonl" + suffix, f.read())
+    reader = JsonlReader("/test.jsonl", fs)
+    assert reader.read_key("a") == [1, 2]
+    assert reader.read_key("b") == [3]
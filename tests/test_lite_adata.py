@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from cirrocumulus.dotplot_aggregator import DotPlotAggregator
+from cirrocumulus.lite_adata import LiteAnnData
+
+
+def test_lite_adata_subset():
+    X = scipy.sparse.csc_matrix(np.array([[0, 1], [2, 0], [3, 4]], dtype=np.float32))
+    obs = dict(
+        louvain=pd.Categorical(["a", "b", "a"]), n_genes=np.array([10, 20, 30], dtype=np.int32)
+    )
+    adata = LiteAnnData(X=X, obs=obs, var=pd.DataFrame(index=["g1", "g2"]))
+    assert adata.shape == (3, 2)
+    subset = adata[np.array([True, False, True])]
+    assert subset.shape == (2, 2)
+    assert list(subset.obs.index) == ["0", "2"]
+    np.testing.assert_array_equal(subset.get_X_column("g2"), [1, 4])
+    assert list(subset.obs["louvain"]) == ["a", "a"]
+
+    results = DotPlotAggregator(var_measures=["g1"], dimensions=["louvain"]).execute(adata)
+    assert list(results[0]["categories"]) == ["a", "b"]
+    np.testing.assert_array_equal(results[0]["values"][0]["mean"], [1.5, 2])
+
+
+def test_duplicate_var_names():
+    X = np.arange(12, dtype=np.float32).reshape(4, 3)
+    var = pd.DataFrame(index=["A", "B", "A"])
+    for x in [X, scipy.sparse.csc_matrix(X)]:
+        adata = LiteAnnData(X=x, var=var)
+        np.testing.assert_array_equal(adata.get_X_column("A"), X[:, 0])
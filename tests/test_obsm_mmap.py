@@ -0,0 +1,62 @@
+import h5py
+import numpy as np
+import fsspec
+
+from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.h5ad_dataset import H5ADDataset
+from cirrocumulus.obsm_mmap import load_obsm_npy, save_obsm_npy
+from cirrocumulus.parquet_dataset import ParquetDataset
+from cirrocumulus.prepare_data import PrepareData
+from cirrocumulus.zarr_dataset import ZarrDataset
+
+
+def test_obsm_mmap(test_data, basis, tmp_path):
+    expected = test_data.obsm[basis]
+    for output_format, provider, dtype in [
+        ("zarr", ZarrDataset(), expected.dtype),
+        ("parquet", ParquetDataset(), np.float32),
+    ]:
+        output_dir = str(tmp_path / ("test." + ("zarr" if output_format == "zarr" else "cpq")))
+        PrepareData(
+            datasets=[test_data],
+            output=output_dir,
+            output_format=output_format,
+            no_auto_groups=True,
+        ).execute()
+        dataset_api = DatasetAPI()
+        dataset_api.add(provider)
+        m = dataset_api.read_dataset(
+            dict(id="test", url=output_dir), keys=dict(basis=[basis])
+        ).obsm[basis]
+        assert isinstance(m, np.memmap)
+        assert not m.flags.writeable
+        np.testing.assert_array_equal(m, expected.astype(dtype))
+
+
+def test_obsm_npy_local_only(test_data, basis, tmp_path):
+    fs = fsspec.filesystem("memory")
+    save_obsm_npy(test_data, "/test/obsm", fs)
+    assert not fs.exists("/test/obsm")
+    fs = fsspec.filesystem("file")
+    fs.makedirs(str(tmp_path / "obsm"))
+    save_obsm_npy(test_data, str(tmp_path / "obsm"), fs)
+    dataset_info = dict(version=None, shape=list(test_data.shape))
+    m = load_obsm_npy(fs, "file://" + str(tmp_path), basis, dataset_info)
+    np.testing.assert_array_equal(m, test_data.obsm[basis])
+
+
+def test_h5_memmap(tmp_path):
+    m = np.random.default_rng(0).random((100, 2), dtype=np.float32)
+    path = str(tmp_path / "test.h5")
+    with h5py.File(path, "w") as f:
+        f.create_dataset("contiguous", data=m)
+        f.create_dataset("chunked", data=m, chunks=(16, 2))
+    reader = H5ADDataset()
+    fs = fsspec.filesystem("file")
+    with h5py.File(path, "r") as f:
+        value = reader.read_obsm(fs, path, f, "contiguous", dict(version=None))
+        assert isinstance(value, np.memmap)
+        np.testing.assert_array_equal(value, m)
+        value = reader.read_obsm(fs, path, f, "chunked", dict(version=None))
+        assert not isinstance(value, np.memmap)
+        np.testing.assert_array_equal(value, m)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import anndata
+import scipy.sparse
+
+from cirrocumulus.data_processing import handle_data
+from cirrocumulus.dataset_api import DatasetAPI
+from cirrocumulus.lru_cache import LRUCache
+from cirrocumulus.parquet_dataset import ParquetDataset
+from cirrocumulus.precomputed_stats import (
+    compute_binned_embeddings,
+    missing_table_nbytes,
+    table_nbytes,
+)
+from cirrocumulus.prepare_data import PrepareData
+from cirrocumulus.zarr_dataset import ZarrDataset
+
+
+def test_precomputed_stats(
+    test_data, dataset_api, input_dataset, measures, dimensions, continuous_obs, tmp_path
+):
+    stats = dict(measures=measures + ["obs/" + c for c in continuous_obs], dimensions=dimensions)
+    grouped_stats = dict(measures=measures, dimensions=dimensions)
+    expected = handle_data(
+        dataset_api=dataset_api,
+        dataset=input_dataset,
+        stats=stats,
+        grouped_stats=grouped_stats,
+    )
+    for output_format, provider, suffix in [
+        ("zarr", ZarrDataset(), ".zarr"),
+        ("parquet", ParquetDataset(), ".cpq"),
+    ]:
+        output_dir = str(tmp_path / ("test" + suffix))
+        PrepareData(
+            datasets=[test_data],
+            output=output_dir,
+            output_format=output_format,
+            no_auto_groups=True,
+        ).execute()
+        dataset_api = DatasetAPI()
+        dataset_api.add(provider)
+        dataset = dict(id="test", url=output_dir)
+        assert (
+            dataset_api.read_precomputed_stats(dataset, obs_keys=dimensions, var_keys=measures)
+            is not None
+        )
+        assert (
+            dataset_api.read_precomputed_grouped_stats(
+                dataset, obs_keys=dimensions, var_keys=measures
+            )
+            is not None
+        )
+        results = handle_data(
+            dataset_api=dataset_api, dataset=dataset, stats=stats, grouped_stats=grouped_stats
+        )
+        for key, value in expected["summary"].items():
+            result = results["summary"][key]
+            for stat in value:
+                if stat == "categories":
+                    assert list(result[stat]) == list(value[stat])
+                else:
+                    np.testing.assert_allclose(result[stat], value[stat], rtol=1e-4)
+        distribution = results["distribution"][0]
+        expected_distribution = expected["distribution"][0]
+        assert list(distribution["categories"]) == list(expected_distribution["categories"])
+        for value, expected_value in zip(distribution["values"], expected_distribution["values"]):
+            assert value["name"] == expected_value["name"]
+            for stat in ["mean", "percentExpressed"]:
+                np.testing.assert_allclose(value[stat], expected_value[stat], rtol=1e-4)
+
+
+def test_binned_embeddings_duplicate_var_names():
+    X = np.arange(12, dtype=np.float32).reshape(4, 3)
+    adata = anndata.AnnData(
+        X=scipy.sparse.csr_matrix(X),
+        var=pd.DataFrame(index=["A", "B", "A"]),
+        obsm=dict(X_umap=np.array([[0, 0], [0, 1], [1, 0], [1, 1]], dtype=np.float32)),
+    )
+    stats = compute_binned_embeddings(adata, features=["A"], levels=[2])
+    np.testing.assert_array_equal(stats["embedding/X_umap/2/X/A"]["max"], X[:, 0])
+
+
+def test_missing_tables_evicted():
+    cache = LRUCache(max_size=10 * missing_table_nbytes, size_fn=table_nbytes)
+    for i in range(100):
+        cache.put(("path", "version", "table{}".format(i)), (None,))
+    assert len(cache) == 10
+
+
+def test_no_stats(test_data, measures, dimensions, tmp_path):
+    output_dir = str(tmp_path / "test.zarr")
+    PrepareData(
+        datasets=[test_data], output=output_dir, no_auto_groups=True, no_stats=True
+    ).execute()
+    dataset_api = DatasetAPI()
+    dataset_api.add(ZarrDataset())
+    dataset = dict(id="test", url=output_dir)
+    assert (
+        dataset_api.read_precomputed_stats(dataset, obs_keys=dimensions, var_keys=measures) is None
+    )
@@ -6,6 +6,8 @@ import pandas as pd
 import pytest
 import scipy.sparse
 
+from cirrocumulus import parquet_output
+from cirrocumulus.anndata_util import dataset_schema
 from cirrocumulus.parquet_dataset import ParquetDataset
 from cirrocumulus.prepare_data import PrepareData
 from cirrocumulus.zarr_dataset import ZarrDataset
@@ -95,3 +97,25 @@ def test_prepare_jsonl(test_data, measures, dimensions, continuous_obs, basis, t
         datasets=[test_data], output=os.path.join(output_dir, "test.jsonl"), output_format="jsonl"
     )
     prepare_data.execute()
+
+
+@pytest.mark.parametrize("packed", [True, False])
+def test_parquet_layout(test_data, measures, packed, tmp_path, monkeypatch):
+    monkeypatch.setattr(parquet_output, "features_per_file", 2)
+    output_dir = str(tmp_path / "test.cpq")
+    test_data = test_data[:, measures].copy()
+    fs = fsspec.filesystem("file")
+    whitelist = dict(x=True, x_keys=None, obs=True, obs_keys=None, obsm=False, obsm_keys=None)
+    parquet_output.save_dataset_pq(
+        test_data, dataset_schema(test_data), output_dir, fs, whitelist, packed=packed
+    )
+    assert os.path.exists(os.path.join(output_dir, "X", "part-00000.parquet")) == packed
+    reader = ParquetDataset()
+    assert "packed" not in reader.get_schema(fs, output_dir)
+    keys = list(reversed(measures))
+    X = reader.read_dataset(fs, output_dir, keys=dict(X=keys)).X
+    X_expected = test_data[:, keys].X
+    if scipy.sparse.issparse(X_expected):
+        X_expected = X_expected.toarray()
+        X = X.toarray()
+    np.testing.assert_equal(X, X_expected)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from cirrocumulus.data_processing import handle_data
+
+
+def restore(value):
+    values = value["values"].astype(np.float64)
+    if value["quantized"] != "float16":
+        values = value["min"] + values * value["scale"]
+    return values
+
+
+@pytest.mark.parametrize("mode", ["uint8", "float16"])
+def test_quantize(dataset_api, input_dataset, measures, basis, mode):
+    embedding_list = [dict(name=basis)]
+    values = dict(measures=measures)
+    expected = handle_data(
+        dataset_api=dataset_api,
+        dataset=input_dataset,
+        embedding_list=embedding_list,
+        values=values,
+    )
+    results = handle_data(
+        dataset_api=dataset_api,
+        dataset=input_dataset,
+        embedding_list=embedding_list,
+        values=values,
+        quantize=dict(coordinates=True, values=mode),
+    )
+    for key, expected_values in expected["embeddings"][0]["coordinates"].items():
+        value = results["embeddings"][0]["coordinates"][key]
+        assert value["values"].dtype == np.uint16
+        np.testing.assert_allclose(restore(value), expected_values, atol=value["scale"] / 2 + 1e-9)
+    for key in measures:
+        value = results["values"][key]
+        expected_values = expected["values"][key]
+        if isinstance(expected_values, dict):
+            np.testing.assert_array_equal(value["indices"], expected_values["indices"])
+            expected_values = expected_values["values"]
+        expected_values = np.asarray(expected_values, dtype=np.float64)
+        if mode == "uint8":
+            assert value["values"].dtype == np.uint8
+            np.testing.assert_allclose(
+                restore(value), expected_values, atol=value["scale"] / 2 + 1e-9
+            )
+        else:
+            np.testing.assert_allclose(restore(value), expected_values, rtol=1e-3, atol=1e-3)
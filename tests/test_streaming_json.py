@@ -0,0 +1,30 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from cirrocumulus.util import dumps, iter_columns_json, iter_json
+
+
+def test_iter_json():
+    data = {
+        "values": {
+            "a": np.arange(10, dtype=np.float32) / 3,
+            "b": pd.Series(pd.Categorical(["x", "y", "x"] * 3)),
+            "c": dict(indices=np.arange(5), values=np.ones(5)),
+        },
+        "embeddings": [dict(name="X_umap", coordinates={"X_umap_1": pd.Series(np.arange(7.0))})],
+        "index": pd.Index(["a", "b", "c"]),
+        "count": 3,
+        1: None,
+    }
+    expected = json.loads(dumps(data, double_precision=2, orient="values"))
+    assert json.loads("".join(iter_json(data, chunk_size=2))) == expected
+    assert json.loads("".join(iter_json(data))) == expected
+
+
+def test_iter_columns_json():
+    df = pd.DataFrame({"a": [1.123456789, 2.0], "b": ["x", "y"]}, index=["i", "j"])
+    assert json.loads("".join(iter_columns_json(df, double_precision=6))) == json.loads(
+        df.to_json(double_precision=6, orient="columns")
+    )
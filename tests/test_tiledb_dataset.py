@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import fsspec
+import pandas as pd
+import pytest
+import scipy.sparse
+
+
+tiledb = pytest.importorskip("tiledb")
+
+from cirrocumulus.tiledb_dataset import TileDBDataset, rows_to_ranges  # noqa: E402
+
+
+def create_array(path, shape, attrs, sparse=False):
+    dims = [
+        tiledb.Dim(name="dim_" + str(i), domain=(0, n - 1), tile=n, dtype=np.uint32)
+        for i, n in enumerate(shape)
+    ]
+    schema = tiledb.ArraySchema(domain=tiledb.Domain(*dims), sparse=sparse, attrs=attrs)
+    tiledb.Array.create(path, schema)
+
+
+def write_cxg(path, X, obs, embedding, sparse):
+    os.makedirs(path)
+    create_array(
+        os.path.join(path, "X"), X.shape, [tiledb.Attr(name="data", dtype=X.dtype)], sparse
+    )
+    with tiledb.open(os.path.join(path, "X"), mode="w") as array:
+        if sparse:
+            rows, cols = np.nonzero(X)
+            array[rows, cols] = X[rows, cols]
+        else:
+            array[:] = X
+    create_array(
+        os.path.join(path, "obs"),
+        (len(obs),),
+        [
+            tiledb.Attr(name="name_0", dtype=str),
+            tiledb.Attr(name="n_genes", dtype=obs["n_genes"].dtype),
+        ],
+    )
+    with tiledb.open(os.path.join(path, "obs"), mode="w") as array:
+        array[:] = dict(name_0=obs.index.values.astype(object), n_genes=obs["n_genes"].values)
+    os.makedirs(os.path.join(path, "emb"))
+    create_array(
+        os.path.join(path, "emb", "umap"),
+        embedding.shape,
+        [tiledb.Attr(name="data", dtype=embedding.dtype)],
+    )
+    with tiledb.open(os.path.join(path, "emb", "umap"), mode="w") as array:
+        array[:] = embedding
+
+
+def test_rows_to_ranges():
+    assert rows_to_ranges(np.array([], dtype=int)) == []
+    assert rows_to_ranges(np.array([3])) == [slice(3, 3)]
+    assert rows_to_ranges(np.array([0, 1, 2, 5, 7, 8])) == [
+        slice(0, 2),
+        slice(5, 5),
+        slice(7, 8),
+    ]
+
+
+@pytest.mark.parametrize("sparse", [True, False])
+def test_tiledb_dataset(tmp_path, sparse):
+    rng = np.random.default_rng(0)
+    X = rng.random((10, 4), dtype=np.float32)
+    X[X < 0.5] = 0
+    obs = pd.DataFrame(
+        dict(n_genes=np.arange(10, dtype=np.int64)), index=["c" + str(i) for i in range(10)]
+    )
+    embedding = rng.random((10, 2), dtype=np.float32)
+    path = str(tmp_path / "test.cxg")
+    write_cxg(path, X, obs, embedding, sparse)
+    dataset_info = dict(
+        shape=list(X.shape), var=pd.Index(["A", "B", "C", "D"]), obsIndex="name_0", version=None
+    )
+    keys = dict(X=["D", "A"], obs=["index", "n_genes"], basis=["umap"])
+    reader = TileDBDataset()
+    fs = fsspec.filesystem("file")
+    for rows in [None, np.array([1, 2, 3, 7]), np.array([], dtype=int)]:
+        adata = reader.read_dataset(fs, path, keys=keys, dataset_info=dataset_info, rows=rows)
+        selection = slice(None) if rows is None else rows
+        X_result = adata.X.toarray() if scipy.sparse.issparse(adata.X) else adata.X
+        np.testing.assert_array_equal(X_result, X[selection][:, [3, 0]])
+        assert list(adata.obs["index"]) == list(obs.index[selection])
+        np.testing.assert_array_equal(adata.obs["n_genes"], obs["n_genes"].values[selection])
+        np.testing.assert_array_equal(adata.obsm["umap"], embedding[selection])